@@ -0,0 +1,298 @@
+# ai/planner.py
+# Placement-evaluation AI. Every reachable lock position of the current piece
+# (from the rules engines' move generator) is scored with a weighted feature
+# set, optionally looking one piece ahead through next_piece. The search is a
+# generator, so the caller can spread it over several frames with a per-frame
+# time budget; the chosen plan is kept until the piece locks.
+import json, os, random, sys, time
+
+from rules.placements import iter_placements, DOWN, LEFT, RIGHT, ROTATE
+from rules.polyomino_rules import PolyominoRules
+
+# feature weights: aggregate height, lines cleared, holes, bumpiness
+DEFAULT_WEIGHTS = {
+    "aggregate_height": -0.510066,
+    "lines": 0.760666,
+    "holes": -0.35663,
+    "bumpiness": -0.184483,
+}
+FEATURES = tuple(DEFAULT_WEIGHTS)
+
+# written by ai/tune.py, read by the screensaver at startup
+WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai_weights.json")
+
+# score for placements that lock (partly) above the board or leave no move
+TOP_OUT = -1e9
+
+def load_weights(path=WEIGHTS_FILE):
+    """
+    Weights from a tuner output file ({"weights": {...}, ...}) or a plain
+    {feature: weight} JSON object. Returns None if the file is missing or
+    unreadable, so callers fall back to DEFAULT_WEIGHTS.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        weights = data.get("weights", data)
+        return {k: float(weights[k]) for k in FEATURES if k in weights}
+    except Exception as e:
+        print(f"Failed to load AI weights from {path}: {e}", file=sys.stderr)
+        return None
+
+def board_features(rows, width, height):
+    """
+    (aggregate_height, holes, bumpiness) for a board given as row masks, top
+    row first. A hole is an empty cell with a filled cell somewhere above it.
+    """
+    heights = [0] * width
+    seen = 0
+    holes = 0
+    for y, row in enumerate(rows):
+        new = row & ~seen
+        if new:
+            h = height - y
+            while new:
+                low = new & -new
+                heights[low.bit_length() - 1] = h
+                new ^= low
+            seen |= row
+        holes += bin(seen & ~row).count("1")
+    bumpiness = 0
+    for i in range(width - 1):
+        bumpiness += abs(heights[i] - heights[i + 1])
+    return sum(heights), holes, bumpiness
+
+def evaluate(rows, lines, width, height, weights):
+    agg, holes, bump = board_features(rows, width, height)
+    return (weights["aggregate_height"] * agg + weights["lines"] * lines +
+            weights["holes"] * holes + weights["bumpiness"] * bump)
+
+def _scratch_for(rules):
+    # private engine used for move generation; its own RNG keeps the game's
+    # piece sequence untouched
+    return PolyominoRules(rules.width, rules.height, rng=random.Random(0), pieces=rules.pieces)
+
+class PlacementPlanner:
+    """
+    Picks a lock position for rules.current. start() captures the root state,
+    step(budget) advances the search for at most `budget` seconds and returns
+    the plan (x, y, rot, path) once finished, None while still thinking.
+    """
+    def __init__(self, weights=None, lookahead=True, budget=0.004, evaluate_fn=evaluate):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.lookahead = lookahead
+        self.budget = budget
+        self.evaluate = evaluate_fn
+        self._scratch = None
+        self._search = None
+        self.plan = None
+        self.score = None
+
+    def start(self, rules):
+        s = self._scratch
+        if s is None or (s.width, s.height) != (rules.width, rules.height) or s.pieces is not rules.pieces:
+            self._scratch = _scratch_for(rules)
+        rows = list(rules.rows)
+        self.plan = None
+        self.score = None
+        self._search = self._run(rows, rules.current, rules.next_piece,
+                                 (rules.x, rules.y, rules.rotation))
+
+    def step(self, budget=None):
+        if self._search is None:
+            return self.plan
+        deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        try:
+            while time.perf_counter() < deadline:
+                next(self._search)
+        except StopIteration:
+            self._search = None
+        return self.plan
+
+    def plan_now(self, rules):
+        # synchronous search for headless use
+        self.start(rules)
+        for _ in self._search:
+            pass
+        self._search = None
+        return self.plan
+
+    # --- search ---
+
+    def _placements(self, rows, piece, pose=None):
+        s = self._scratch
+        s.rows[:] = rows
+        if pose is None:
+            s.next_piece = piece
+            s.spawn_piece()
+            if not s.fits(s.x, s.y, s.rotation):
+                return ()
+        else:
+            s.current = piece
+            s.x, s.y, s.rotation = pose
+        return (yield from iter_placements(s, s.x, s.y, s.rotation))
+
+    def _drop_placements(self, rows, piece):
+        # lookahead placements: every rotation reachable at spawn, shifted as
+        # far as it goes each way, then dropped. No tucks, but ~10x cheaper
+        # than the full BFS and good enough for scoring the next piece.
+        s = self._scratch
+        s.rows[:] = rows
+        s.next_piece = piece
+        s.spawn_piece()
+        fits = s.fits
+        out = []
+        pose = (s.x, s.y, s.rotation)
+        if not fits(*pose):
+            return out
+        for _ in range(4):
+            px, py, prot = pose
+            for step in (-1, 1):
+                x = px if step < 0 else px + 1
+                while fits(x, py, prot):
+                    y = py
+                    while fits(x, y + 1, prot):
+                        y += 1
+                    out.append((x, y, prot))
+                    x += step
+            pose = s.rotate_pose(px, py, prot)
+            if pose is None:
+                break
+        return out
+
+    def _apply(self, rows, piece, x, y, rot):
+        # board rows after locking piece at (x, y, rot) and clearing lines,
+        # or None if any cell would lock above the board
+        s = self._scratch
+        minx, maxx, miny, maxy, prow, _ = s.MASKS[piece][rot]
+        if y + miny < 0:
+            return None, 0
+        new = list(rows)
+        for dy, m in prow:
+            new[y + dy] |= (m << x) if x >= 0 else (m >> -x)
+        full = s.full_row
+        if full not in new:
+            return new, 0
+        kept = [r for r in new if r != full]
+        lines = len(new) - len(kept)
+        return [0] * lines + kept, lines
+
+    def _run(self, rows, piece, nxt, pose):
+        w, h = self._scratch.width, self._scratch.height
+        weights = self.weights
+        first = yield from self._placements(rows, piece, pose)
+        best = None
+        for (x, y, rot, path) in first:
+            r1, l1 = self._apply(rows, piece, x, y, rot)
+            if r1 is None:
+                score = TOP_OUT
+            elif self.lookahead and nxt is not None:
+                score = TOP_OUT / 2
+                second = self._drop_placements(r1, nxt)
+                yield
+                for i, (x2, y2, rot2) in enumerate(second, 1):
+                    r2, l2 = self._apply(r1, nxt, x2, y2, rot2)
+                    if r2 is not None:
+                        score = max(score, self.evaluate(r2, l1 + l2, w, h, weights))
+                    if not i % 16:
+                        yield
+            else:
+                score = self.evaluate(r1, l1, w, h, weights)
+            if best is None or score > best[0]:
+                best = (score, (x, y, rot, path))
+            yield
+        if best is not None:
+            self.score, self.plan = best
+        else:
+            self.plan = (pose[0], pose[1], pose[2], ())
+
+class AIPlayer:
+    """
+    Drives a TetrisSim from PlacementPlanner plans: at most one input every
+    action_delay + 1 calls, a hard drop once only downward moves are left.
+    Call step(sim) once per frame before sim.update().
+    """
+    def __init__(self, planner=None, action_delay=0):
+        self.planner = planner or PlacementPlanner()
+        self.action_delay = action_delay
+        self.reset()
+
+    def reset(self):
+        self._piece_sig = None
+        self._moves = None
+        self._wait = 0
+
+    def _signature(self, rules):
+        # every lock takes a new board version, so this changes once per piece
+        return (rules.board_version, rules.current, rules.next_piece)
+
+    def idle_frames(self, rules):
+        # how many step() calls from now only count down action_delay, as
+        # long as the piece stays the same; lets a headless driver skip them
+        # with TetrisSim.advance_until_event() and then call skip()
+        if self._moves is None or self._signature(rules) != self._piece_sig:
+            return 0
+        return self._wait
+
+    def skip(self, n):
+        self._wait -= n
+
+    def step(self, sim, budget=None):
+        rules = sim.rules
+        sig = self._signature(rules)
+        if sig != self._piece_sig:
+            # new piece (or first call): plan from its spawn pose
+            self._piece_sig = sig
+            self._moves = None
+            self.planner.start(rules)
+        if self._moves is None:
+            plan = self.planner.step(budget)
+            if plan is None:
+                return
+            self._moves = list(plan[3])
+        if self._wait:
+            self._wait -= 1
+            return
+        self._wait = self.action_delay
+        if all(m == DOWN for m in self._moves):
+            sim.hard_drop()
+            self._moves = []
+            return
+        move = self._moves.pop(0)
+        before = (rules.x, rules.rotation)
+        if move == LEFT:
+            sim.move(-1)
+        elif move == RIGHT:
+            sim.move(1)
+        elif move == ROTATE:
+            sim.rotate()
+        elif move == DOWN:
+            sim.soft_drop()
+            return
+        if (rules.x, rules.rotation) == before:
+            # blocked (gravity moved us off the planned path): replan from here
+            self._moves = None
+            self.planner.start(rules)
+
+def play_piece(sim, planner):
+    """
+    Headless helper: plan the current piece synchronously and apply the plan
+    directly (no gravity in between). Returns lines cleared by the lock.
+    """
+    rules = sim.rules
+    plan = planner.plan_now(rules)
+    for move in plan[3]:
+        if move == LEFT:
+            sim.move(-1)
+        elif move == RIGHT:
+            sim.move(1)
+        elif move == ROTATE:
+            sim.rotate()
+        elif move == DOWN:
+            sim.soft_drop()
+    sim.hard_drop()
+    return sim.last_lines
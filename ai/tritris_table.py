@@ -0,0 +1,443 @@
+# ai/tritris_table.py
+# Exhaustive solver for tritris on its 4x5 board. The builder walks every
+# board reachable from an empty one by locking pieces (placements from the
+# spawn pose, tucks included), then runs value iteration over
+# (board, current, next, bag) states for the engines' bag randomizer, and
+# writes the best placement per state to a memory-mapped table. With the
+# table, the tritris AI is a dict lookup plus two array reads per piece and no
+# search: see TablePlanner, a drop-in for PlacementPlanner.
+# Objectives: "lines" maximizes expected discounted lines cleared, "survival"
+# expected discounted pieces placed before topping out.
+# Build: python -m ai.tritris_table [--objective lines] [--gamma 0.99] [--workers N]
+# Check: python -m ai.tritris_table --check [--games 32]   (table vs planner)
+import argparse, json, multiprocessing, os, random, shutil, struct, sys, tempfile, time
+
+import numpy as np
+
+from rules.tritris_rules import TritrisRules, TRITRIS
+from rules.placements import search_placements, DOWN, LEFT, RIGHT, ROTATE
+from ai.planner import PlacementPlanner
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tritris_table.bin")
+
+# file layout: MAGIC, u64 header length, JSON header, zero padding to a
+# 64-byte boundary, then the arrays at the offsets the header gives
+MAGIC = b"KTT1\n"
+HEADER_LEN = struct.Struct("<Q")
+ALIGN = 64
+OBJECTIVES = ("lines", "survival")
+NO_ACTION = 0xFFFF
+# the board index is a dense int32 array over every 2**(w*h) board
+MAX_CELLS = 24
+MOVE_CODES = {LEFT: "L", RIGHT: "R", DOWN: "D", ROTATE: "U"}
+MOVES = {c: m for m, c in MOVE_CODES.items()}
+
+def board_code(rows, width):
+    # row masks (top row first) -> one int, bit y * width + x per cell
+    code = 0
+    for y, row in enumerate(rows):
+        code |= row << (width * y)
+    return code
+
+def piece_states(n):
+    """
+    Every (current, next, bag) the bag randomizer can produce for n piece
+    types (pieces as indices, bag as a bitmask of what is left after next was
+    drawn), and the matrix P[i, j] of going from state i to state j when the
+    next piece spawns. Mirrors RulesEngine._refill_bag/spawn_piece.
+    """
+    full = (1 << n) - 1
+
+    def draws(bag):
+        bag = bag or full
+        picks = [i for i in range(n) if bag >> i & 1]
+        return [(1.0 / len(picks), i, bag & ~(1 << i)) for i in picks]
+
+    seen = set()
+    for _, cur, bag in draws(0):
+        for _, nxt, rest in draws(bag):
+            seen.add((cur, nxt, rest))
+    queue = list(seen)
+    while queue:
+        cur, nxt, bag = queue.pop()
+        for _, d, rest in draws(bag):
+            s = (nxt, d, rest)
+            if s not in seen:
+                seen.add(s)
+                queue.append(s)
+    states = sorted(seen)
+    index = {s: i for i, s in enumerate(states)}
+    P = np.zeros((len(states), len(states)))
+    for i, (cur, nxt, bag) in enumerate(states):
+        for p, d, rest in draws(bag):
+            P[i, index[(nxt, d, rest)]] += p
+    return states, P
+
+# --- board enumeration (worker side) ---
+
+_scratch = None
+
+def _expand_init(width, height):
+    global _scratch
+    _scratch = TritrisRules(width, height, rng=random.Random(0))
+
+def _expand(code):
+    """
+    For each piece: None if it cannot spawn on this board, else every
+    placement as (next board code, lines, x, y, rot, path).
+    """
+    s = _scratch
+    w, h, full = s.width, s.height, s.full_row
+    rows = [(code >> (w * y)) & full for y in range(h)]
+    x0, y0 = w // 2 + TRITRIS.spawn_dx, TRITRIS.spawn_y
+    out = []
+    for name in TRITRIS.names:
+        s.rows[:] = rows
+        s.current = name
+        if not s.fits(x0, y0, 0):
+            out.append(None)
+            continue
+        moves = []
+        for (x, y, rot, path) in search_placements(s, x0, y0, 0):
+            new = list(rows)
+            for dy, m in TRITRIS.masks[name][rot][4]:
+                new[y + dy] |= (m << x) if x >= 0 else (m >> -x)
+            kept = [r for r in new if r != full]
+            lines = h - len(kept)
+            moves.append((board_code([0] * lines + kept, w), lines, x, y, rot, path))
+        out.append(moves)
+    return code, out
+
+def enumerate_boards(width, height, pool=None):
+    # breadth-first from the empty board; returns {code: _expand(code)[1]}
+    expanded = {}
+    seen = {0}
+    frontier = [0]
+    while frontier:
+        if pool is None:
+            results = map(_expand, frontier)
+        else:
+            results = pool.imap_unordered(_expand, frontier, chunksize=256)
+        nxt = []
+        for code, per_piece in results:
+            expanded[code] = per_piece
+            for moves in per_piece:
+                for m in moves or ():
+                    if m[0] not in seen:
+                        seen.add(m[0])
+                        nxt.append(m[0])
+        frontier = nxt
+    return expanded
+
+# --- value iteration (worker side) ---
+
+_vi = None
+
+def _vi_init(workdir, spec):
+    # arrays are shared as memory-mapped files in workdir
+    global _vi
+    _vi = {name: np.lib.format.open_memmap(os.path.join(workdir, name + ".npy"), mode="r+")
+           for name in spec}
+
+def _vi_expect(bounds):
+    # U[b, s] = value of landing on board b in state s before the spawn:
+    # expectation over the next draw, 0 if the next piece cannot spawn there
+    lo, hi = bounds
+    a = _vi
+    a["U"][lo:hi] = (a["V"][lo:hi] @ a["P"].T) * a["alive"][lo:hi][:, a["nxt_of"]]
+
+def _vi_sweep(args):
+    # one Bellman backup for boards lo:hi, all states; returns the max change.
+    # Transitions are flat per piece (src, dst, reward, action), sorted by
+    # src, so each board's placements are one contiguous segment.
+    lo, hi, gamma, final = args
+    a = _vi
+    U = a["U"].reshape(-1)
+    K = a["V"].shape[1]
+    delta = 0.0
+    for k in range(a["alive"].shape[1]):
+        cs = np.flatnonzero(a["cur_of"] == k)
+        src = a[f"src{k}"]
+        i0, i1 = np.searchsorted(src, (lo, hi))
+        new = np.zeros((hi - lo, len(cs)))
+        if i1 > i0:
+            seg_src = src[i0:i1]
+            starts = np.flatnonzero(np.r_[True, seg_src[1:] != seg_src[:-1]])
+            Q = a[f"rew{k}"][i0:i1, None] + gamma * U[a[f"dst{k}"][i0:i1, None].astype(np.int64) * K + cs]
+            best = np.maximum.reduceat(Q, starts, axis=0)
+            boards = seg_src[starts] - lo
+            new[boards] = best
+            if final:
+                seg = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(seg_src)]))
+                act = a[f"act{k}"][i0:i1]
+                for j, c in enumerate(cs):
+                    hit = np.flatnonzero(Q[:, j] == best[seg, j])
+                    _, first = np.unique(seg[hit], return_index=True)
+                    a["policy"][lo + boards, c] = act[hit[first]]
+        delta = max(delta, float(np.abs(new - a["V"][lo:hi, cs]).max()) if new.size else 0.0)
+        a["Vn"][lo:hi, cs] = new
+    return delta
+
+def _map(pool, fn, jobs):
+    return list(map(fn, jobs)) if pool is None else pool.map(fn, jobs)
+
+def build(width=4, height=5, objective="lines", gamma=0.99, tol=1e-4, max_iter=5000,
+          workers=None, out=TABLE_FILE, log=sys.stderr):
+    if width * height > MAX_CELLS:
+        raise ValueError(f"{width}x{height} is too large for a dense board index")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    names = TRITRIS.names
+    n = len(names)
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_expand_init, initargs=(width, height))
+    else:
+        _expand_init(width, height)
+    try:
+        expanded = enumerate_boards(width, height, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    t_enum = time.perf_counter() - t0
+    codes = sorted(expanded)
+    nb = len(codes)
+    row_of = {c: i for i, c in enumerate(codes)}
+    print(f"{nb} boards reachable ({t_enum:.1f}s, {workers} workers)", file=log, flush=True)
+
+    # flat transition arrays per piece, in board order
+    trans = [([], [], [], []) for _ in range(n)]
+    alive = np.zeros((nb, n), dtype=bool)
+    actions = {}
+    for b, code in enumerate(codes):
+        for k, moves in enumerate(expanded[code]):
+            if moves is None:
+                continue
+            alive[b, k] = True
+            src, dst, rew, act = trans[k]
+            for (nc, lines, x, y, rot, path) in moves:
+                src.append(b)
+                dst.append(row_of[nc])
+                rew.append(lines if objective == "lines" else 1.0)
+                act.append(actions.setdefault((x, y, rot, path), len(actions)))
+    del expanded
+    if len(actions) >= NO_ACTION:
+        raise ValueError("too many distinct placements for a 16-bit table")
+
+    states, P = piece_states(n)
+    K = len(states)
+    arrays = {
+        "alive": alive, "P": P,
+        "cur_of": np.array([s[0] for s in states], dtype=np.int64),
+        "nxt_of": np.array([s[1] for s in states], dtype=np.int64),
+        "V": np.zeros((nb, K)), "Vn": np.zeros((nb, K)), "U": np.zeros((nb, K)),
+        "policy": np.full((nb, K), NO_ACTION, dtype=np.uint16),
+    }
+    for k, (src, dst, rew, act) in enumerate(trans):
+        arrays[f"src{k}"] = np.array(src, dtype=np.int32)
+        arrays[f"dst{k}"] = np.array(dst, dtype=np.int32)
+        arrays[f"rew{k}"] = np.array(rew, dtype=np.float64)
+        arrays[f"act{k}"] = np.array(act, dtype=np.uint16)
+    del trans
+    workdir = tempfile.mkdtemp(prefix="tritris-table-")
+    pool = None
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(workdir, name + ".npy"), arr)
+        spec = tuple(arrays)
+        del arrays
+        _vi_init(workdir, spec)
+        shared = _vi
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_vi_init, initargs=(workdir, spec))
+        chunks = workers * 4
+        cut = [nb * i // chunks for i in range(chunks + 1)]
+        bounds = [(cut[i], cut[i + 1]) for i in range(chunks) if cut[i] < cut[i + 1]]
+        t1 = time.perf_counter()
+        it = 0
+        while True:
+            it += 1
+            final = it >= max_iter
+            _map(pool, _vi_expect, bounds)
+            delta = max(_map(pool, _vi_sweep, [(lo, hi, gamma, final) for lo, hi in bounds]))
+            shared["V"][:] = shared["Vn"]
+            if final:
+                break
+            if delta < tol:
+                # converged: one more backup records the policy
+                max_iter = it + 1
+            if it % 100 == 0:
+                print(f"  sweep {it}: max change {delta:.3g}", file=log, flush=True)
+        t_vi = time.perf_counter() - t1
+        V = np.array(shared["V"])
+        policy = np.array(shared["policy"])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        globals()["_vi"] = shared = None
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"value iteration: {it} sweeps ({t_vi:.1f}s)", file=log, flush=True)
+
+    index = np.full(1 << (width * height), -1, dtype=np.int32)
+    index[np.array(codes, dtype=np.int64)] = np.arange(nb, dtype=np.int32)
+    full = (1 << n) - 1
+    start = [i for i, (cur, nxt, bag) in enumerate(states) if cur != nxt and bag == full ^ (1 << cur) ^ (1 << nxt)]
+    info = {
+        "width": width, "height": height, "pieces": names,
+        "spawn": [width // 2 + TRITRIS.spawn_dx, TRITRIS.spawn_y, 0],
+        "states": [list(s) for s in states],
+        "actions": [[x, y, rot, "".join(MOVE_CODES[m] for m in path)]
+                    for (x, y, rot, path), _ in sorted(actions.items(), key=lambda kv: kv[1])],
+        "objective": objective, "gamma": gamma, "sweeps": it, "boards": nb,
+        # expected discounted objective from the empty board, over the
+        # states a fresh game can start in
+        "value_from_empty": float(V[row_of[0], start].mean()),
+        "build_s": time.perf_counter() - t0,
+    }
+    write_table(out, info, index, policy)
+    print(f"wrote {out} ({os.path.getsize(out) / 1e6:.1f} MB), "
+          f"value from empty board {info['value_from_empty']:.3f}", file=log, flush=True)
+    return info
+
+def write_table(path, info, index, policy):
+    header = dict(info)
+    offset = 0
+    for name, arr in (("index", index), ("policy", policy)):
+        header[name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    text = json.dumps(header).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + HEADER_LEN.pack(len(text)) + text)
+        f.write(b"\0" * (-f.tell() % ALIGN))
+        for arr in (index, policy):
+            f.write(arr.tobytes())
+            f.write(b"\0" * (-arr.nbytes % ALIGN))
+    # replace atomically, so a running game never maps half a table
+    os.replace(tmp, path)
+
+class TritrisTable:
+    """
+    Read side of a table written by build(). The arrays are memory-mapped, so
+    opening is cheap and pages load on first use. lookup() is O(1).
+    """
+    def __init__(self, path=TABLE_FILE):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a tritris table")
+            (size,) = HEADER_LEN.unpack(f.read(HEADER_LEN.size))
+            self.info = json.loads(f.read(size).decode("utf-8"))
+        base = len(MAGIC) + HEADER_LEN.size + size
+        base += -base % ALIGN
+        arrays = {}
+        for name in ("index", "policy"):
+            spec = self.info[name]
+            arrays[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r",
+                                     offset=base + spec["offset"], shape=tuple(spec["shape"]))
+        self.index = arrays["index"]
+        self.policy = arrays["policy"]
+        self.width = self.info["width"]
+        self.height = self.info["height"]
+        self.spawn = tuple(self.info["spawn"])
+        names = self.info["pieces"]
+        self.piece_bit = {p: 1 << i for i, p in enumerate(names)}
+        self.state_index = {(names[c], names[nx], bag): i for i, (c, nx, bag) in enumerate(self.info["states"])}
+        self.actions = [(x, y, rot, tuple(MOVES[c] for c in path)) for x, y, rot, path in self.info["actions"]]
+
+    def lookup(self, rules):
+        """
+        The table's (x, y, rot, path) for the current piece of `rules`, or
+        None if the state is not covered (board size, piece set, or a piece
+        that has already left its spawn pose).
+        """
+        if (rules.width, rules.height) != (self.width, self.height) or \
+                (rules.x, rules.y, rules.rotation) != self.spawn:
+            return None
+        # the policy is for 3-bags; other randomizers' bags mean something else
+        if getattr(getattr(rules, "randomizer", None), "mode", "bag") != "bag":
+            return None
+        rows = rules.rows
+        b = self.index[board_code(rows, self.width)]
+        if b < 0:
+            return None
+        bag = 0
+        for p in rules.bag:
+            bag |= self.piece_bit.get(p, 0)
+        s = self.state_index.get((rules.current, rules.next_piece, bag))
+        if s is None:
+            return None
+        a = self.policy[b, s]
+        return None if a == NO_ACTION else self.actions[a]
+
+class TablePlanner:
+    """
+    PlacementPlanner stand-in that answers from a TritrisTable and hands any
+    state the table does not cover to `fallback` (a PlacementPlanner by
+    default). Works with AIPlayer and play_piece unchanged.
+    """
+    def __init__(self, table, fallback=None):
+        self.table = table
+        self.fallback = fallback or PlacementPlanner()
+        self.plan = None
+        self.score = None
+        self.hits = 0
+        self.misses = 0
+        self._searching = False
+
+    def start(self, rules):
+        self.plan = self.table.lookup(rules)
+        self.score = None
+        self._searching = self.plan is None
+        if self._searching:
+            self.misses += 1
+            self.fallback.start(rules)
+        else:
+            self.hits += 1
+
+    def step(self, budget=None):
+        if self._searching:
+            self.plan = self.fallback.step(budget)
+            self.score = self.fallback.score
+            self._searching = self.plan is None
+        return self.plan
+
+    def plan_now(self, rules):
+        self.start(rules)
+        if self._searching:
+            self.plan = self.fallback.plan_now(rules)
+            self.score = self.fallback.score
+            self._searching = False
+        return self.plan
+
+def check(path=TABLE_FILE, games=32, max_pieces=2000, seed=0, workers=None):
+    # seeded self-play, table vs search planner on the same piece sequences
+    from sim.selfplay import run
+    report = {}
+    for label, table in (("table", path), ("planner", None)):
+        r = run(games=games, workers=workers, seed=seed, mode="tritris", max_pieces=max_pieces, table=table)
+        report[label] = {k: r[k] for k in ("pieces", "pieces_per_s", "lines", "topped_out", "game_length")}
+        report[label]["lines_per_piece"] = r["lines"] / r["pieces"] if r["pieces"] else 0.0
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build (or check) the tritris optimal-play table")
+    parser.add_argument("--out", default=TABLE_FILE)
+    parser.add_argument("--objective", choices=OBJECTIVES, default="lines")
+    parser.add_argument("--gamma", type=float, default=0.99, help="discount per piece")
+    parser.add_argument("--tol", type=float, default=1e-4, help="stop when no value moves more than this")
+    parser.add_argument("--max-iter", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--check", action="store_true", help="play seeded games with an existing table")
+    parser.add_argument("--games", type=int, default=32)
+    parser.add_argument("--pieces", type=int, default=2000, help="max pieces per checked game")
+    args = parser.parse_args()
+    if args.check:
+        print(json.dumps(check(args.out, args.games, args.pieces, workers=args.workers), indent=2))
+    else:
+        build(objective=args.objective, gamma=args.gamma, tol=args.tol, max_iter=args.max_iter,
+              workers=args.workers, out=args.out)
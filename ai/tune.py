@@ -0,0 +1,138 @@
+# ai/tune.py
+# Offline tuner for the placement AI's evaluation weights using the
+# cross-entropy method. Candidates are scored by headless self-play across a
+# process pool. Every candidate in a generation plays the same seeds (common
+# random numbers) and candidates that fall well behind the current elite are
+# dropped between rounds. The best weights go to a JSON file that
+# screensaver.py loads at startup.
+# Run: python -m ai.tune --generations 10 --population 24 --games 6
+import argparse, json, math, multiprocessing, os, random, sys, time
+
+from ai.planner import FEATURES, DEFAULT_WEIGHTS, WEIGHTS_FILE
+from sim.selfplay import play_game
+
+def _normalize(vec):
+    # the evaluation is linear, so only the direction of the vector matters
+    n = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / n for v in vec]
+
+def _play(job):
+    index, seed, weights, kwargs = job
+    result = play_game(seed, weights=weights, **kwargs)
+    return index, result["lines"]
+
+class CrossEntropyTuner:
+    def __init__(self, population=24, elite=0.25, games=6, min_games=2, prune_ratio=0.6,
+                 sigma=0.5, sigma_floor=0.05, seed=0, workers=None, **game_kwargs):
+        self.population = population
+        self.n_elite = max(2, int(round(population * elite)))
+        self.games = games
+        self.min_games = min_games
+        self.prune_ratio = prune_ratio
+        self.sigma_floor = sigma_floor
+        self.workers = workers or os.cpu_count() or 1
+        self.game_kwargs = game_kwargs
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.mean = _normalize([DEFAULT_WEIGHTS[f] for f in FEATURES])
+        self.sigma = [sigma] * len(FEATURES)
+        self.best = None   # (score, weights dict, generation)
+
+    def _sample(self):
+        return [_normalize([self.rng.gauss(m, s) for m, s in zip(self.mean, self.sigma)])
+                for _ in range(self.population)]
+
+    def _evaluate(self, pool, candidates, generation):
+        # common random numbers: the same game seeds for every candidate
+        seeds = [self.seed * 1000003 + generation * 1009 + g for g in range(self.games)]
+        totals = [0.0] * len(candidates)
+        played = [0] * len(candidates)
+        alive = list(range(len(candidates)))
+        for g, game_seed in enumerate(seeds):
+            jobs = [(i, game_seed, dict(zip(FEATURES, candidates[i])), self.game_kwargs) for i in alive]
+            results = pool.map(_play, jobs, chunksize=1) if pool else map(_play, jobs)
+            for i, lines in results:
+                totals[i] += lines
+                played[i] += 1
+            if g + 1 >= self.min_games and g + 1 < len(seeds) and len(alive) > self.n_elite:
+                # drop candidates far behind the current elite cut-off
+                means = sorted((totals[i] / played[i] for i in alive), reverse=True)
+                cutoff = means[self.n_elite - 1] * self.prune_ratio
+                alive = [i for i in alive if totals[i] / played[i] >= cutoff]
+        # partially evaluated candidates rank by their mean so far
+        return [totals[i] / played[i] for i in range(len(candidates))], played
+
+    def step(self, pool, generation):
+        candidates = self._sample()
+        scores, played = self._evaluate(pool, candidates, generation)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        # only fully evaluated candidates may become elite
+        elite = [i for i in order if played[i] == self.games][:self.n_elite]
+        for k in range(len(FEATURES)):
+            vals = [candidates[i][k] for i in elite]
+            m = sum(vals) / len(vals)
+            var = sum((v - m) ** 2 for v in vals) / len(vals)
+            self.mean[k] = m
+            self.sigma[k] = max(self.sigma_floor, math.sqrt(var))
+        self.mean = _normalize(self.mean)
+        top = elite[0]
+        if self.best is None or scores[top] > self.best[0]:
+            self.best = (scores[top], dict(zip(FEATURES, candidates[top])), generation)
+        return {
+            "generation": generation,
+            "best": scores[top],
+            "elite_mean": sum(scores[i] for i in elite) / len(elite),
+            "evaluated_games": sum(played),
+            "pruned": sum(1 for p in played if p < self.games),
+            "mean": dict(zip(FEATURES, self.mean)),
+        }
+
+def save_weights(path, tuner, config):
+    score, weights, generation = tuner.best
+    with open(path, "w") as f:
+        json.dump({"weights": weights, "score": score, "generation": generation,
+                   "config": config}, f, indent=2)
+        f.write("\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="tune the placement AI's evaluation weights")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--population", type=int, default=24)
+    parser.add_argument("--elite", type=float, default=0.25, help="elite fraction")
+    parser.add_argument("--games", type=int, default=6, help="games per candidate")
+    parser.add_argument("--pieces", type=int, default=300, help="max pieces per game")
+    parser.add_argument("--min-games", type=int, default=2, help="games before pruning starts")
+    parser.add_argument("--prune-ratio", type=float, default=0.6)
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["tetris","tritris"], default="tetris")
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--height", type=int, default=None)
+    parser.add_argument("--no-lookahead", action="store_true",
+                        help="tune with 1-piece search (much faster per game)")
+    parser.add_argument("--out", default=WEIGHTS_FILE)
+    args = parser.parse_args(argv)
+
+    game_kwargs = dict(mode=args.mode, width=args.width, height=args.height,
+                       max_pieces=args.pieces, lookahead=not args.no_lookahead)
+    tuner = CrossEntropyTuner(population=args.population, elite=args.elite, games=args.games,
+                              min_games=args.min_games, prune_ratio=args.prune_ratio,
+                              seed=args.seed, workers=args.workers, **game_kwargs)
+    config = dict(vars(args))
+    t0 = time.perf_counter()
+    pool = multiprocessing.Pool(tuner.workers) if tuner.workers > 1 else None
+    try:
+        for gen in range(args.generations):
+            stats = tuner.step(pool, gen)
+            stats["elapsed_s"] = round(time.perf_counter() - t0, 1)
+            print(json.dumps(stats), flush=True)
+            # write after every generation so an interrupted run still helps
+            save_weights(args.out, tuner, config)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    print(f"best {tuner.best[0]:.1f} lines/game (generation {tuner.best[2]}) -> {args.out}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+# bench/bench_batch.py
+# Game-steps per second: BatchTetrisSim against a Python loop over TetrisSim.
+# Run: python -m bench.bench_batch [--games N] [--steps S]
+import argparse, random, time
+
+import numpy as np
+
+from rules.tetris_rules import RulesEngine
+from sim.tetris_sim import TetrisSim
+from sim.batch_sim import BatchTetrisSim
+
+def _inputs(n, steps, seed):
+    rng = np.random.default_rng(seed)
+    # press left, release left, rotate, hard drop; soft drop held 30% of frames
+    ev = rng.random((steps, 4, n)) < np.array([[0.03], [0.1], [0.03], [0.01]])
+    return ev, rng.random((steps, n)) < 0.3
+
+def bench_loop(n, steps, width, height, seed=0):
+    sims = [TetrisSim(RulesEngine(width, height, rng=random.Random(i))) for i in range(n)]
+    ev, soft = _inputs(n, steps, seed)
+    ev = ev.tolist()
+    soft = soft.tolist()
+    t0 = time.perf_counter()
+    for s in range(steps):
+        left, release, rot, drop = ev[s]
+        for i, sim in enumerate(sims):
+            if sim.game_over:
+                sim.reset()
+            if left[i]: sim.input.press_left()
+            if release[i]: sim.input.release_left()
+            if rot[i]: sim.rotate()
+            if drop[i]: sim.hard_drop()
+            sim.update(1 / 60, soft_hold=soft[s][i])
+    return n * steps / (time.perf_counter() - t0)
+
+def bench_batch(n, steps, width, height, seed=0):
+    batch = BatchTetrisSim(n, width, height, seeds=range(n))
+    ev, soft = _inputs(n, steps, seed)
+    t0 = time.perf_counter()
+    for s in range(steps):
+        batch.reset()
+        batch.press_left(ev[s, 0])
+        batch.release_left(ev[s, 1])
+        batch.rotate(ev[s, 2])
+        batch.hard_drop(ev[s, 3])
+        batch.update(1 / 60, soft[s])
+    return n * steps / (time.perf_counter() - t0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, nargs="+", default=[100, 1000, 10000, 30000])
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--height", type=int, default=20)
+    args = parser.parse_args()
+    for n in args.games:
+        loop = bench_loop(n, max(1, args.steps * 100 // n), args.width, args.height)
+        batch = bench_batch(n, args.steps, args.width, args.height)
+        print(f"{n:6d} games: TetrisSim loop {loop:>12,.0f} steps/s  "
+              f"BatchTetrisSim {batch:>12,.0f} steps/s  ({batch / loop:.1f}x)")
@@ -0,0 +1,222 @@
+# bench/bench_micro.py
+# Microbenchmarks for the rules engines, TetrisSim, the frame compositor and
+# serial frame encoding, on seeded random boards for tetris and tritris at
+# several sizes. Everything is seeded, so runs are comparable across commits:
+# write JSON with --json and diff two runs with --compare.
+# Run: python -m bench.bench_micro [--seconds 0.2] [--json out.json] [--compare old.json]
+import argparse, itertools, json, platform, random, subprocess, sys, time
+
+import numpy as np
+
+from rules.tetris_rules import RulesEngine
+from rules.tritris_rules import TritrisRules
+from rules.tracking import next_board_version
+from sim.tetris_sim import TetrisSim
+from renderer.compositor import FrameCompositor, _reference_rgb
+from renderer.usb_frame import FrameLink, send_frame
+from bench.fake_serial import FakeSerial
+
+CONFIGS = (
+    ("tetris", RulesEngine, 10, 20),
+    ("tetris", RulesEngine, 32, 64),
+    ("tetris", RulesEngine, 64, 128),
+    ("tritris", TritrisRules, 4, 5),
+    ("tritris", TritrisRules, 16, 20),
+)
+# encoding name -> binary version the fake device answers the handshake with
+PROTOCOLS = (("ascii", 0), ("raw", 1), ("delta", 2))
+
+def seeded_board(rules, seed, fill=0.4, density=0.6):
+    """
+    Fill the bottom `fill` of the board at `density` with random piece
+    letters (never a full row, top rows left free for spawning), then
+    respawn.
+    """
+    rng = random.Random(seed)
+    names = sorted({c for c in (rules.current, rules.next_piece) + tuple(rules.bag) if c})
+    w, h = rules.width, rules.height
+    rows = max(1, min(h - 3, int(h * fill)))
+    for y in range(h):
+        for x in range(w):
+            rules.board[y][x] = None
+    for y in range(h - rows, h):
+        row = rules.board[y]
+        for x in range(w):
+            if rng.random() < density:
+                row[x] = rng.choice(names)
+        if all(c is not None for c in row):
+            row[rng.randrange(w)] = None
+    rules.rows[:] = [sum(1 << x for x, c in enumerate(row) if c is not None) for row in rules.board]
+    rules.board_version = next_board_version()
+    rules.game_over_on_spawn = False
+    rules.spawn_piece()
+    return rules
+
+def make_rules(cls, width, height, seed):
+    return seeded_board(cls(width, height, rng=random.Random(seed)), seed)
+
+def _time_per_op(fn, seconds):
+    # seconds per call, doubling the batch until the run is long enough
+    n = 1
+    total = 0
+    calls = 0
+    t_end = time.perf_counter() + seconds
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        total += time.perf_counter() - t0
+        calls += n
+        if time.perf_counter() >= t_end:
+            return total / calls
+        n = min(n * 2, 4096)
+
+def _poses(rules, seed, n=256):
+    rng = random.Random(seed)
+    return [(rng.randrange(-2, rules.width), rng.randrange(-1, rules.height), rng.randrange(4))
+            for _ in range(n)]
+
+def bench_ops(cls, width, height, seed, seconds):
+    rules = make_rules(cls, width, height, seed)
+    out = {}
+
+    poses = itertools.cycle(_poses(rules, seed))
+    out["fits"] = _time_per_op(lambda: rules.fits(*next(poses)), seconds)
+
+    # legal poses only, so try_rotate runs its kick tests
+    legal = itertools.cycle([p for p in _poses(rules, seed, 2048) if rules.fits(*p)] or
+                            [(rules.x, rules.y, rules.rotation)])
+    def rotate():
+        rules.x, rules.y, rules.rotation = next(legal)
+        rules.try_rotate()
+    spawn = (rules.x, rules.y, rules.rotation)
+    out["try_rotate"] = _time_per_op(rotate, seconds)
+    rules.x, rules.y, rules.rotation = spawn
+
+    # ghost from the spawn pose: cold recomputes, cached reuses
+    def ghost_cold():
+        rules._ghost_cache = None
+        rules.get_ghost_cells()
+    out["ghost_cold"] = _time_per_op(ghost_cold, seconds)
+    out["ghost_cached"] = _time_per_op(rules.get_ghost_cells, seconds)
+
+    # lock at a random column after a drop, clear, then put the board back;
+    # restore alone is measured too so it can be subtracted
+    snap = rules.snapshot()
+    rng = random.Random(seed)
+    def lock_clear():
+        rules.restore(snap)
+        x = rng.randrange(-1, rules.width - 1)
+        if rules.fits(x, rules.y, rules.rotation):
+            rules.x = x
+        while rules.fits(rules.x, rules.y + 1, rules.rotation):
+            rules.y += 1
+        rules.lock_piece()
+        rules.clear_lines()
+    out["lock_clear+restore"] = _time_per_op(lock_clear, seconds)
+    out["restore"] = _time_per_op(lambda: rules.restore(snap), seconds)
+    return out
+
+def _game_inputs(rng, sim):
+    r = rng.random()
+    if r < 0.04:
+        sim.input.press_left()
+    elif r < 0.08:
+        sim.input.press_right()
+    elif r < 0.2:
+        sim.input.release_left()
+        sim.input.release_right()
+    elif r < 0.23:
+        sim.rotate()
+    elif r < 0.24:
+        sim.hard_drop()
+    return rng.random() < 0.3
+
+def bench_frames(mode, cls, width, height, seed, frames):
+    """
+    Per-frame cost of each pipeline stage on a live seeded game: update with
+    realistic inputs, compositor, the old list path, send_frame per encoding.
+    """
+    rules = make_rules(cls, width, height, seed)
+    sim = TetrisSim(rules)
+    rng = random.Random(seed)
+    comp = FrameCompositor(width, height, mode)
+    links = [(name, FrameLink(FakeSerial(binary=version), "auto")) for name, version in PROTOCOLS]
+    ns = {"update": 0, "compose": 0, "build_frame+frame_to_rgb": 0}
+    for name, _ in links:
+        ns["send_" + name] = 0
+    clock = time.perf_counter_ns
+    for _ in range(frames):
+        if sim.is_game_over:
+            seeded_board(rules, rng.randrange(1 << 30))
+            sim.game_over = False
+        soft = _game_inputs(rng, sim)
+        t0 = clock()
+        sim.update(1 / 60, soft_hold=soft)
+        t1 = clock()
+        rgb = comp.compose(rules)
+        t2 = clock()
+        _reference_rgb(rules, mode)
+        t3 = clock()
+        ns["update"] += t1 - t0
+        ns["compose"] += t2 - t1
+        ns["build_frame+frame_to_rgb"] += t3 - t2
+        for name, link in links:
+            t0 = clock()
+            send_frame(link, rgb, width, height)
+            ns["send_" + name] += clock() - t0
+    return {k: v / frames / 1e9 for k, v in ns.items()}
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(seconds=0.2, frames=300, seed=0, only=None):
+    results = []
+    for mode, cls, w, h in CONFIGS:
+        config = f"{cls.__name__} {w}x{h}"
+        if only and only not in config:
+            continue
+        timings = bench_ops(cls, w, h, seed, seconds)
+        timings.update(bench_frames(mode, cls, w, h, seed, frames))
+        for bench, sec in timings.items():
+            results.append({"config": config, "mode": mode, "engine": cls.__name__,
+                            "width": w, "height": h, "bench": bench,
+                            "us_per_op": sec * 1e6, "ops_per_s": 1.0 / sec if sec else 0.0})
+        print(f"{config:30s} " + "  ".join(f"{b} {t * 1e6:.2f}us" for b, t in timings.items()),
+              file=sys.stderr, flush=True)
+    return {
+        "meta": {"git": _git_rev(), "python": platform.python_version(), "numpy": np.__version__,
+                 "machine": platform.machine(), "seconds": seconds, "frames": frames, "seed": seed},
+        "results": results,
+    }
+
+def compare(old, new):
+    # ratio > 1: new is slower
+    before = {(r["config"], r["bench"]): r["us_per_op"] for r in old["results"]}
+    print(f"{'config':30s} {'bench':26s} {'old us':>10s} {'new us':>10s} {'ratio':>7s}")
+    for r in new["results"]:
+        key = (r["config"], r["bench"])
+        if key in before and before[key]:
+            print(f"{key[0]:30s} {key[1]:26s} {before[key]:10.2f} {r['us_per_op']:10.2f} "
+                  f"{r['us_per_op'] / before[key]:7.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.2, help="time per op measurement")
+    parser.add_argument("--frames", type=int, default=300, help="game frames for the stage timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default=None, help="run configs containing this text")
+    parser.add_argument("--json", default=None, help="write results to this file")
+    parser.add_argument("--compare", default=None, help="earlier --json output to compare against")
+    args = parser.parse_args()
+    report = run(args.seconds, args.frames, args.seed, args.only)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
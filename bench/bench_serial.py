@@ -0,0 +1,82 @@
+# bench/bench_serial.py
+# Achievable LED panel frame rates per encoding and baud rate, using an
+# in-memory serial port: encode cost is measured, wire time is computed from
+# the byte count (8N1). Frames come from a seeded game with random inputs,
+# so delta encoding sees realistic frame-to-frame changes.
+# Run: python -m bench.bench_serial [--json out.json]
+import argparse, json, random, time
+
+from rules.tetris_rules import RulesEngine
+from sim.tetris_sim import TetrisSim
+from renderer.compositor import FrameCompositor
+from renderer.usb_frame import FrameLink, negotiate_binary
+from bench.fake_serial import FakeSerial
+
+BAUD_RATES = (115200, 230400, 460800, 921600, 2000000)
+SIZES = ((10, 20), (6, 15), (32, 64))
+# encoding name -> binary version the fake device answers the handshake with
+PROTOCOLS = (("ascii", 0), ("raw", 1), ("delta", 2))
+
+def game_frames(width, height, frames=300, seed=0):
+    rng = random.Random(seed)
+    sim = TetrisSim(RulesEngine(width, height, rng=random.Random(seed)))
+    comp = FrameCompositor(width, height, "tetris")
+    out = []
+    for _ in range(frames):
+        if sim.is_game_over:
+            sim.reset()
+        r = rng.random()
+        if r < 0.05:
+            sim.move(rng.choice((-1, 1)))
+        elif r < 0.08:
+            sim.rotate()
+        elif r < 0.09:
+            sim.hard_drop()
+        sim.update(1 / 60, soft_hold=rng.random() < 0.3)
+        out.append(comp.compose(sim.rules).copy())
+    return out
+
+def check_handshake():
+    # every firmware generation must negotiate its own version: a v1-only
+    # device (answers nothing but "?KF1") must not fall back to ASCII
+    for version in (0, 1, 2):
+        got = negotiate_binary(FakeSerial(binary=version), timeout=0.05)
+        assert got == version, f"device answering v{version} negotiated v{got}"
+
+def measure(version, frames, width, height):
+    port = FakeSerial(binary=version)
+    link = FrameLink(port, "auto")
+    t0 = time.perf_counter()
+    for frame in frames:
+        link.send(frame, width, height)
+    encode_s = (time.perf_counter() - t0) / len(frames)
+    return encode_s, port.bytes_written / len(frames)
+
+def run(frames=300):
+    results = []
+    for width, height in SIZES:
+        seq = game_frames(width, height, frames)
+        for name, version in PROTOCOLS:
+            encode_s, nbytes = measure(version, seq, width, height)
+            row = {"width": width, "height": height, "protocol": name,
+                   "bytes_per_frame": nbytes, "encode_us": encode_s * 1e6, "fps": {}}
+            for baud in BAUD_RATES:
+                row["fps"][baud] = 1.0 / (encode_s + nbytes * 10 / baud)
+            results.append(row)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    args = parser.parse_args()
+    check_handshake()
+    results = run(args.frames)
+    print(f"{'size':>7s} {'proto':>6s} {'bytes':>7s} {'enc us':>8s} " +
+          " ".join(f"{b:>9d}" for b in BAUD_RATES))
+    for r in results:
+        print(f"{r['width']:>3d}x{r['height']:<3d} {r['protocol']:>6s} {r['bytes_per_frame']:>7.0f} "
+              f"{r['encode_us']:>8.1f} " + " ".join(f"{r['fps'][b]:>8.1f}f" for b in BAUD_RATES))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,58 @@
+# bench/bench_snapshot.py
+# Snapshot/restore throughput for the rules engines and TetrisSim, with
+# deepcopy as the baseline. Run: python -m bench.bench_snapshot
+import argparse, random, time
+from copy import deepcopy
+
+from rules.tetris_rules import RulesEngine
+from rules.tritris_rules import TritrisRules
+from sim.tetris_sim import TetrisSim
+
+def _fill(rules, seed, pieces=12):
+    # drop a few pieces so the board is not trivially empty
+    rng = random.Random(seed)
+    for _ in range(pieces):
+        if rules.is_game_over():
+            break
+        rules.x += rng.randint(-3, 3)
+        if not rules.fits(rules.x, rules.y, rules.rotation):
+            rules.x = (rules.width // 2) - 2
+        while rules.fits(rules.x, rules.y + 1, rules.rotation):
+            rules.y += 1
+        rules.lock_piece()
+        rules.clear_lines()
+
+def _rate(fn, seconds):
+    n = 0
+    batch = 1000
+    t0 = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        n += batch
+        dt = time.perf_counter() - t0
+        if dt >= seconds:
+            return n / dt
+
+def run(seconds=0.5):
+    random.seed(1)
+    targets = [
+        ("RulesEngine 10x20", RulesEngine(10, 20)),
+        ("TritrisRules 4x5", TritrisRules(4, 5)),
+    ]
+    for name, rules in targets:
+        _fill(rules, seed=1)
+        sim = TetrisSim(rules)
+        for label, obj in ((name, rules), ("TetrisSim/" + name, sim)):
+            snap = obj.snapshot()
+            snap_rate = _rate(obj.snapshot, seconds)
+            restore_rate = _rate(lambda: obj.restore(snap), seconds)
+            copy_rate = _rate(lambda: deepcopy(obj), seconds / 5)
+            print(f"{label:36s} snapshot {snap_rate:>10,.0f}/s  restore {restore_rate:>10,.0f}/s  "
+                  f"deepcopy {copy_rate:>9,.0f}/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.5, help="time per measurement")
+    args = parser.parse_args()
+    run(args.seconds)
@@ -0,0 +1,57 @@
+# bench/fake_serial.py
+# In-memory stand-in for serial.Serial: counts what is written and can
+# answer the binary frame handshake like capable firmware would.
+from renderer.usb_frame import BINARY_HELLO, BINARY_HELLO_REPLY, BINARY_VERSION
+
+# the exact line version 1 firmware answers (and its reply); it knows
+# nothing else, so it is spelled out here rather than taken from usb_frame
+V1_HELLO = b"?KF1\n"
+V1_REPLY = b"KF1\n"
+
+class FakeSerial:
+    def __init__(self, baudrate=115200, binary=BINARY_VERSION, keep=False):
+        self.baudrate = baudrate
+        self.binary = binary          # binary version to answer the handshake with (0 = none)
+        self.keep = keep              # keep written bytes in self.data
+        self.timeout = 1
+        self.is_open = True
+        self.bytes_written = 0
+        self.writes = 0
+        self.data = bytearray()
+        self._rx = bytearray()
+
+    def write(self, data):
+        if self.binary == 1 and data == V1_HELLO:
+            self._rx += V1_REPLY
+            return len(data)
+        if self.binary > 1 and data == BINARY_HELLO:
+            self._rx += BINARY_HELLO_REPLY + str(self.binary).encode("ascii") + b"\n"
+            return len(data)
+        self.bytes_written += len(data)
+        self.writes += 1
+        if self.keep:
+            self.data += data
+        return len(data)
+
+    def read(self, n=1):
+        out = bytes(self._rx[:n])
+        del self._rx[:n]
+        return out
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def close(self):
+        self.is_open = False
+
+    def wire_seconds(self, nbytes=None):
+        # 8N1 framing: 10 bit times per byte
+        nbytes = self.bytes_written if nbytes is None else nbytes
+        return nbytes * 10 / self.baudrate
@@ -0,0 +1,380 @@
+# bench/panel_emulator.py
+# LED panel emulator on a pseudo-terminal. The slave end behaves like the
+# panel's serial port: it answers the binary handshake, decodes ASCII
+# (":RRGGBB...\n") and binary frames (raw, RLE, delta), optionally throttles
+# reads to a baud rate, and counts bytes/s, frames/s, decode errors and
+# sequence gaps. Point the game at it with main.py --usb-port <pty path>, or
+# run the built-in load test, which drives the real output pipeline
+# (compositor -> SerialFrameSink -> FrameLink -> pty) and reports end-to-end
+# latency per frame.
+# Run: python -m bench.panel_emulator [--window]            (serve, print stats)
+#      python -m bench.panel_emulator --load-test [--protocol auto] [--fps 60] [--baud 115200]
+#      python -m bench.panel_emulator --load-test --tiles 4      (LED wall, see renderer/led_wall.py)
+# Linux/macOS only (needs pty).
+import argparse, json, os, pty, random, select, threading, time, tty
+
+from renderer.usb_frame import (BINARY_HELLO, BINARY_HELLO_REPLY, BINARY_MAGIC, BINARY_VERSION,
+                                FRAME_RAW, FRAME_RLE, FRAME_RUNS, apply_frame, decode_binary)
+
+FRAME_NAMES = {FRAME_RAW: "raw", FRAME_RLE: "rle", FRAME_RUNS: "delta"}
+
+class PanelEmulator:
+    def __init__(self, width=10, height=20, binary_version=BINARY_VERSION, baudrate=None):
+        self.width = width
+        self.height = height
+        self.binary_version = binary_version    # 0 = ASCII-only firmware
+        self.baudrate = baudrate                # None = as fast as the pty goes
+        self.master, self.slave = pty.openpty()
+        # no echo, no newline translation: the slave end is a byte pipe
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.frame = None           # last decoded frame, raw RGB bytes
+        self.frame_count = 0
+        self.frames_by_type = {"ascii": 0, "raw": 0, "rle": 0, "delta": 0}
+        self.bytes = 0
+        self.errors = 0
+        self.seq_gaps = 0
+        self.recv_log = []          # (frame index, seq or None, perf_counter at decode)
+        self._last_seq = None
+        self._buf = bytearray()
+        self._t_first = None
+        self._t_last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="panel-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self.master, 4096)
+            except OSError:
+                return
+            if not chunk:
+                continue
+            now = time.perf_counter()
+            if self._t_first is None:
+                self._t_first = now
+            self._t_last = now
+            self.bytes += len(chunk)
+            self._buf += chunk
+            self._decode()
+            if self.baudrate:
+                # 8N1: hold the reader back so the sender sees wire speed
+                time.sleep(len(chunk) * 10 / self.baudrate)
+
+    def _frame_done(self, kind, seq, rgb):
+        if self.width * self.height * 3 != len(rgb):
+            self.errors += 1
+            return
+        if seq is not None:
+            if self._last_seq is not None and seq != (self._last_seq + 1) & 0xFFFF:
+                self.seq_gaps += 1
+            self._last_seq = seq
+        self.frame = rgb
+        self.frames_by_type[kind] += 1
+        self.recv_log.append((self.frame_count, seq, time.perf_counter()))
+        self.frame_count += 1
+
+    def _resync(self):
+        # drop garbage up to the next plausible frame start
+        self.errors += 1
+        buf = self._buf
+        starts = [i for i in (buf.find(b":", 1), buf.find(BINARY_MAGIC, 1), buf.find(b"?", 1)) if i > 0]
+        del buf[:min(starts) if starts else len(buf)]
+
+    def _decode(self):
+        buf = self._buf
+        while buf:
+            if buf[:1] == b":":
+                end = buf.find(b"\n")
+                if end < 0:
+                    return
+                try:
+                    rgb = bytes.fromhex(buf[1:end].decode("ascii"))
+                except ValueError:
+                    rgb = None
+                del buf[:end + 1]
+                if rgb is None:
+                    self.errors += 1
+                else:
+                    self._frame_done("ascii", None, rgb)
+            elif buf[:2] == BINARY_MAGIC:
+                try:
+                    found = decode_binary(buf)
+                except ValueError:
+                    self._resync()
+                    continue
+                if found is None:
+                    return
+                frame_type, seq, w, h, payload, used = found
+                del buf[:used]
+                try:
+                    rgb = apply_frame(self.frame, frame_type, payload, w * h)
+                except ValueError:
+                    self.errors += 1
+                    continue
+                self._frame_done(FRAME_NAMES[frame_type], seq, rgb)
+            elif buf[:1] == b"?":
+                end = buf.find(b"\n")
+                if end < 0:
+                    return
+                line = bytes(buf[:end + 1])
+                del buf[:end + 1]
+                if line == BINARY_HELLO and self.binary_version:
+                    os.write(self.master, BINARY_HELLO_REPLY + str(self.binary_version).encode("ascii") + b"\n")
+            elif buf[:1] == BINARY_MAGIC[:1] and len(buf) < 2:
+                return
+            else:
+                self._resync()
+
+    def stats(self):
+        elapsed = (self._t_last - self._t_first) if self._t_first is not None else 0.0
+        return {
+            "path": self.path,
+            "bytes": self.bytes,
+            "frames": self.frame_count,
+            "frames_by_type": dict(self.frames_by_type),
+            "decode_errors": self.errors,
+            "seq_gaps": self.seq_gaps,
+            "bytes_per_s": self.bytes / elapsed if elapsed else 0.0,
+            "frames_per_s": self.frame_count / elapsed if elapsed else 0.0,
+        }
+
+def latency_ms(sent_log, recv_log):
+    """
+    Submit-to-decode latency per frame, matching the sink's sent_log with the
+    emulator's recv_log by sequence stamp (binary) or by order (ASCII).
+    """
+    recv_by_seq = {}
+    for index, seq, t in recv_log:
+        if seq is not None:
+            recv_by_seq[seq] = t
+    out = []
+    for index, seq, t_submit, t_written in sent_log:
+        if seq is not None:
+            t = recv_by_seq.get(seq)
+        else:
+            t = recv_log[index][2] if index < len(recv_log) else None
+        if t is not None:
+            out.append((t - t_submit) * 1e3)
+    return out
+
+def _percentiles(values, ps=(50, 95, 99)):
+    v = sorted(values)
+    if not v:
+        return {}
+    out = {f"p{p}": v[min(len(v) - 1, len(v) * p // 100)] for p in ps}
+    out["max"] = v[-1]
+    return out
+
+def _feed(sink, width, height, fps, seconds, seed):
+    # seeded game frames at `fps` through the compositor into `sink`
+    from rules.tetris_rules import RulesEngine
+    from sim.tetris_sim import TetrisSim
+    from renderer.compositor import FrameCompositor
+    from renderer.usb_frame import send_frame
+
+    rng = random.Random(seed)
+    sim = TetrisSim(RulesEngine(width, height, rng=random.Random(seed)))
+    comp = FrameCompositor(width, height, "tetris")
+    period = 1.0 / fps
+    t_next = time.perf_counter()
+    t_end = t_next + seconds
+    while time.perf_counter() < t_end:
+        if sim.is_game_over:
+            sim.reset()
+        r = rng.random()
+        if r < 0.05:
+            sim.move(rng.choice((-1, 1)))
+        elif r < 0.08:
+            sim.rotate()
+        elif r < 0.09:
+            sim.hard_drop()
+        sim.update(period, soft_hold=rng.random() < 0.3)
+        send_frame(sink, comp.compose(sim.rules), width, height)
+        t_next += period
+        delay = t_next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+def _drain(emus, sent, timeout=5.0):
+    # let the emulators decode what is still in the ptys
+    deadline = time.perf_counter() + timeout
+    while any(emu.frame_count < sent for emu in emus) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+def load_test(protocol="auto", fps=60, seconds=5.0, width=10, height=20,
+              binary_version=BINARY_VERSION, baudrate=None, seed=0):
+    """
+    Feed seeded game frames at `fps` through the real output pipeline into an
+    emulator and return one JSON-able report.
+    """
+    from renderer.usb_frame import try_open, FrameLink, SerialFrameSink
+
+    emu = PanelEmulator(width, height, binary_version, baudrate).start()
+    port = try_open(emu.path)
+    if port is None:
+        emu.stop()
+        raise RuntimeError(f"could not open emulator pty {emu.path}")
+    sink = SerialFrameSink(FrameLink(port, protocol), log_sent=True)
+    _feed(sink, width, height, fps, seconds, seed)
+    sink.close(timeout=5.0)
+    _drain([emu], sink.sent)
+    report = {
+        "config": {"protocol": protocol, "fps": fps, "seconds": seconds, "width": width,
+                   "height": height, "binary_version": binary_version, "baudrate": baudrate},
+        "negotiated": "binary v%d" % sink.link.version if sink.binary else "ascii",
+        "sink": sink.stats(),
+        "emulator": emu.stats(),
+        "latency_ms": _percentiles(latency_ms(sink.sent_log, emu.recv_log)),
+    }
+    emu.stop()
+    return report
+
+def wall_load_test(tiles, protocol="auto", fps=60, seconds=5.0, width=10, height=20,
+                   binary_version=BINARY_VERSION, baudrate=None, seed=0):
+    """
+    Same as load_test, into a LedWall of `tiles` emulated tiles (horizontal
+    bands, every other one mounted upside down and serpentine-wired).
+    Latency is to the last tile showing a frame; skew is last minus first.
+    """
+    import tempfile
+    from renderer.led_wall import open_wall
+
+    if not 1 <= tiles <= height:
+        raise ValueError(f"can not split {height} rows into {tiles} tiles")
+    bounds = [height * i // tiles for i in range(tiles + 1)]
+    emus = [PanelEmulator(width, bounds[i + 1] - bounds[i], binary_version, baudrate).start()
+            for i in range(tiles)]
+    layout = {"width": width, "height": height, "tiles": [
+        {"port": emu.path, "x": 0, "y": bounds[i], "width": width, "height": bounds[i + 1] - bounds[i],
+         "rotate": 180 if i % 2 else 0, "serpentine": bool(i % 2)}
+        for i, emu in enumerate(emus)]}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(layout, f)
+    try:
+        wall = open_wall(f.name, protocol, log_sent=True)
+    finally:
+        os.unlink(f.name)
+    if wall is None:
+        for emu in emus:
+            emu.stop()
+        raise RuntimeError("could not open the emulated wall")
+    _feed(wall, width, height, fps, seconds, seed)
+    wall.close(timeout=5.0)
+    _drain(emus, wall.sent)
+
+    # when each tile showed each wall frame: by link seq for binary, by order for ASCII
+    shown = []
+    for i, emu in enumerate(emus):
+        by_seq = {seq: t for _, seq, t in emu.recv_log if seq is not None}
+        times = []
+        for index, seqs, _, _ in wall.sent_log:
+            if seqs[i] is not None:
+                times.append(by_seq.get(seqs[i]))
+            else:
+                times.append(emu.recv_log[index][2] if index < len(emu.recv_log) else None)
+        shown.append(times)
+    latency, skew = [], []
+    for k, (_, _, t_submit, _) in enumerate(wall.sent_log):
+        ts = [times[k] for times in shown]
+        if None in ts:
+            continue
+        latency.append((max(ts) - t_submit) * 1e3)
+        skew.append((max(ts) - min(ts)) * 1e3)
+    report = {
+        "config": {"tiles": tiles, "protocol": protocol, "fps": fps, "seconds": seconds,
+                   "width": width, "height": height, "binary_version": binary_version,
+                   "baudrate": baudrate},
+        "wall": wall.stats(),
+        "emulators": [emu.stats() for emu in emus],
+        "latency_ms": _percentiles(latency),
+        "skew_ms": _percentiles(skew),
+    }
+    for emu in emus:
+        emu.stop()
+    return report
+
+def serve(width, height, binary_version, baudrate, window):
+    emu = PanelEmulator(width, height, binary_version, baudrate).start()
+    print(f"Panel emulator listening on {emu.path} ({width}x{height}); "
+          f"run: python main.py --usb-port {emu.path}", flush=True)
+    view = screen = None
+    if window:
+        import numpy as np
+        import pygame
+        from renderer.pygame_display import CellRenderer, present
+        pygame.init()
+        screen = pygame.display.set_mode((width * 24, height * 24))
+        pygame.display.set_caption(f"LED panel emulator - {emu.path}")
+        view = CellRenderer(24)
+    t_report = time.perf_counter() + 1.0
+    try:
+        while True:
+            if view is not None:
+                for ev in pygame.event.get():
+                    if ev.type == pygame.QUIT:
+                        return
+                    if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                        view.invalidate()
+                if emu.frame is not None:
+                    rgb = np.frombuffer(emu.frame, dtype=np.uint8).reshape(height, width, 3)
+                    present(view.draw(screen, rgb))
+                time.sleep(1 / 60)
+            else:
+                time.sleep(0.1)
+            if time.perf_counter() >= t_report:
+                t_report += 1.0
+                print(json.dumps(emu.stats()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emu.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pty-backed LED panel emulator")
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--height", type=int, default=20)
+    parser.add_argument("--binary-version", type=int, default=BINARY_VERSION,
+                        help="version to answer the handshake with (0 = ASCII-only firmware)")
+    parser.add_argument("--baud", type=int, default=None, help="throttle reads to this baud rate")
+    parser.add_argument("--window", action="store_true", help="show decoded frames in a pygame window")
+    parser.add_argument("--load-test", action="store_true", help="drive the output pipeline into it and report")
+    parser.add_argument("--tiles", type=int, default=1,
+                        help="load-test a LedWall of this many emulated tiles (horizontal bands)")
+    parser.add_argument("--protocol", choices=["auto","ascii","binary"], default="auto")
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--json", default=None, help="write the load-test report here too")
+    args = parser.parse_args()
+    if args.load_test:
+        if args.tiles > 1:
+            report = wall_load_test(args.tiles, args.protocol, args.fps, args.seconds, args.width,
+                                    args.height, args.binary_version, args.baud)
+        else:
+            report = load_test(args.protocol, args.fps, args.seconds, args.width, args.height,
+                               args.binary_version, args.baud)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.json:
+            with open(args.json, "w") as f:
+                f.write(text + "\n")
+    else:
+        serve(args.width, args.height, args.binary_version, args.baud, args.window)
@@ -1,68 +1,30 @@
 import pygame
+import profiling
+from renderer.compositor import FrameCompositor
+from renderer.pygame_display import CellRenderer, TextCache, present
 
-# Move these utility functions here from main.py to break the circular dependency.
-def build_frame_from_rules(rules_engine):
-    w = rules_engine.width
-    h = rules_engine.height
-    buf = [[None for _ in range(w)] for __ in range(h)]
-    bd = rules_engine.get_board()
-    for y in range(h):
-        for x in range(w):
-            buf[y][x] = bd[y][x]
-    for (x, y, ch) in rules_engine.get_ghost_cells():
-        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
-            buf[y][x] = ch
-    for (x, y, ch) in rules_engine.get_current_cells():
-        if 0 <= y < h and 0 <= x < w:
-            buf[y][x] = ch
-    for (x, y, ch) in rules_engine.get_preview_cells():
-        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
-            buf[y][x] = ch
-    return buf
-
-COLORS_TET = {
-    "I": (0,255,255),"O":(255,255,0),"T":(160,0,160),
-    "S":(0,255,0),"Z":(255,0,0),"J":(0,0,255),"L":(255,128,0),"X":(120,120,120)
-}
-COLORS_TRI = {
-    "I": (20,20,255), "L": (255,20,16), "D": (20,255,20), "x": (12,12,12)
-}
-
-def frame_to_rgb(frame, mode):
-    h = len(frame); w = len(frame[0])
-    out = []
-    for y in range(h):
-        row = []
-        for x in range(w):
-            cell = frame[y][x]
-            if cell is None:
-                row.append((0,0,0))
-            else:
-                ch = str(cell).upper()
-                if str(cell).islower():
-                    col = (10,10,10)
-                else:
-                    if mode == "tetris":
-                        col = COLORS_TET.get(ch, (120,120,120))
-                    else:
-                        col = COLORS_TRI.get(ch, (120,120,120))
-                row.append(col)
-        out.append(row)
-    return out
+# HUD text is rendered once per distinct string, not every frame
+HUD_TEXT = TextCache(20)
 
 # Avoid name clash with possible installed 'gameplay' modules
-def run_gameplay(screen, sim, rules, mode, usb, last_input_time):
+def run_gameplay(screen, sim, rules, mode, usb, last_input_time,
+                 steps=1, dt=1/60, render=True, panel=True):
+    # steps fixed logic steps of dt seconds, then draw the window if render
+    # and send to the LED panel if panel (see sim/frame_clock.py)
     PIX = 24 if mode == "tetris" else 48
-    small_font = pygame.font.SysFont(None, 20)
+    prof = profiling.PROFILER
     hat_left = False
     hat_right = False
     hat_down = False
+    exposed = False
 
     # Handle events
     for ev in pygame.event.get():
         if ev.type == pygame.QUIT:
             pygame.quit()
             exit(0)
+        elif ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            exposed = True
         elif ev.type == pygame.KEYDOWN:
             last_input_time = pygame.time.get_ticks() / 1000.0
             if ev.key == pygame.K_ESCAPE:
@@ -122,25 +84,43 @@ def run_gameplay(screen, sim, rules, mode, usb, last_input_time):
 
     keys = pygame.key.get_pressed()
     soft = keys[pygame.K_DOWN] or hat_down
+    prof.lap("input")
 
-    sim.update(1/60, soft_hold=soft)
-
+    for _ in range(steps):
+        sim.update(dt, soft_hold=soft)
+        if sim.is_game_over:
+            break
+    prof.lap("sim")
     if sim.is_game_over:
         return False, last_input_time
 
-    frame = build_frame_from_rules(rules)
-    rgb = frame_to_rgb(frame, mode)
+    if not (render or panel):
+        return True, last_input_time
+
+    # one compositor and cell renderer per board, kept across frames like
+    # the screensaver's state
+    comp = getattr(run_gameplay, "compositor", None)
+    if comp is None or (comp.width, comp.height, comp.mode) != (rules.width, rules.height, mode):
+        comp = run_gameplay.compositor = FrameCompositor(rules.width, rules.height, mode)
+        run_gameplay.view = CellRenderer(PIX, (0, 0), (8,8,8), comp.palette)
+    view = run_gameplay.view
+    if exposed:
+        view.invalidate()
+    rgb = comp.compose(rules)
+    prof.lap("compose")
 
-    if usb:
+    if usb and panel:
         from renderer.usb_frame import send_frame
         send_frame(usb, rgb, rules.width, rules.height)
+        prof.lap("send")
 
-    screen.fill((8,8,8))
-    for y in range(rules.height):
-        for x in range(rules.width):
-            r,g,b = rgb[y][x]
-            pygame.draw.rect(screen, (r,g,b), (x*PIX, y*PIX, PIX-1, PIX-1))
-    text = small_font.render(f"Mode: {mode}", True, (200,200,200))
-    screen.blit(text, (rules.width*PIX + 10, 10))
-    pygame.display.flip()
+    if not render:
+        return True, last_input_time
+    # only changed cells are redrawn; the HUD only after a full redraw
+    rects = view.draw(screen, rgb)
+    if rects is None:
+        screen.blit(HUD_TEXT.render(f"Mode: {mode}", (200,200,200)), (rules.width*PIX + 10, 10))
+    prof.lap("draw")
+    present(rects)
+    prof.lap("present")
     return True, last_input_time
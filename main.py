@@ -1,9 +1,16 @@
 # main.py
-import argparse, time, pygame, math
+import argparse, time, pygame, math, random
+import profiling
 from rules.tetris_rules import RulesEngine as TetrisRules
 from rules.tritris_rules import TritrisRules
+from rules.bitboard_rules import BitboardRulesEngine, BitboardTritrisRules
+from rules.randomizer import RANDOMIZERS, make_randomizer
 from sim.tetris_sim import TetrisSim
-from renderer.usb_frame import try_open, send_frame
+from sim.replay import RecordingSim
+from sim.frame_clock import FixedStepClock
+from renderer.usb_frame import try_open, send_frame, FrameLink, SerialFrameSink
+from renderer.led_wall import open_wall
+from renderer.pygame_display import ProfileOverlay, set_overlay
 
 from gameplay import run_gameplay
 from screensaver import run_screensaver
@@ -19,17 +26,55 @@ DEFAULT_MODE = "tetris"  # or "tritris"
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", choices=["tetris","tritris"], default=DEFAULT_MODE)
+    parser.add_argument("--bitboard", action="store_true",
+                        help="no effect: every rules engine uses the bitmask board now")
+    parser.add_argument("--randomizer", choices=list(RANDOMIZERS), default="bag",
+                        help="piece randomizer (see rules/randomizer.py)")
+    parser.add_argument("--seed", type=int, default=None, help="piece seed; default unseeded")
+    parser.add_argument("--record", default=None, metavar="FILE",
+                        help="record the game's inputs for python -m sim.replay")
+    parser.add_argument("--usb-protocol", choices=["auto","ascii","binary"], default="auto",
+                        help="LED panel frame encoding (auto = handshake, ASCII fallback)")
+    parser.add_argument("--usb-port", default="COM10",
+                        help="LED panel serial port (a pty path works too, see bench/panel_emulator.py)")
+    parser.add_argument("--wall", default=None, metavar="LAYOUT",
+                        help="drive a wall of LED tiles described by this JSON layout instead (see renderer/led_wall.py)")
+    parser.add_argument("--logic-hz", type=int, default=60, help="fixed game logic rate")
+    parser.add_argument("--render-hz", type=int, default=60, help="window redraw rate")
+    parser.add_argument("--panel-hz", type=int, default=60,
+                        help="LED panel frame rate; lower it to what the serial link sustains")
+    parser.add_argument("--max-substeps", type=int, default=5,
+                        help="logic steps run per frame at most when catching up")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each frame stage, show p50/p95/p99 on screen, dump on exit")
+    parser.add_argument("--profile-out", default="profile.json")
+    parser.add_argument("--profile-format", choices=["json","chrome"], default="json",
+                        help="stage summary, or a Chrome trace (chrome://tracing, Perfetto)")
     args = parser.parse_args()
 
     mode = args.mode
+    if args.record and args.seed is None:
+        # a replay needs the piece stream, so recorded games are always seeded
+        args.seed = random.randrange(1 << 31)
+        print("Piece seed:", args.seed)
+    rng = make_randomizer(args.randomizer, args.seed)
     if mode == "tetris":
-        rules = TetrisRules(10,20)
+        rules = BitboardRulesEngine(10,20, rng) if args.bitboard else TetrisRules(10,20, rng)
     else:
-        rules = TritrisRules(4,5)
+        rules = BitboardTritrisRules(4,5, rng) if args.bitboard else TritrisRules(4,5, rng)
 
     sim = TetrisSim(rules)
-    usb = try_open()
-    print("USB device:", "found" if usb else "none")
+    if args.record:
+        sim = RecordingSim(sim, args.record)
+    if args.wall:
+        usb = open_wall(args.wall, args.usb_protocol)
+        print("LED wall:", f"{len(usb.links)} tiles" if usb else "none")
+    else:
+        usb = try_open(args.usb_port)
+        print("USB device:", "found" if usb else "none")
+        if usb:
+            usb = SerialFrameSink(FrameLink(usb, args.usb_protocol))
+            print("USB frame protocol:", "binary" if usb.binary else "ascii")
 
     pygame.init()
     pygame.joystick.init()
@@ -42,6 +87,9 @@ def main():
     screen = pygame.display.set_mode((rules.width*PIX + 160, rules.height*PIX))
     pygame.display.set_caption(f"{mode} - hybrid renderer")
     clock = pygame.time.Clock()
+    frames = FixedStepClock(args.logic_hz, args.render_hz, args.panel_hz, args.max_substeps)
+    if args.profile:
+        set_overlay(ProfileOverlay(profiling.enable().overlay_lines))
 
     # Screensaver state
     screensaver_active = False
@@ -52,34 +100,51 @@ def main():
     # Subscreen Tetris for screensaver
     SS_W, SS_H = 6, 15
 
-    running = True
-    while running:
-        dt = clock.tick(60) / 1000.0
-        now = time.time()
-
-        # Screensaver activation
-        if not screensaver_active and not game_active and (now - last_input_time > SCREENSAVER_TIMEOUT):
-            screensaver_active = True
-
-        if screensaver_active:
-            # Returns True if screensaver should exit (on user input)
-            screensaver_active = not run_screensaver(
-                screen, usb, SS_W, SS_H, last_input_time
+    # the event handlers leave through exit(), so report from a finally
+    try:
+        running = True
+        while running:
+            prof = profiling.PROFILER
+            prof.end_frame()
+            clock.tick(frames.loop_hz)
+            prof.start_frame()
+            steps, render, panel = frames.tick()
+            now = time.time()
+
+            # Screensaver activation
+            if not screensaver_active and not game_active and (now - last_input_time > SCREENSAVER_TIMEOUT):
+                screensaver_active = True
+
+            if screensaver_active:
+                # Returns True if screensaver should exit (on user input)
+                screensaver_active = not run_screensaver(
+                    screen, usb, SS_W, SS_H, last_input_time,
+                    steps, frames.dt, render, panel
+                )
+                if not screensaver_active:
+                    game_active = True
+                    last_input_time = time.time()
+                continue
+
+            if not game_active:
+                screensaver_active = True
+                continue
+
+            # Returns True if game is still running, False if game over
+            game_active, last_input_time = run_gameplay(
+                screen, sim, rules, mode, usb, last_input_time,
+                steps, frames.dt, render, panel
             )
-            if not screensaver_active:
-                game_active = True
-                last_input_time = time.time()
-            continue
-
-        if not game_active:
-            screensaver_active = True
-            continue
-
-        # Returns True if game is still running, False if game over
-        game_active, last_input_time = run_gameplay(
-            screen, sim, rules, mode, usb, last_input_time
-        )
-
+    finally:
+        print("Frame timing:", frames.stats())
+        if args.record:
+            sim.close()
+            print(f"Recorded {sim.frame} frames to", args.record)
+        if args.profile and profiling.PROFILER.dump(args.profile_out, args.profile_format):
+            print("Profile written to", args.profile_out)
+        if usb:
+            usb.close()
+            print("USB frames:", usb.stats())
     pygame.quit()
 
 if __name__ == "__main__":
@@ -1,71 +1,515 @@
 # net/network.py
-import socket, threading, time, json
+# LAN peer discovery and garbage exchange over UDP broadcast.
+#
+# Wire format (version 2). Every datagram is a 12-byte header followed by
+# one or more messages, so whatever is waiting to go out shares a packet:
+#
+#   header   "KT" | version u8 | message count u8 | sender node u32 | datagram seq u32
+#   message  type u8 | payload length u16 | payload
+#
+#   HELLO    player id, name                                 (str = u8 length + UTF-8)
+#   GARBAGE  message id u32, lines u16, from id, to id
+#   ACK      acked node u32, count u8, count x message id u32
+#   BYE      (empty)
+#
+# The sender node is random per NetworkNode, so a restarted game is a new
+# sender. Datagram sequence numbers show duplicated and reordered packets
+# (counted in stats). GARBAGE is reliable: the target player acknowledges
+# it and the sender retransmits with backoff until it does (or gives up),
+# and the receiver delivers every message id once. Version 1 text messages
+# ("HELLO P1 Alice", "GARBAGE P1 P2 3") from older builds are still
+# understood.
+#
+# Threading: one event-loop thread per node blocks in a selector on all of
+# its sockets plus a wake-up socket, with a heap of timers (hellos,
+# retransmissions, peer expiry) for the select timeout; nothing polls.
+# Received garbage and peer changes go to a deque that the game loop drains
+# with poll() once per frame, so the callbacks run on the game thread and
+# the hot path takes no lock. send_garbage() hands off the same way.
+import collections, heapq, os, selectors, socket, struct, sys, threading, time
 
 BCAST_PORT_DEFAULT = 50000
 BCAST_ADDR_DEFAULT = "<broadcast>"
 
+MAGIC = b"KT"
+VERSION = 2
+HEADER = struct.Struct("<2sBBII")
+MSG = struct.Struct("<BH")
+U32 = struct.Struct("<I")
+GARBAGE = struct.Struct("<IH")
+ACK = struct.Struct("<IB")
+MSG_HELLO, MSG_GARBAGE, MSG_ACK, MSG_BYE = 1, 2, 3, 4
+MAX_DATAGRAM = 1200                     # stays under a typical LAN MTU
+MAX_ACKS = 255
+
+HELLO_INTERVAL = 5.0
+PEER_TIMEOUT = 3 * HELLO_INTERVAL       # a peer this quiet is dropped
+RETRANSMIT_TIMEOUT = 0.1                # doubled after every try, up to 1 s
+RETRANSMIT_TRIES = 8
+SEEN_WINDOW = 1024                      # message ids remembered per sender
+INBOX_WARN = 256                        # undelivered events before the poll() hint
+
+def _pack_str(s):
+    b = s.encode("utf-8")[:255]
+    return bytes((len(b),)) + b
+
+def _unpack_str(data, pos):
+    n = data[pos]
+    end = pos + 1 + n
+    if end > len(data):
+        raise ValueError("string runs past the message")
+    return data[pos + 1:end].decode("utf-8", "replace"), end
+
+def pack_messages(node, seq, messages):
+    """One datagram from (type, payload) pairs."""
+    body = b"".join(MSG.pack(t, len(p)) + p for t, p in messages)
+    return HEADER.pack(MAGIC, VERSION, len(messages), node, seq) + body
+
+def unpack_datagram(data):
+    """
+    (sender node, datagram seq, [(type, payload), ...]) for a version 2
+    datagram. Raises ValueError if it is not one.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("short datagram")
+    magic, version, count, node, seq = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("bad magic")
+    if version != VERSION:
+        raise ValueError(f"unsupported protocol version {version}")
+    pos = HEADER.size
+    messages = []
+    for _ in range(count):
+        if pos + MSG.size > len(data):
+            raise ValueError("truncated message header")
+        t, n = MSG.unpack_from(data, pos)
+        pos += MSG.size
+        if pos + n > len(data):
+            raise ValueError("truncated message")
+        messages.append((t, data[pos:pos + n]))
+        pos += n
+    return node, seq, messages
+
+class _Sender:
+    # what we know about one remote node
+    def __init__(self):
+        self.seq = None                 # highest datagram seq seen
+        self.player_id = None
+        self.seen = set()               # recent reliable message ids
+        self.order = collections.deque()
+
+    def first_time(self, msg_id):
+        if msg_id in self.seen:
+            return False
+        self.seen.add(msg_id)
+        self.order.append(msg_id)
+        if len(self.order) > SEEN_WINDOW:
+            self.seen.discard(self.order.popleft())
+        return True
+
 class NetworkNode:
-    def __init__(self, player_id, player_name, port=BCAST_PORT_DEFAULT, bcast_addr=BCAST_ADDR_DEFAULT):
+    """
+    links: list of (bind address, port, broadcast address[, send port]), one
+    socket each, for nodes on several interfaces or ports; the send port
+    defaults to the bound one. Default links: just (port, bcast_addr).
+
+    The owning loop must call poll() every frame: on_garbage and on_peer run
+    only from poll(), on the caller's thread, so a node nobody polls receives
+    everything and delivers nothing (it says so on stderr once the backlog
+    grows). peers is replaced, not changed in place, so the game can read it
+    freely.
+    """
+    def __init__(self, player_id, player_name, port=BCAST_PORT_DEFAULT, bcast_addr=BCAST_ADDR_DEFAULT,
+                 links=None):
         self.player_id = player_id
         self.player_name = player_name
         self.port = port
         self.bcast_addr = bcast_addr
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.sock.bind(("", port))
+        self.links = links or [("", port, bcast_addr)]
+        self._sel = selectors.DefaultSelector()
+        self.socks = []
+        for link in self.links:
+            host, lport, baddr = link[:3]
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            # several games on one machine all get the broadcasts
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, lport))
+            sock.setblocking(False)
+            self._sel.register(sock, selectors.EVENT_READ, (baddr, link[3] if len(link) > 3 else lport))
+            self.socks.append(sock)
+        self.sock = self.socks[0]
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
         self.running = False
+        self._thread = None
         self.peers = {}  # id -> (ip, last_seen, name)
         self.on_garbage = None  # callback (from_id, to_id, lines)
+        self.on_peer = None     # callback (id, (ip, last_seen, name) or None when it left)
+        self.node = U32.unpack(os.urandom(4))[0]
+        self.hello_interval = HELLO_INTERVAL
+        self.peer_timeout = PEER_TIMEOUT
+        # game thread <-> loop thread hand-off; deque appends/pops are atomic
+        self._inbox = collections.deque()
+        self._outbox = collections.deque()
+        self._polled = False
+        # loop thread only
+        self._seq = 0
+        self._msg_id = 0
+        self._senders = {}
+        self._timers = []               # heap of (when, n, fn, arg)
+        self._timer_n = 0
+        self._send = []                 # (type, payload) for the next flush
+        self._acks = {}                 # node -> message ids to acknowledge
+        self._pending = {}              # message id -> [payload, tries]
+        self._bad_from = set()
+        self.stats = {"datagrams_sent": 0, "datagrams_received": 0, "bytes_sent": 0,
+                      "messages_sent": 0, "messages_received": 0, "duplicates": 0,
+                      "reordered": 0, "retransmits": 0, "garbage_lost": 0, "bad": 0,
+                      "peers_expired": 0}
 
     def start(self):
         self.running = True
-        self._tx_hello()
-        t = threading.Thread(target=self._rx_loop, daemon=True)
-        t.start()
-        t2 = threading.Thread(target=self._hello_loop, daemon=True)
-        t2.start()
+        self._thread = threading.Thread(target=self._run, name="network", daemon=True)
+        self._thread.start()
 
-    def stop(self):
+    def stop(self, timeout=1.0):
+        # says BYE, closes the sockets; returns once the loop has exited
         self.running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self._close()
+
+    # --- game thread ---
 
-    def _hello_loop(self):
-        while self.running:
-            self._tx_hello()
-            time.sleep(5)
+    def poll(self):
+        """
+        Run the callbacks for everything received since the last call.
+        Returns the number of events handled.
+        """
+        self._polled = True
+        inbox = self._inbox
+        n = 0
+        while inbox:
+            kind, args = inbox.popleft()
+            cb = self.on_garbage if kind == MSG_GARBAGE else self.on_peer
+            if cb:
+                cb(*args)
+            n += 1
+        return n
 
-    def _tx_hello(self):
-        msg = f"HELLO {self.player_id} {self.player_name}"
+    def send_garbage(self, to_id, lines):
+        self._outbox.append((str(to_id), min(int(lines), 0xFFFF)))
+        self._wake()
+
+    def _wake(self):
         try:
-            self.sock.sendto(msg.encode("utf-8"), (self.bcast_addr, self.port))
-        except Exception:
-            pass
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass                        # already woken / closed
+
+    # --- loop thread ---
+
+    def _deliver(self, kind, args):
+        self._inbox.append((kind, args))
+        if not self._polled and len(self._inbox) == INBOX_WARN:
+            print(f"NetworkNode: {INBOX_WARN} events waiting and poll() never called; "
+                  "the game loop must call poll() every frame", file=sys.stderr)
 
-    def _rx_loop(self):
-        while self.running:
+    def _at(self, when, fn, arg=None):
+        self._timer_n += 1
+        heapq.heappush(self._timers, (when, self._timer_n, fn, arg))
+
+    def _run(self):
+        try:
+            self._hello()
+            while self.running:
+                self._take_outbox()
+                self._flush()
+                timeout = None
+                if self._timers:
+                    timeout = max(0.0, self._timers[0][0] - time.monotonic())
+                for key, _ in self._sel.select(timeout):
+                    if key.data is None:
+                        self._drain_wake()
+                    else:
+                        self._receive(key.fileobj)
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    _, _, fn, arg = heapq.heappop(self._timers)
+                    fn(arg)
+            self._take_outbox()
+            self._send.append((MSG_BYE, b""))
+            self._flush()
+        finally:
+            self._close()
+
+    def _close(self):
+        for sock in self.socks + [self._wake_r, self._wake_w]:
             try:
-                data, addr = self.sock.recvfrom(4096)
-                s = data.decode("utf-8", "replace").strip()
-                if s.startswith("HELLO"):
-                    parts = s.split(" ",2)
-                    if len(parts) >=3:
-                        pid = parts[1]; name = parts[2]
-                        self.peers[pid] = (addr[0], time.time(), name)
-                elif s.startswith("GARBAGE"):
-                    parts = s.split()
-                    # GARBAGE from to lines
-                    # example: GARBAGE P1 P2 3
-                    if len(parts) >=4:
-                        _, from_id, to_id, lines = parts[:4]
-                        lines = int(lines)
-                        if self.on_garbage:
-                            self.on_garbage(from_id, to_id, lines)
-                # ignore other messages
-            except Exception:
-                time.sleep(0.01)
+                sock.close()
+            except OSError:
+                pass
+        self._sel.close()
 
-    def send_garbage(self, to_id, lines):
-        msg = f"GARBAGE {self.player_id} {to_id} {int(lines)}"
+    def _drain_wake(self):
         try:
-            self.sock.sendto(msg.encode("utf-8"), (self.bcast_addr, self.port))
-        except Exception:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
             pass
+
+    def _hello(self, _=None):
+        self._send.append((MSG_HELLO, _pack_str(self.player_id) + _pack_str(self.player_name)))
+        self._at(time.monotonic() + self.hello_interval, self._hello)
+
+    def _take_outbox(self):
+        outbox = self._outbox
+        while outbox:
+            to_id, lines = outbox.popleft()
+            self._msg_id = msg_id = (self._msg_id + 1) & 0xFFFFFFFF
+            payload = GARBAGE.pack(msg_id, lines) + _pack_str(self.player_id) + _pack_str(to_id)
+            self._pending[msg_id] = [payload, 1]
+            self._send.append((MSG_GARBAGE, payload))
+            self._at(time.monotonic() + RETRANSMIT_TIMEOUT, self._retransmit, msg_id)
+
+    def _retransmit(self, msg_id):
+        entry = self._pending.get(msg_id)
+        if entry is None:
+            return                      # acknowledged
+        payload, tries = entry
+        if tries >= RETRANSMIT_TRIES:
+            del self._pending[msg_id]
+            self.stats["garbage_lost"] += 1
+            print(f"Garbage message {msg_id} was never acknowledged", file=sys.stderr)
+            return
+        self._send.append((MSG_GARBAGE, payload))
+        self.stats["retransmits"] += 1
+        entry[1] = tries + 1
+        self._at(time.monotonic() + min(1.0, RETRANSMIT_TIMEOUT * (2 ** tries)), self._retransmit, msg_id)
+
+    def _flush(self):
+        messages = self._send
+        for node, ids in self._acks.items():
+            for i in range(0, len(ids), MAX_ACKS):
+                chunk = ids[i:i + MAX_ACKS]
+                messages.append((MSG_ACK, ACK.pack(node, len(chunk)) + b"".join(U32.pack(m) for m in chunk)))
+        self._acks = {}
+        self._send = []
+        if not messages:
+            return
+        # as few datagrams as fit the size limit
+        batch, size = [], HEADER.size
+        for msg in messages:
+            n = MSG.size + len(msg[1])
+            if batch and (size + n > MAX_DATAGRAM or len(batch) == 255):
+                self._send_datagram(batch)
+                batch, size = [], HEADER.size
+            batch.append(msg)
+            size += n
+        self._send_datagram(batch)
+
+    def _send_datagram(self, messages):
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        data = pack_messages(self.node, self._seq, messages)
+        for sock in self.socks:
+            baddr, lport = self._sel.get_key(sock).data
+            try:
+                sock.sendto(data, (baddr, lport))
+            except OSError as e:
+                print("Failed to send network datagram:", e, file=sys.stderr)
+                continue
+            self.stats["datagrams_sent"] += 1
+            self.stats["bytes_sent"] += len(data)
+        self.stats["messages_sent"] += len(messages)
+
+    def _receive(self, sock):
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # e.g. ICMP port unreachable reported on Windows; keep going
+                print("Network receive failed:", e, file=sys.stderr)
+                return
+            try:
+                self._handle(data, addr)
+            except (ValueError, IndexError, struct.error) as e:
+                self.stats["bad"] += 1
+                if addr[0] not in self._bad_from:
+                    # once per address; a noisy host should not flood stderr
+                    self._bad_from.add(addr[0])
+                    print(f"Ignoring malformed datagram from {addr[0]}: {e}", file=sys.stderr)
+
+    def _seen_peer(self, pid, ip, name):
+        info = (ip, time.time(), name)
+        known = self.peers.get(pid)
+        # copy on write: the game thread may be reading the old dict
+        peers = dict(self.peers)
+        peers[pid] = info
+        self.peers = peers
+        if known is None or known[0] != ip or known[2] != name:
+            self._deliver(MSG_HELLO, (pid, info))
+        self._at(time.monotonic() + self.peer_timeout, self._expire, (pid, info[1]))
+
+    def _drop_peer(self, pid):
+        if pid in self.peers:
+            peers = dict(self.peers)
+            del peers[pid]
+            self.peers = peers
+            self._deliver(MSG_BYE, (pid, None))
+
+    def _expire(self, arg):
+        pid, seen = arg
+        info = self.peers.get(pid)
+        if info is not None and info[1] == seen:
+            # nothing heard since this timer was set
+            self.stats["peers_expired"] += 1
+            self._drop_peer(pid)
+
+    def _handle(self, data, addr):
+        if data[:6] in (b"HELLO ", b"GARBAG"):
+            self._handle_text(data, addr)
+            return
+        node, seq, messages = unpack_datagram(data)
+        if node == self.node:
+            return                      # our own broadcast
+        sender = self._senders.get(node)
+        if sender is None:
+            sender = self._senders[node] = _Sender()
+        if sender.seq is not None:
+            delta = (seq - sender.seq) & 0xFFFFFFFF
+            if delta == 0:
+                self.stats["duplicates"] += 1
+            elif delta >= 0x80000000:
+                self.stats["reordered"] += 1
+            else:
+                sender.seq = seq
+        else:
+            sender.seq = seq
+        self.stats["datagrams_received"] += 1
+        for t, payload in messages:
+            self.stats["messages_received"] += 1
+            if t == MSG_HELLO:
+                pid, pos = _unpack_str(payload, 0)
+                name, _ = _unpack_str(payload, pos)
+                self._seen_peer(pid, addr[0], name)
+                sender.player_id = pid
+            elif t == MSG_GARBAGE:
+                msg_id, lines = GARBAGE.unpack_from(payload)
+                from_id, pos = _unpack_str(payload, GARBAGE.size)
+                to_id, _ = _unpack_str(payload, pos)
+                if to_id == self.player_id:
+                    self._acks.setdefault(node, []).append(msg_id)
+                if not sender.first_time(msg_id):
+                    self.stats["duplicates"] += 1
+                else:
+                    self._deliver(MSG_GARBAGE, (from_id, to_id, lines))
+            elif t == MSG_ACK:
+                acked, count = ACK.unpack_from(payload)
+                if acked == self.node:
+                    for msg_id in struct.unpack_from(f"<{count}I", payload, ACK.size):
+                        self._pending.pop(msg_id, None)
+            elif t == MSG_BYE:
+                self._senders.pop(node, None)
+                if sender.player_id is not None:
+                    self._drop_peer(sender.player_id)
+            # unknown types are skipped, so newer peers can add messages
+
+    def _handle_text(self, data, addr):
+        # version 1 peers
+        s = data.decode("utf-8", "replace").strip()
+        if s.startswith("HELLO"):
+            parts = s.split(" ", 2)
+            if len(parts) >= 3:
+                self._seen_peer(parts[1], addr[0], parts[2])
+        elif s.startswith("GARBAGE"):
+            parts = s.split()
+            if len(parts) >= 4:
+                _, from_id, to_id, lines = parts[:4]
+                self._deliver(MSG_GARBAGE, (from_id, to_id, int(lines)))
+
+if __name__ == "__main__":
+    # Loopback self-check: python -m net.network
+    # Two nodes on 127.0.0.1 (each sends to the other's port), plus a raw
+    # socket posing as a third node that sends duplicated and malformed
+    # datagrams and then falls silent.
+    def free_port():
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+        s.close()
+        return port
+
+    def wait(node, cond, limit=2.0):
+        # poll like a game loop until cond() holds
+        end = time.monotonic() + limit
+        while not cond():
+            if time.monotonic() > end:
+                return False
+            node.poll()
+            time.sleep(0.005)
+        return True
+
+    pa, pb = free_port(), free_port()
+    a = NetworkNode("A", "Alice", links=[("127.0.0.1", pa, "127.0.0.1", pb)])
+    b = NetworkNode("B", "Bob", links=[("127.0.0.1", pb, "127.0.0.1", pa)])
+    a.hello_interval = 0.05             # keeps A alive at B
+    b.peer_timeout = 0.3
+    got, left_b, left_a = [], [], []
+    b.on_garbage = lambda from_id, to_id, lines: got.append((from_id, to_id, lines))
+    b.on_peer = lambda pid, info: info is None and left_b.append(pid)
+    a.on_peer = lambda pid, info: info is None and left_a.append(pid)
+    a.start()
+    b.start()
+    assert wait(b, lambda: "A" in b.peers), "B never saw A's hello"
+    assert wait(a, lambda: "B" in a.peers), "A never saw B's hello"
+
+    for lines in range(1, 21):
+        a.send_garbage("B", lines)
+    assert wait(b, lambda: len(got) >= 20), f"only {len(got)} of 20 garbage messages arrived"
+
+    fake = 0x0BADF00D
+    g = GARBAGE.pack(7, 3) + _pack_str("C") + _pack_str("B")
+    once = pack_messages(fake, 2, [(MSG_GARBAGE, g), (MSG_GARBAGE, g)])
+    chaos = [
+        pack_messages(fake, 1, [(MSG_HELLO, _pack_str("C") + _pack_str("Carol"))]),
+        once, once, once,                                   # duplicated datagram
+        pack_messages(fake, 3, [(MSG_GARBAGE, g)]),         # retransmission
+        b"KT\x02\x01xx",                                    # short
+        b"\xff" * 40,                                       # bad magic
+        pack_messages(fake, 4, [(MSG_GARBAGE, g[:5])]),     # truncated payload
+        HEADER.pack(MAGIC, VERSION, 3, fake, 5) + MSG.pack(MSG_GARBAGE, 900),
+    ]
+    raw = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    bad = b.stats["bad"]
+    for data in chaos:
+        raw.sendto(data, ("127.0.0.1", pb))
+    raw.close()
+    assert wait(b, lambda: "C" in b.peers and b.stats["bad"] - bad == 4), "B missed the raw datagrams"
+    time.sleep(0.05)
+    b.poll()
+    assert sorted(lines for f, _, lines in got if f == "A") == list(range(1, 21)), got
+    assert [x for x in got if x[0] == "C"] == [("C", "B", 3)], "garbage from C not delivered exactly once"
+
+    # C says nothing more; A keeps saying hello
+    assert wait(b, lambda: "C" in left_b), "silent peer C never expired"
+    assert "A" in b.peers and "A" not in left_b, "A expired although it kept saying hello"
+
+    # B's next timer is its 5 s hello; stop() must not wait for it
+    t = time.perf_counter()
+    b.stop()
+    stop_ms = (time.perf_counter() - t) * 1000
+    assert stop_ms < 100, f"stop() took {stop_ms:.0f} ms"
+    assert wait(a, lambda: "B" in left_a), "A never saw B's BYE"
+    a.stop()
+    print(f"delivery: {len(got)} garbage messages, each once; "
+          f"duplicates {b.stats['duplicates']}, malformed {b.stats['bad']}")
+    print(f"expiry: C dropped after {b.peer_timeout} s of silence, A kept")
+    print(f"stop(): {stop_ms:.1f} ms, BYE seen by the peer")
@@ -0,0 +1,157 @@
+# profiling.py
+# Per-stage frame profiler for main.py --profile. Hot paths call
+# PROFILER.lap(stage), which charges the time since the previous lap to that
+# stage. Durations go into fixed-size perf_counter_ns ring buffers (per-stage
+# percentiles) plus one shared event ring for a Chrome trace. While disabled,
+# PROFILER is a _NullProfiler whose methods do nothing, so instrumented code
+# costs one attribute lookup and an empty call per lap.
+# Callers must look up profiling.PROFILER at call time (not import it by
+# name), since enable() replaces it.
+import json, sys, time
+from array import array
+
+perf_counter_ns = time.perf_counter_ns
+
+class _NullProfiler:
+    enabled = False
+
+    def start_frame(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def end_frame(self):
+        pass
+
+class _Ring:
+    __slots__ = ("data", "size", "pos", "count")
+
+    def __init__(self, size):
+        self.data = array("q", bytes(8 * size))
+        self.size = size
+        self.pos = 0
+        self.count = 0
+
+    def add(self, value):
+        self.data[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count += 1
+
+    def values(self):
+        if self.count >= self.size:
+            return self.data[self.pos:] + self.data[:self.pos]
+        return self.data[:self.pos]
+
+class FrameProfiler:
+    enabled = True
+
+    def __init__(self, size=2048, events=32768):
+        self.size = size
+        self.rings = {}              # stage -> _Ring of durations (ns)
+        self.stage_ids = {}          # stage -> small int for the event ring
+        self.ev_stage = array("h", bytes(2 * events))
+        self.ev_start = array("q", bytes(8 * events))
+        self.ev_dur = array("q", bytes(8 * events))
+        self.ev_size = events
+        self.ev_pos = 0
+        self.ev_count = 0
+        self.t0 = perf_counter_ns()
+        self._last = self.t0
+        self._frame_start = self.t0
+        self._in_frame = False
+        self.frames = 0
+
+    def _record(self, stage, start, dur):
+        ring = self.rings.get(stage)
+        if ring is None:
+            ring = self.rings[stage] = _Ring(self.size)
+            self.stage_ids[stage] = len(self.stage_ids)
+        ring.add(dur)
+        i = self.ev_pos
+        self.ev_stage[i] = self.stage_ids[stage]
+        self.ev_start[i] = start
+        self.ev_dur[i] = dur
+        self.ev_pos = (i + 1) % self.ev_size
+        self.ev_count += 1
+
+    def start_frame(self):
+        # time since the previous end_frame (sleeping in clock.tick) is "idle"
+        now = perf_counter_ns()
+        self._record("idle", self._last, now - self._last)
+        self._frame_start = self._last = now
+        self._in_frame = True
+
+    def lap(self, stage):
+        now = perf_counter_ns()
+        self._record(stage, self._last, now - self._last)
+        self._last = now
+
+    def end_frame(self):
+        if not self._in_frame:
+            return
+        self._in_frame = False
+        now = perf_counter_ns()
+        self._record("frame", self._frame_start, now - self._frame_start)
+        self._last = now
+        self.frames += 1
+
+    def percentiles(self, stage, ps=(50, 95, 99)):
+        v = sorted(self.rings[stage].values())
+        if not v:
+            return {f"p{p}": 0.0 for p in ps}
+        return {f"p{p}": v[min(len(v) - 1, len(v) * p // 100)] / 1e6 for p in ps}
+
+    def summary(self):
+        # per-stage ms statistics over the ring buffers' current contents
+        out = {}
+        for stage, ring in self.rings.items():
+            v = ring.values()
+            stats = self.percentiles(stage)
+            stats["avg"] = sum(v) / len(v) / 1e6 if len(v) else 0.0
+            stats["max"] = max(v) / 1e6 if len(v) else 0.0
+            stats["count"] = ring.count
+            out[stage] = stats
+        return out
+
+    def overlay_lines(self):
+        lines = ["stage    p50   p95   p99 ms"]
+        for stage in self.rings:
+            p = self.percentiles(stage)
+            lines.append(f"{stage:<7}{p['p50']:6.2f}{p['p95']:6.2f}{p['p99']:6.2f}")
+        return lines
+
+    def chrome_trace(self):
+        names = {i: s for s, i in self.stage_ids.items()}
+        n = min(self.ev_count, self.ev_size)
+        first = self.ev_pos - n
+        events = []
+        for k in range(first, self.ev_pos):
+            i = k % self.ev_size
+            stage = names[self.ev_stage[i]]
+            events.append({
+                "name": stage, "ph": "X", "pid": 1,
+                # idle and the whole frame get their own rows
+                "tid": 0 if stage == "frame" else (2 if stage == "idle" else 1),
+                "ts": (self.ev_start[i] - self.t0) / 1e3,
+                "dur": self.ev_dur[i] / 1e3,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path, fmt="json"):
+        data = self.chrome_trace() if fmt == "chrome" else {
+            "frames": self.frames, "ring_size": self.size, "stages_ms": self.summary()}
+        try:
+            with open(path, "w") as f:
+                json.dump(data, f)
+        except OSError as e:
+            print(f"Failed to write profile to {path}: {e}", file=sys.stderr)
+            return False
+        return True
+
+PROFILER = _NullProfiler()
+
+def enable(size=2048, events=32768):
+    global PROFILER
+    PROFILER = FrameProfiler(size, events)
+    return PROFILER
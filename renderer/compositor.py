@@ -0,0 +1,148 @@
+# renderer/compositor.py
+# Shared frame compositor for the pygame window and the LED panel. The board,
+# ghost, current piece and next-piece preview are kept in a persistent uint8
+# palette-index buffer and mapped to RGB through a palette LUT; each frame
+# only rewrites the cells rules.tracking.DirtyCells reports as changed.
+# compose() returns the same (height, width, 3) uint8 array every call:
+# draw it with renderer.pygame_display.CellRenderer.draw and hand it to
+# send_frame as is (frame_bytes uses tobytes()). Nothing here imports pygame.
+import numpy as np
+
+from rules.tracking import DirtyCells
+
+COLORS_TET = {
+    "I": (0,255,255),"O":(255,255,0),"T":(160,0,160),
+    "S":(0,255,0),"Z":(255,0,0),"J":(0,0,255),"L":(255,128,0),"X":(120,120,120)
+}
+COLORS_TRI = {
+    "I": (20,20,255), "L": (255,20,16), "D": (20,255,20), "x": (12,12,12)
+}
+MODE_COLORS = {"tetris": COLORS_TET, "tritris": COLORS_TRI}
+
+EMPTY_COLOR = (0,0,0)
+GHOST_COLOR = (10,10,10)     # ghost and preview cells (lower-case piece names)
+UNKNOWN_COLOR = (120,120,120)
+
+EMPTY = 0
+GHOST = 1
+
+class _PaletteCodes(dict):
+    # cell value -> palette index, filled in on first sight of each value
+    def __init__(self, names, unknown):
+        super().__init__({None: EMPTY})
+        self.names = names
+        self.unknown = unknown
+
+    def __missing__(self, cell):
+        s = str(cell)
+        if s.islower():
+            code = GHOST
+        else:
+            code = self.names.get(s.upper(), self.unknown)
+        self[cell] = code
+        return code
+
+class FrameCompositor:
+    def __init__(self, width, height, mode="tetris"):
+        self.width = width
+        self.height = height
+        self.mode = mode
+        colors = MODE_COLORS[mode]
+        # only upper-case names can be reached: lower case always means ghost
+        names = [k for k in colors if not k.islower()]
+        palette = [EMPTY_COLOR, GHOST_COLOR] + [colors[k] for k in names] + [UNKNOWN_COLOR]
+        self.palette = np.array(palette, dtype=np.uint8)
+        self.codes = _PaletteCodes({k: i + 2 for i, k in enumerate(names)}, len(palette) - 1)
+        self._tracker = None
+        self.index = np.zeros((height, width), dtype=np.uint8)
+        self.rgb = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def compose(self, rules):
+        """
+        RGB frame for rules; the returned array is reused by the next call.
+        Only the cells the rules engine reports dirty are rewritten.
+        """
+        t = self._tracker
+        if t is None or t.rules is not rules:
+            t = self._tracker = DirtyCells(rules)
+        dirty = t.pop()
+        if dirty:
+            codes = self.codes
+            n = len(dirty)
+            xs = np.fromiter((p[0] for p in dirty), np.intp, n)
+            ys = np.fromiter((p[1] for p in dirty), np.intp, n)
+            vals = np.fromiter((codes[v] for v in dirty.values()), np.uint8, n)
+            self.index[ys, xs] = vals
+            self.rgb[ys, xs] = self.palette[vals]
+        return self.rgb
+
+def _reference_rgb(rules, mode):
+    # the list-based build_frame_from_rules + frame_to_rgb this module replaced
+    w, h = rules.width, rules.height
+    buf = [list(row) for row in rules.get_board()]
+    for (x, y, ch) in rules.get_ghost_cells():
+        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
+            buf[y][x] = ch
+    for (x, y, ch) in rules.get_current_cells():
+        if 0 <= y < h and 0 <= x < w:
+            buf[y][x] = ch
+    for (x, y, ch) in rules.get_preview_cells():
+        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
+            buf[y][x] = ch
+    colors = MODE_COLORS[mode]
+    out = []
+    for row in buf:
+        out_row = []
+        for cell in row:
+            if cell is None:
+                out_row.append(EMPTY_COLOR)
+            elif str(cell).islower():
+                out_row.append(GHOST_COLOR)
+            else:
+                out_row.append(colors.get(str(cell).upper(), UNKNOWN_COLOR))
+        out.append(out_row)
+    return out
+
+def check_parity(frames=2000, seed=0):
+    import random, time
+    from rules.tetris_rules import RulesEngine
+    from rules.tritris_rules import TritrisRules
+    from sim.tetris_sim import TetrisSim
+    for mode, cls, (w, h) in (("tetris", RulesEngine, (10, 20)), ("tetris", RulesEngine, (6, 15)),
+                              ("tetris", RulesEngine, (32, 64)), ("tritris", TritrisRules, (4, 5)),
+                              ("tritris", TritrisRules, (8, 10))):
+        rng = random.Random(seed)
+        sim = TetrisSim(cls(w, h, rng=random.Random(seed)))
+        comp = FrameCompositor(w, h, mode)
+        t_ref = t_new = 0.0
+        snap = None
+        for _ in range(frames):
+            if sim.is_game_over:
+                sim.reset()
+            r = rng.random()
+            if r < 0.1:
+                sim.move(rng.choice((-1, 1)))
+            elif r < 0.15:
+                sim.rotate()
+            elif r < 0.17:
+                sim.hard_drop()
+            elif r < 0.18:
+                snap = sim.snapshot()
+            elif r < 0.19 and snap is not None:
+                sim.restore(snap)
+            sim.update(1 / 60, soft_hold=rng.random() < 0.3)
+            t0 = time.perf_counter()
+            rgb = comp.compose(sim.rules)
+            t1 = time.perf_counter()
+            # the reference gets an uncached ghost, which also checks the cache
+            sim.rules._ghost_cache = None
+            ref = _reference_rgb(sim.rules, mode)
+            t2 = time.perf_counter()
+            t_new += t1 - t0
+            t_ref += t2 - t1
+            assert rgb.tolist() == [[list(c) for c in row] for row in ref], (mode, w, h)
+        print(f"{cls.__name__} {w}x{h}: {frames} frames identical, "
+              f"lists {t_ref / frames * 1e6:.0f} us/frame, compositor {t_new / frames * 1e6:.0f} us/frame")
+
+if __name__ == "__main__":
+    check_parity()
@@ -0,0 +1,276 @@
+# renderer/led_wall.py
+# Output to a wall of several serial LED tiles. A JSON layout maps
+# sub-rectangles of the wall to serial devices:
+#
+#   {"width": 20, "height": 20,
+#    "tiles": [
+#      {"port": "/dev/ttyUSB0", "x": 0,  "y": 0, "width": 10, "height": 20},
+#      {"port": "/dev/ttyUSB1", "x": 10, "y": 0, "width": 10, "height": 20,
+#       "rotate": 180, "flip_x": false, "flip_y": false, "serpentine": true,
+#       "protocol": "auto", "baudrate": 115200}]}
+#
+# rotate (clockwise, 0/90/180/270) and flip_x/flip_y describe how the tile is
+# mounted; serpentine means every second LED row is wired right-to-left.
+# Each device gets its rectangle as a width x height frame in wiring order.
+# A composed frame of another size is scaled to the wall (nearest pixel), so
+# the 10x20 game fills any wall.
+#
+# Every tile has its own writer thread. The threads meet at a barrier once
+# per frame: one of them takes the newest submitted frame for all, each
+# encodes its rectangle, and they meet again before writing, so every tile
+# shows the same frame sequence and a slow tile holds the others back by at
+# most one frame. Each link only carries its own share of the pixels, so the
+# wall's frame rate scales with the number of links.
+import json, sys, threading, time
+
+import numpy as np
+
+from renderer.usb_frame import FrameLink, frame_bytes
+
+try:
+    import serial
+except Exception:
+    serial = None
+
+ROTATIONS = (0, 90, 180, 270)
+
+class Tile:
+    def __init__(self, port, x, y, width, height, rotate=0, flip_x=False, flip_y=False,
+                 serpentine=False, protocol=None, baudrate=115200):
+        if rotate not in ROTATIONS:
+            raise ValueError(f"tile {port}: rotate must be one of {ROTATIONS}, not {rotate}")
+        if width < 1 or height < 1:
+            raise ValueError(f"tile {port}: empty rectangle {width}x{height}")
+        self.port = port
+        self.x, self.y = x, y
+        self.width, self.height = width, height
+        self.rotate = rotate
+        self.flip_x = flip_x
+        self.flip_y = flip_y
+        self.serpentine = serpentine
+        self.protocol = protocol        # None = whatever the wall is opened with
+        self.baudrate = baudrate
+
+    def wire_order(self, wall_width, wall_height):
+        """
+        Wall pixel index for each LED of this tile, in the order the device
+        expects its pixels. Returns (indices, out_width, out_height).
+        """
+        if self.x < 0 or self.y < 0 or self.x + self.width > wall_width or self.y + self.height > wall_height:
+            raise ValueError(f"tile {self.port}: {self.width}x{self.height} at ({self.x},{self.y}) "
+                             f"is outside the {wall_width}x{wall_height} wall")
+        idx = np.arange(wall_width * wall_height).reshape(wall_height, wall_width)
+        idx = idx[self.y:self.y + self.height, self.x:self.x + self.width]
+        idx = np.rot90(idx, -(self.rotate // 90))
+        if self.flip_x:
+            idx = idx[:, ::-1]
+        if self.flip_y:
+            idx = idx[::-1]
+        idx = idx.copy()
+        if self.serpentine:
+            idx[1::2] = idx[1::2, ::-1]
+        return idx.ravel(), idx.shape[1], idx.shape[0]
+
+def load_layout(path):
+    """
+    Read a wall layout file. Returns (width, height, tiles); raises
+    ValueError if the layout is malformed.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        width, height = int(data["width"]), int(data["height"])
+        tiles = [Tile(t["port"], int(t["x"]), int(t["y"]), int(t["width"]), int(t["height"]),
+                      int(t.get("rotate", 0)), bool(t.get("flip_x", False)),
+                      bool(t.get("flip_y", False)), bool(t.get("serpentine", False)),
+                      t.get("protocol"), int(t.get("baudrate", 115200)))
+                 for t in data["tiles"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{path}: bad wall layout ({e!r})")
+    if not tiles:
+        raise ValueError(f"{path}: wall layout has no tiles")
+    for tile in tiles:
+        tile.wire_order(width, height)      # bounds check
+    return width, height, tiles
+
+class LedWall:
+    """
+    A set of (Tile, FrameLink) pairs driven in lockstep by one writer thread
+    per link. submit() has the SerialFrameSink semantics: it copies the frame
+    into a single-slot mailbox and returns at once, and a frame still waiting
+    when the next one arrives is dropped. send_frame() accepts a LedWall
+    wherever it accepts a port.
+    """
+    def __init__(self, width, height, tiles, links, log_sent=False):
+        self.width = width
+        self.height = height
+        self.tiles = tiles
+        self.links = links
+        self._orders = [tile.wire_order(width, height) for tile in tiles]
+        self._maps = {}                 # source (w, h) -> per-tile source pixel indices
+        self._cond = threading.Condition()
+        self._pending = None
+        self._current = None
+        self._closed = False
+        self.seq = 0
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = [0] * len(links)
+        self.bytes_sent = [0] * len(links)
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self._t_take = 0.0
+        # (wall frame seq, per-link seq or None, t_submit, t_written)
+        self.sent_log = [] if log_sent else None
+        self._link_seq = [None] * len(links)
+        self._take_barrier = threading.Barrier(len(links), action=self._take)
+        self._write_barrier = threading.Barrier(len(links))
+        self._done_barrier = threading.Barrier(len(links), action=self._done)
+        self._threads = [threading.Thread(target=self._run, args=(i,), name=f"led-wall-{i}", daemon=True)
+                         for i in range(len(links))]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def binary(self):
+        return all(link.binary for link in self.links)
+
+    def _source_map(self, width, height):
+        # wall pixel -> pixel of a width x height source frame, then per tile
+        maps = self._maps.get((width, height))
+        if maps is None:
+            ys = np.arange(self.height) * height // self.height
+            xs = np.arange(self.width) * width // self.width
+            wall = (ys[:, None] * width + xs[None, :]).ravel()
+            maps = self._maps[(width, height)] = [wall[order] for order, _, _ in self._orders]
+        return maps
+
+    def submit(self, frame_rgb, width, height):
+        pixels = np.frombuffer(frame_bytes(frame_rgb), dtype=np.uint8).reshape(-1, 3)
+        t_submit = time.perf_counter()
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (pixels, self._source_map(width, height), t_submit)
+            self.submitted += 1
+            self._cond.notify()
+
+    def _take(self):
+        # barrier action: runs once per frame, while every writer waits
+        with self._cond:
+            while self._pending is None and not self._closed:
+                self._cond.wait()
+            self._current = self._pending
+            self._pending = None
+        self._t_take = time.perf_counter()
+
+    def _done(self):
+        t = time.perf_counter()
+        latency = t - self._t_take
+        if self.sent_log is not None:
+            self.sent_log.append((self.sent, tuple(self._link_seq), self._current[2], t))
+        self.sent += 1
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.last_latency = latency
+        self._latency_sum += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def _run(self, i):
+        link = self.links[i]
+        _, out_w, out_h = self._orders[i]
+        while True:
+            try:
+                self._take_barrier.wait()
+            except threading.BrokenBarrierError:
+                return
+            frame = self._current
+            if frame is None:
+                return
+            pixels, maps, _ = frame
+            self._link_seq[i] = link.seq if link.binary else None
+            data = None
+            try:
+                data = link.encode_payload(pixels[maps[i]].tobytes(), out_w, out_h)
+            except Exception as e:
+                self.errors[i] += 1
+                print(f"Error while encoding frame for {self.tiles[i].port}:", e, file=sys.stderr)
+            try:
+                # every tile has its bytes ready: write together
+                self._write_barrier.wait()
+                if data is not None:
+                    try:
+                        link.write(data)
+                        self.bytes_sent[i] += len(data)
+                    except Exception as e:
+                        self.errors[i] += 1
+                        print(f"Error while sending frame to {self.tiles[i].port}:", e, file=sys.stderr)
+                        # this tile's next frame must not be a delta against it
+                        if link.encoder is not None:
+                            link.encoder.force_keyframe()
+                self._done_barrier.wait()
+            except threading.BrokenBarrierError:
+                return
+
+    def stats(self):
+        return {
+            "tiles": len(self.links),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "errors": sum(self.errors),
+            "bytes_sent": sum(self.bytes_sent),
+            "bytes_per_tile": list(self.bytes_sent),
+            "write_latency_last_ms": self.last_latency * 1e3,
+            "write_latency_avg_ms": (self._latency_sum / self.sent * 1e3) if self.sent else 0.0,
+            "write_latency_max_ms": self.max_latency * 1e3,
+        }
+
+    def close(self, timeout=1.0):
+        # sends the frame still in the mailbox (if any), then stops
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        deadline = time.perf_counter() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.perf_counter()))
+        if any(t.is_alive() for t in self._threads):
+            # a writer is stuck on its port; release the others
+            for b in (self._take_barrier, self._write_barrier, self._done_barrier):
+                b.abort()
+        for link in self.links:
+            try:
+                link.close()
+            except Exception:
+                pass
+
+def open_wall(path, protocol="auto", log_sent=False):
+    """
+    Open every tile of the layout at `path` and return a LedWall, or None if
+    the layout is unusable. Tile ports are opened exactly as named (no
+    fallback to other ports); tiles that fail to open are left dark.
+    """
+    try:
+        width, height, tiles = load_layout(path)
+    except (OSError, ValueError) as e:
+        print("Failed to load LED wall layout:", e, file=sys.stderr)
+        return None
+    if serial is None:
+        print("pyserial is not installed; cannot open LED wall tiles.", file=sys.stderr)
+        return None
+    opened, links = [], []
+    for tile in tiles:
+        try:
+            print(f"Opening LED wall tile {tile.port} @ {tile.baudrate}bps...")
+            port = serial.Serial(tile.port, tile.baudrate, timeout=1)
+        except Exception as e:
+            print(f"Failed to open LED wall tile {tile.port}: {e}", file=sys.stderr)
+            continue
+        opened.append(tile)
+        links.append(FrameLink(port, tile.protocol or protocol))
+    if not links:
+        print("No LED wall tile could be opened.", file=sys.stderr)
+        return None
+    return LedWall(width, height, opened, links, log_sent)
@@ -1,5 +1,157 @@
 # renderer/pygame_display.py
 import pygame, sys
+import numpy as np
+
+# sprite caches are keyed by colour; frames with a slowly fading background
+# (the screensaver) would otherwise grow them without bound
+SPRITE_CACHE_SIZE = 512
+
+# screen -> CellRenderer that drew it last, so a view notices when another
+# view has painted over it and redraws in full
+_screen_owner = {}
+
+class CellRenderer:
+    """
+    Draws an (height, width, 3) uint8 RGB array as pix-sized cells with a 1px
+    gap in gap_color. Each colour is pre-rendered once as a cell sprite;
+    draw() blits only the cells that differ from the previous frame and
+    returns their rects (merged per row run) for pygame.display.update().
+    It returns None after a full redraw (first frame, invalidate(), or
+    another view drew on the screen), meaning the whole screen is new.
+    """
+    def __init__(self, pix, origin=(0, 0), gap_color=(0, 0, 0), palette=()):
+        self.pix = pix
+        self.origin = origin
+        self.gap_color = tuple(gap_color)
+        self._sprites = {}
+        self._last = None
+        for color in palette:
+            self.sprite(tuple(int(c) for c in color))
+
+    def sprite(self, color):
+        s = self._sprites.get(color)
+        if s is None:
+            if len(self._sprites) >= SPRITE_CACHE_SIZE:
+                self._sprites.clear()
+            s = pygame.Surface((self.pix - 1, self.pix - 1))
+            s.fill(color)
+            if pygame.display.get_surface() is not None:
+                s = s.convert()
+            self._sprites[color] = s
+        return s
+
+    def invalidate(self):
+        self._last = None
+
+    def draw(self, screen, rgb):
+        pix = self.pix
+        ox, oy = self.origin
+        last = self._last
+        full = last is None or last.shape != rgb.shape or _screen_owner.get(screen) is not self
+        if full:
+            _screen_owner[screen] = self
+            self._last = last = rgb.copy()
+            screen.fill(self.gap_color)
+            ys, xs = np.indices(rgb.shape[:2]).reshape(2, -1)
+        else:
+            ys, xs = np.nonzero((rgb != last).any(axis=2))
+            if not len(ys):
+                return []
+            last[ys, xs] = rgb[ys, xs]
+        sprite = self.sprite
+        blits = [(sprite(tuple(c)), (ox + x * pix, oy + y * pix))
+                 for x, y, c in zip(xs.tolist(), ys.tolist(), rgb[ys, xs].tolist())]
+        screen.blits(blits, doreturn=False)
+        if full:
+            return None
+        # one rect per horizontal run of changed cells
+        rects = []
+        run_y = run_x0 = run_x1 = None
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            if y == run_y and x == run_x1 + 1:
+                run_x1 = x
+                continue
+            if run_y is not None:
+                rects.append(pygame.Rect(ox + run_x0 * pix, oy + run_y * pix, (run_x1 - run_x0 + 1) * pix, pix))
+            run_y, run_x0, run_x1 = y, x, x
+        rects.append(pygame.Rect(ox + run_x0 * pix, oy + run_y * pix, (run_x1 - run_x0 + 1) * pix, pix))
+        return rects
+
+# drawn on top of every present() while set (main.py --profile)
+_overlay = None
+
+def set_overlay(overlay):
+    global _overlay
+    _overlay = overlay
+
+def present(rects):
+    # rects from CellRenderer.draw(): None = whole screen, [] = nothing changed
+    if _overlay is not None:
+        r = _overlay.draw(pygame.display.get_surface())
+        if rects is not None:
+            rects = rects + [r]
+    if rects is None:
+        pygame.display.flip()
+    elif rects:
+        pygame.display.update(rects)
+
+class TextCache:
+    """Rendered text surfaces keyed by (text, colour); the font is created once."""
+    def __init__(self, size=20, name=None):
+        self.size = size
+        self.name = name
+        self._font = None
+        self._cache = {}
+
+    def render(self, text, color):
+        key = (text, color)
+        s = self._cache.get(key)
+        if s is None:
+            if self._font is None:
+                self._font = pygame.font.SysFont(self.name, self.size)
+            if len(self._cache) >= SPRITE_CACHE_SIZE:
+                self._cache.clear()
+            s = self._font.render(text, True, color)
+            self._cache[key] = s
+        return s
+
+class ProfileOverlay:
+    """
+    Text box in the bottom-right corner, e.g. profiler percentiles. The
+    lines are re-rendered every `refresh` draws; in between the cached
+    surface is blitted.
+    """
+    def __init__(self, lines_fn, refresh=30, size=14, color=(200,200,120), bg=(0,0,0)):
+        self.lines_fn = lines_fn
+        self.refresh = refresh
+        self.size = size
+        self.color = color
+        self.bg = bg
+        self._font = None
+        self._surface = None
+        self._count = 0
+
+    def _render(self):
+        if self._font is None:
+            self._font = pygame.font.SysFont("monospace", self.size)
+        lines = [self._font.render(line, True, self.color, self.bg) for line in self.lines_fn()]
+        w = max(s.get_width() for s in lines) + 8
+        h = sum(s.get_height() for s in lines) + 8
+        surf = pygame.Surface((w, h))
+        surf.fill(self.bg)
+        y = 4
+        for s in lines:
+            surf.blit(s, (4, y))
+            y += s.get_height()
+        return surf
+
+    def draw(self, screen):
+        if self._surface is None or self._count % self.refresh == 0:
+            self._surface = self._render()
+        self._count += 1
+        sw, sh = screen.get_size()
+        w, h = self._surface.get_size()
+        return screen.blit(self._surface, (sw - w, sh - h))
 
 class PygameRenderer:
     def __init__(self, width=10, height=20, cell=20, caption="Tetris"):
@@ -10,18 +162,18 @@ class PygameRenderer:
         self.screen = pygame.display.set_mode((width*cell, height*cell))
         pygame.display.set_caption(caption)
         self.clock = pygame.time.Clock()
+        self.cells = CellRenderer(cell)
+        self._rgb = np.zeros((height, width, 3), dtype=np.uint8)
 
     def available(self):
         return True
 
     def render(self, buffer2d):
-        # buffer2d: 2D array of (r,g,b) tuples, shape [height][width]
-        self.screen.fill((0,0,0))
-        for y in range(self.height):
-            for x in range(self.width):
-                color = buffer2d[y][x] if buffer2d[y][x] else (0,0,0)
-                pygame.draw.rect(
-                    self.screen, color,
-                    (x*self.cell, y*self.cell, self.cell-1, self.cell-1)
-                )
-        pygame.display.flip()
+        # buffer2d: 2D array of (r,g,b) tuples, shape [height][width]; None = black.
+        # A (height, width, 3) uint8 array is drawn as is.
+        if isinstance(buffer2d, np.ndarray):
+            rgb = buffer2d
+        else:
+            rgb = self._rgb
+            rgb[:] = [[c if c else (0,0,0) for c in row] for row in buffer2d]
+        present(self.cells.draw(self.screen, rgb))
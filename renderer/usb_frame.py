@@ -1,5 +1,10 @@
 # usb_frame.py
+import collections
+import os
+import struct
 import sys
+import threading
+import time
 import traceback
 
 try:
@@ -28,6 +33,8 @@ def try_open(preferred="COM10", baudrate=115200, timeout=1):
     Try to open the preferred port (COM6 by default). If not found, try
     reasonable fallbacks. Returns an open serial.Serial instance or None.
     Detailed errors are printed to stderr.
+    A preferred path that exists but is not enumerated (a pty such as the
+    one bench/panel_emulator.py opens) is tried as is, without fallbacks.
     """
     if serial is None:
         print("pyserial is not installed; cannot open serial ports.", file=sys.stderr)
@@ -47,6 +54,8 @@ def try_open(preferred="COM10", baudrate=115200, timeout=1):
                 if p.lower() == preferred.lower():
                     candidates.append(p)
                     break
+            if not candidates and os.path.exists(preferred):
+                candidates.append(preferred)
 
     # If preferred not present, add USB-like or first available
     if not candidates:
@@ -82,24 +91,402 @@ def try_open(preferred="COM10", baudrate=115200, timeout=1):
     print("All attempts to open serial port failed.", file=sys.stderr)
     return None
 
+# --- frame encodings ---
+#
+# ASCII (always supported): ":" + RRGGBB hex per pixel, row-major + "\n".
+#
+# Binary (negotiated): a fixed little-endian header, the payload and a
+# 16-bit checksum (sum of payload bytes mod 65536):
+#   magic  2s  b"KF"
+#   type   B   frame type, see below
+#   seq    H   frame sequence number, wraps at 65536
+#   width  H
+#   height H
+#   length I   payload byte count
+# Frame types:
+#   FRAME_RAW   keyframe: raw RGB, 3 bytes per pixel, row-major
+#   FRAME_RLE   keyframe: (count u8, r, g, b) runs covering every pixel
+#   FRAME_RUNS  delta against the previous frame: (start u16, count u8)
+#               followed by count RGB pixels, for each changed run
+BINARY_MAGIC = b"KF"
+BINARY_HEADER = struct.Struct("<2sBHHHI")
+BINARY_CHECKSUM = struct.Struct("<H")
+RUN_HEADER = struct.Struct("<HB")
+FRAME_RAW = 0
+FRAME_RUNS = 1
+FRAME_RLE = 2
+KEYFRAME_TYPES = (FRAME_RAW, FRAME_RLE)
+
+# Handshake: the host sends HELLO; firmware that speaks the binary protocol
+# answers "KF<version>\n" with the highest version it supports (1 = raw
+# frames only, 2 = adds RLE and delta frames). HELLO stays the "?KF1" that
+# version 1 firmware listens for, so both generations answer it. Older
+# firmware ignores the line (it does not start with ":"), so a timeout
+# means ASCII only.
+BINARY_HELLO = b"?KF1\n"
+BINARY_HELLO_REPLY = b"KF"
+BINARY_VERSION = 2
+
+def frame_bytes(frame_rgb):
+    # raw RGB bytes, row-major; accepts nested (r,g,b) rows or anything with tobytes()
+    tobytes = getattr(frame_rgb, "tobytes", None)
+    if tobytes is not None:
+        return tobytes()
+    return bytes(int(c) for row in frame_rgb for px in row for c in px)
+
+def encode_ascii(frame_rgb):
+    # ":" + two upper-case hex digits per component + "\n", built in one go;
+    # going through frame_bytes keeps NumPy frames off the per-pixel path
+    return encode_ascii_bytes(frame_bytes(frame_rgb))
+
+def encode_ascii_bytes(payload):
+    # same wire format as encode_ascii, from raw RGB bytes
+    return b":" + payload.hex().upper().encode("ascii") + b"\n"
+
+def encode_binary(payload, width, height, seq, frame_type=FRAME_RAW):
+    header = BINARY_HEADER.pack(BINARY_MAGIC, frame_type, seq & 0xFFFF, width, height, len(payload))
+    return header + payload + BINARY_CHECKSUM.pack(sum(payload) & 0xFFFF)
+
+def encode_rle(payload):
+    # (count, r, g, b) runs of identical pixels, count <= 255
+    out = bytearray()
+    n = len(payload)
+    i = 0
+    while i < n:
+        px = payload[i:i + 3]
+        j = i + 3
+        limit = min(n, i + 255 * 3)
+        while j < limit and payload[j:j + 3] == px:
+            j += 3
+        out.append((j - i) // 3)
+        out += px
+        i = j
+    return bytes(out)
+
+def encode_runs(payload, previous, width):
+    """
+    Delta payload: every run of pixels that differs from previous, as
+    (start pixel, count) headers followed by the new RGB bytes. Unchanged
+    rows are skipped with a single bytes comparison each.
+    """
+    out = bytearray()
+    row_bytes = width * 3
+    for row_start in range(0, len(payload), row_bytes):
+        row_end = row_start + row_bytes
+        if payload[row_start:row_end] == previous[row_start:row_end]:
+            continue
+        i = row_start
+        while i < row_end:
+            if payload[i:i + 3] == previous[i:i + 3]:
+                i += 3
+                continue
+            j = i + 3
+            while j < row_end and j - i < 255 * 3 and payload[j:j + 3] != previous[j:j + 3]:
+                j += 3
+            out += RUN_HEADER.pack(i // 3, (j - i) // 3)
+            out += payload[i:j]
+            i = j
+    return bytes(out)
+
+def apply_frame(previous, frame_type, payload, npixels):
+    """
+    Decode one binary frame payload to raw RGB bytes. previous is the last
+    decoded frame (needed for FRAME_RUNS, ignored for keyframes).
+    Raises ValueError on malformed payloads.
+    """
+    if frame_type == FRAME_RAW:
+        if len(payload) != npixels * 3:
+            raise ValueError("raw frame has wrong size")
+        return bytes(payload)
+    if frame_type == FRAME_RLE:
+        out = bytearray()
+        for i in range(0, len(payload) - 3, 4):
+            out += payload[i + 1:i + 4] * payload[i]
+        if len(out) != npixels * 3:
+            raise ValueError("RLE frame has wrong size")
+        return bytes(out)
+    if frame_type == FRAME_RUNS:
+        if previous is None or len(previous) != npixels * 3:
+            raise ValueError("delta frame without a matching previous frame")
+        out = bytearray(previous)
+        i = 0
+        while i < len(payload):
+            start, count = RUN_HEADER.unpack_from(payload, i)
+            i += RUN_HEADER.size
+            out[start * 3:(start + count) * 3] = payload[i:i + count * 3]
+            i += count * 3
+        if len(out) != npixels * 3:
+            raise ValueError("delta frame runs past the end of the frame")
+        return bytes(out)
+    raise ValueError(f"unknown frame type {frame_type}")
+
+class FrameEncoder:
+    """
+    Picks the smallest encoding for each frame: a delta against the frame
+    sent last (FRAME_RUNS) or a keyframe (FRAME_RAW or FRAME_RLE). Every
+    keyframe_interval frames a keyframe is forced so the device can recover
+    after dropped or corrupted data.
+    """
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.last = None
+        self.since_key = 0
+        self.counts = {FRAME_RAW: 0, FRAME_RUNS: 0, FRAME_RLE: 0}
+
+    def force_keyframe(self):
+        self.last = None
+
+    def encode(self, payload, width):
+        # returns (frame_type, frame payload)
+        raw_size = len(payload)
+        best = None
+        if self.last is not None and len(self.last) == raw_size and \
+                self.since_key < self.keyframe_interval and raw_size <= 0xFFFF * 3:
+            runs = encode_runs(payload, self.last, width)
+            best = (FRAME_RUNS, runs)
+        # RLE is only worth computing when the delta is not already tiny
+        if best is None or len(best[1]) > raw_size // 8:
+            rle = encode_rle(payload)
+            if best is None or len(rle) < len(best[1]):
+                best = (FRAME_RLE, rle)
+        if len(best[1]) >= raw_size:
+            best = (FRAME_RAW, payload)
+        if best[0] in KEYFRAME_TYPES:
+            self.since_key = 0
+        else:
+            self.since_key += 1
+        self.counts[best[0]] += 1
+        self.last = payload
+        return best
+
+def decode_binary(data):
+    """
+    Parse one binary frame from the start of data. Returns
+    (frame_type, seq, width, height, payload, consumed) or None if data does
+    not yet hold a whole frame. Raises ValueError on bad magic or checksum.
+    """
+    if len(data) < BINARY_HEADER.size:
+        return None
+    magic, frame_type, seq, width, height, length = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("bad frame magic")
+    end = BINARY_HEADER.size + length
+    if len(data) < end + BINARY_CHECKSUM.size:
+        return None
+    payload = bytes(data[BINARY_HEADER.size:end])
+    (checksum,) = BINARY_CHECKSUM.unpack_from(data, end)
+    if checksum != sum(payload) & 0xFFFF:
+        raise ValueError("frame checksum mismatch")
+    return frame_type, seq, width, height, payload, end + BINARY_CHECKSUM.size
+
+def negotiate_binary(serial_port, timeout=0.25):
+    """
+    Ask the device for binary mode. Returns the binary protocol version it
+    answered with (capped at BINARY_VERSION), or 0 for ASCII only.
+    """
+    old_timeout = getattr(serial_port, "timeout", None)
+    try:
+        # short read timeout so a silent device does not stall startup
+        serial_port.timeout = 0.02
+        try:
+            serial_port.reset_input_buffer()
+        except Exception:
+            pass
+        serial_port.write(BINARY_HELLO)
+        try:
+            serial_port.flush()
+        except Exception:
+            pass
+        deadline = time.monotonic() + timeout
+        reply = b""
+        while time.monotonic() < deadline and b"\n" not in reply:
+            chunk = serial_port.read(64)
+            if chunk:
+                reply += chunk
+        reply = reply.strip()
+        if not reply.startswith(BINARY_HELLO_REPLY):
+            return 0
+        try:
+            return min(BINARY_VERSION, int(reply[len(BINARY_HELLO_REPLY):]))
+        except ValueError:
+            return 1
+    except Exception as e:
+        print("Binary frame negotiation failed:", e, file=sys.stderr)
+        return 0
+    finally:
+        try:
+            serial_port.timeout = old_timeout
+        except Exception:
+            pass
+
+class FrameLink:
+    """
+    A serial port plus the frame encoding negotiated for it. send_frame()
+    accepts a FrameLink wherever it accepts a raw serial port.
+    protocol: "ascii", "binary" (no handshake, delta frames included) or
+    "auto" (handshake, fall back to ASCII). Version 2 devices get delta and
+    RLE frames through a FrameEncoder; version 1 devices get raw frames.
+    """
+    def __init__(self, serial_port, protocol="auto", keyframe_interval=60):
+        self.serial_port = serial_port
+        if protocol == "auto":
+            self.version = negotiate_binary(serial_port)
+        else:
+            self.version = BINARY_VERSION if protocol == "binary" else 0
+        self.binary = self.version >= 1
+        self.encoder = FrameEncoder(keyframe_interval) if self.version >= 2 else None
+        self.seq = 0
+
+    def encode(self, frame_rgb, width, height):
+        if not self.binary:
+            return encode_ascii(frame_rgb)
+        return self.encode_payload(frame_bytes(frame_rgb), width, height)
+
+    def encode_payload(self, payload, width, height):
+        # encode a frame given as raw RGB bytes
+        if not self.binary:
+            return encode_ascii_bytes(payload)
+        frame_type = FRAME_RAW
+        if self.encoder is not None:
+            frame_type, payload = self.encoder.encode(payload, width)
+        data = encode_binary(payload, width, height, self.seq, frame_type)
+        self.seq = (self.seq + 1) & 0xFFFF
+        return data
+
+    def write(self, data):
+        self.serial_port.write(data)
+        try:
+            self.serial_port.flush()
+        except Exception:
+            pass
+
+    def send(self, frame_rgb, width, height):
+        self.write(self.encode(frame_rgb, width, height))
+
+    def close(self):
+        self.serial_port.close()
+
+class SerialFrameSink:
+    """
+    Owns a FrameLink in a dedicated writer thread so the game loop never
+    blocks on serial I/O. submit() copies the frame into a single-slot
+    "latest frame" mailbox and returns at once; a frame still waiting when
+    the next one arrives is dropped, not queued. Encoding happens on the
+    writer thread, so delta frames are always relative to what was sent.
+    send_frame() accepts a SerialFrameSink wherever it accepts a port.
+    With log_sent, sent_log records (index, seq, t_submit, t_written) per
+    frame written (perf_counter seconds; seq is None for ASCII) for
+    end-to-end latency measurements.
+    """
+    def __init__(self, link, name="serial-frame-sink", log_sent=False):
+        if not isinstance(link, FrameLink):
+            # a plain port keeps the plain-port behaviour: ASCII, no handshake
+            link = FrameLink(link, "ascii")
+        self.link = link
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self.sent_log = collections.deque(maxlen=65536) if log_sent else None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def binary(self):
+        return self.link.binary
+
+    def submit(self, frame_rgb, width, height):
+        payload = frame_bytes(frame_rgb)
+        t_submit = time.perf_counter()
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (payload, width, height, t_submit)
+            self.submitted += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                payload, width, height, t_submit = self._pending
+                self._pending = None
+            seq = self.link.seq if self.link.binary else None
+            try:
+                data = self.link.encode_payload(payload, width, height)
+                t0 = time.perf_counter()
+                self.link.write(data)
+                latency = time.perf_counter() - t0
+            except Exception as e:
+                self.errors += 1
+                print("Error while sending frame:", e, file=sys.stderr)
+                # the encoder already counts this frame as sent; do not delta
+                # against a frame the device never got
+                if self.link.encoder is not None:
+                    self.link.encoder.force_keyframe()
+                continue
+            if self.sent_log is not None:
+                self.sent_log.append((self.sent, seq, t_submit, t0 + latency))
+            self.sent += 1
+            self.bytes_sent += len(data)
+            self.last_latency = latency
+            self._latency_sum += latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "write_latency_last_ms": self.last_latency * 1e3,
+            "write_latency_avg_ms": (self._latency_sum / self.sent * 1e3) if self.sent else 0.0,
+            "write_latency_max_ms": self.max_latency * 1e3,
+        }
+
+    def close(self, timeout=1.0):
+        # sends the frame still in the mailbox (if any), then stops
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        try:
+            self.link.close()
+        except Exception:
+            pass
+
 def send_frame(serial_port, frame_rgb, width, height):
     """
     Write an RGB frame to the device as a single payload.
     Expects frame_rgb as iterable of rows, each row an iterable of (r,g,b) tuples.
-    The payload format is ":" + concatenated RRGGBB hex for all pixels + "\n".
+    A plain serial port gets the ASCII format; a FrameLink uses whatever
+    encoding it negotiated; a SerialFrameSink or a renderer.led_wall.LedWall
+    queues it for its writer thread(s).
     """
     if serial_port is None:
         print("send_frame called with serial_port=None", file=sys.stderr)
         return
 
     try:
-        # Build full payload in memory, then send once.
-        parts = [":"]
-        for row in frame_rgb:
-            # append each pixel as two-hex-digit components
-            parts.append("".join(f"{int(r):02X}{int(g):02X}{int(b):02X}" for (r, g, b) in row))
-        payload = "".join(parts) + "\n"
-        serial_port.write(payload.encode("ascii"))
+        if hasattr(serial_port, "submit"):      # SerialFrameSink, LedWall
+            serial_port.submit(frame_rgb, width, height)
+            return
+        if isinstance(serial_port, FrameLink):
+            serial_port.send(frame_rgb, width, height)
+            return
+        serial_port.write(encode_ascii(frame_rgb))
         try:
             serial_port.flush()
         except Exception:
@@ -0,0 +1,21 @@
+# rules/bitboard_rules.py
+# The bitboard engines under their original names. Every engine keeps its
+# board as int-bitmask rows now (see rules/polyomino_rules.py), so these are
+# thin subclasses of RulesEngine and TritrisRules for callers that ask for a
+# bitboard engine by name.
+from rules.tetris_rules import RulesEngine, TETROMINOES
+from rules.tritris_rules import TritrisRules, TRITRIS
+
+TETRIS_MASKS = TETROMINOES.masks
+TRITRIS_MASKS = TRITRIS.masks
+
+class BitboardRulesEngine(RulesEngine):
+    pass
+
+class BitboardTritrisRules(TritrisRules):
+    pass
+
+if __name__ == "__main__":
+    from rules.reference_trace import check
+    check({"tetris": BitboardRulesEngine, "tritris": BitboardTritrisRules})
+    print("BitboardRulesEngine, BitboardTritrisRules: reference traces match")
@@ -0,0 +1,80 @@
+# rules/placements.py
+# Reachable-placement search shared by the rules engines.
+from collections import deque
+
+# input names used in placement paths
+LEFT = "left"
+RIGHT = "right"
+DOWN = "down"
+ROTATE = "rotate"
+
+# entries kept per engine before the memo is flushed
+PLACEMENT_CACHE_SIZE = 64
+
+def search_placements(rules, x, y, rot):
+    # run iter_placements to completion
+    it = iter_placements(rules, x, y, rot)
+    while True:
+        try:
+            next(it)
+        except StopIteration as done:
+            return done.value
+
+def iter_placements(rules, x, y, rot, chunk=64):
+    """
+    Breadth-first search over (x, y, rotation) states of rules.current starting
+    from the given pose. Moves are one cell left/right/down and a clockwise
+    rotation through the engine's own kick table (rules.rotate_pose).
+    Returns a tuple of (x, y, rot, path) lock positions, one per distinct set
+    of occupied cells, each with the shortest input path that reaches it.
+    This is a generator that yields every `chunk` states so callers with a
+    frame budget can spread the search; the result is the StopIteration value.
+    """
+    if not rules.fits(x, y, rot):
+        return ()
+    fits = rules.fits
+    start = (x, y, rot)
+    parent = {start: None}
+    queue = deque([start])
+    seen_cells = set()
+    out = []
+    budget = chunk
+    while queue:
+        budget -= 1
+        if not budget:
+            budget = chunk
+            yield
+        state = queue.popleft()
+        sx, sy, srot = state
+        if not fits(sx, sy + 1, srot):
+            cells = frozenset((sx + dx, sy + dy) for (dx, dy) in rules.piece_cells(srot))
+            if cells not in seen_cells:
+                seen_cells.add(cells)
+                out.append(state)
+        # neighbour order makes the first-found shortest path rotate and
+        # shift before it drops, which is how a player (or the AI) plays it
+        nexts = []
+        pose = rules.rotate_pose(sx, sy, srot)
+        if pose is not None:
+            nexts.append((pose, ROTATE))
+        if fits(sx - 1, sy, srot):
+            nexts.append(((sx - 1, sy, srot), LEFT))
+        if fits(sx + 1, sy, srot):
+            nexts.append(((sx + 1, sy, srot), RIGHT))
+        if fits(sx, sy + 1, srot):
+            nexts.append(((sx, sy + 1, srot), DOWN))
+        for nxt, move in nexts:
+            if nxt not in parent:
+                parent[nxt] = (state, move)
+                queue.append(nxt)
+    return tuple(state + (_path_to(parent, state),) for state in out)
+
+def _path_to(parent, state):
+    path = []
+    link = parent[state]
+    while link is not None:
+        state, move = link
+        path.append(move)
+        link = parent[state]
+    path.reverse()
+    return tuple(path)
@@ -0,0 +1,374 @@
+# rules/polyomino_rules.py
+# The rules engine. A PieceSet is plain data (cells per rotation, kick
+# tables, spawn point, open or closed top edge) compiled once at load time
+# into per-rotation cell tuples, bounding boxes, row masks and kick lists;
+# PolyominoRules plays any PieceSet on int-bitmask rows (bit x set = cell x
+# occupied), with the colour board kept in step for get_board() and the
+# renderers. The game modes are PieceSets on top of it: TETROMINOES
+# (RulesEngine, rules/tetris_rules.py) and TRITRIS (TritrisRules,
+# rules/tritris_rules.py); rules/reference_trace.py pins their behaviour.
+# Per-call cost does not grow with the board area: fits() is one AND per
+# piece row, and clear_lines() only tests the rows the last lock touched, so
+# a 64x128 LED wall board costs about the same per move as 10x20.
+import random
+
+from rules.randomizer import as_randomizer
+from rules.placements import search_placements, PLACEMENT_CACHE_SIZE
+from rules.tracking import next_board_version, DirtyCells
+
+def compile_piece_masks(shapes):
+    """
+    shapes: {piece: [cells for rotation 0..3]} with cells as (dx, dy) pairs.
+    Returns {piece: [(minx, maxx, miny, maxy, rows, cells), ...]} where rows is
+    a tuple of (dy, mask) pairs with the mask relative to x=0.
+    """
+    out = {}
+    for name, rots in shapes.items():
+        compiled = []
+        for cells in rots:
+            cells = tuple(cells)
+            xs = [dx for (dx, dy) in cells]
+            ys = [dy for (dx, dy) in cells]
+            rows = {}
+            for (dx, dy) in cells:
+                rows[dy] = rows.get(dy, 0) | (1 << dx)
+            compiled.append((min(xs), max(xs), min(ys), max(ys), tuple(sorted(rows.items())), cells))
+        out[name] = compiled
+    return out
+
+def box_rotations(cells, size):
+    """
+    The four clockwise rotations of cells (dx, dy) inside a size x size box,
+    the way RulesEngine rotates its 4x4 maps. Cells come out sorted by row.
+    """
+    rots = []
+    cur = sorted(cells, key=lambda c: (c[1], c[0]))
+    for _ in range(4):
+        rots.append(cur)
+        cur = sorted(((size - 1 - dy, dx) for (dx, dy) in cur), key=lambda c: (c[1], c[0]))
+    return rots
+
+class PieceSet:
+    """
+    shapes: {name: [cells for rotation 0..n-1]}, cells as (dx, dy) with
+    dx, dy >= 0; the dict order is the bag order. kicks: {(from, to):
+    [(ox, oy), ...]} tried in order on a clockwise rotation (a missing entry
+    means no kick); piece_kicks overrides it per piece. A new piece spawns at
+    x = width // 2 + spawn_dx, y = spawn_y; the preview is drawn at that x on
+    row 0. With open_top, cells above the board are free space, otherwise the
+    top edge is a wall.
+    """
+    def __init__(self, shapes, kicks=None, piece_kicks=None, spawn_dx=-2, spawn_y=-1, open_top=True):
+        self.names = list(shapes)
+        if not self.names:
+            raise ValueError("piece set has no pieces")
+        self.cells = {}
+        for name, rots in shapes.items():
+            if not rots or not all(rots):
+                raise ValueError(f"piece {name}: every rotation needs cells")
+            if any(dx < 0 or dy < 0 for cells in rots for (dx, dy) in cells):
+                raise ValueError(f"piece {name}: cell offsets must be >= 0")
+            self.cells[name] = [tuple((int(dx), int(dy)) for (dx, dy) in cells) for cells in rots]
+        self.masks = compile_piece_masks(self.cells)
+        self.ghost = {name: name.lower() for name in self.names}
+        # kicks[name][rot]: offsets tried when rotating clockwise out of rot
+        self.kicks = {}
+        for name, rots in self.cells.items():
+            table = (piece_kicks or {}).get(name, kicks or {})
+            n = len(rots)
+            self.kicks[name] = [tuple(table.get((rot, (rot + 1) % n), [(0, 0)])) for rot in range(n)]
+        self.spawn_dx = spawn_dx
+        self.spawn_y = spawn_y
+        self.open_top = open_top
+
+class PolyominoRules:
+    """
+    Rules engine for any PieceSet: board, spawning, movement checks, kicks,
+    locking and line clears. Subclasses for the game modes set PIECES.
+    """
+    PIECES = None
+
+    def __init__(self, width=10, height=20, rng=None, pieces=None):
+        # re-initialising (TetrisSim.reset) keeps the piece set
+        self.pieces = pieces or getattr(self, "pieces", None) or self.PIECES
+        if self.pieces is None:
+            raise ValueError("PolyominoRules needs a PieceSet")
+        # MASKS in the bitboard engines' layout, for ai.planner
+        self.MASKS = self.pieces.masks
+        self.width = width
+        self.height = height
+        # piece source: a rules.randomizer object, or a random.Random for a
+        # reproducible bag (each piece of the PieceSet once per bag); None =
+        # the same bag shuffled with the global RNG
+        self.rng = rng
+        self.randomizer = as_randomizer(rng)
+        self.board = [[None for _ in range(width)] for __ in range(height)]
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        # rows the last lock wrote to, None = unknown (check them all)
+        self._touched = None
+        self.bag = []
+        self.current = None
+        self.rotation = 0
+        self.x = 0
+        self.y = 0
+        self.next_piece = None
+        self.game_over_on_spawn = False
+        self._placement_cache = {}
+        # changes on every board mutation; keys the ghost cache and the
+        # compositor's board layer (see rules/tracking.py)
+        self.board_version = next_board_version()
+        self._ghost_cache = None
+        self._dirty = None
+        self._refill_bag()
+        self.spawn_piece()
+
+    def _refill_bag(self):
+        if not self.bag:
+            self.bag = self.randomizer.deal(self.pieces.names)
+
+    def spawn_piece(self):
+        self._refill_bag()
+        if self.next_piece is None:
+            self.current = self.bag.pop()
+            self._refill_bag()
+            self.next_piece = self.bag.pop()
+        else:
+            self.current = self.next_piece
+            self._refill_bag()
+            self.next_piece = self.bag.pop()
+        self.rotation = 0
+        self.x = (self.width // 2) + self.pieces.spawn_dx
+        self.y = self.pieces.spawn_y
+        if not self.fits(self.x, self.y, self.rotation):
+            self.game_over_on_spawn = True
+
+    def fits(self, x, y, rot):
+        minx, maxx, miny, maxy, rows, _ = self.MASKS[self.current][rot]
+        if x + minx < 0 or x + maxx >= self.width or y + maxy >= self.height:
+            return False
+        if y + miny < 0 and not self.pieces.open_top:
+            return False
+        board = self.rows
+        if x >= 0:
+            for dy, m in rows:
+                by = y + dy
+                if by >= 0 and board[by] & (m << x):
+                    return False
+        else:
+            s = -x
+            for dy, m in rows:
+                by = y + dy
+                if by >= 0 and board[by] & (m >> s):
+                    return False
+        return True
+
+    def drop_y(self, x, y, rot):
+        # lowest y reachable by moving straight down from (x, y), the same as
+        # stepping with fits() but with the piece masks shifted only once
+        minx, maxx, miny, maxy, prow, _ = self.MASKS[self.current][rot]
+        if x + minx < 0 or x + maxx >= self.width:
+            return y
+        if y + 1 + miny < 0 and not self.pieces.open_top:
+            return y
+        masks = [(dy, m << x if x >= 0 else m >> -x) for dy, m in prow]
+        rows = self.rows
+        last = self.height - 1 - maxy
+        while y < last:
+            ny = y + 1
+            for dy, m in masks:
+                by = ny + dy
+                if by >= 0 and rows[by] & m:
+                    return y
+            y = ny
+        return y
+
+    def rotate_pose(self, x, y, rot):
+        # clockwise rotation from an arbitrary pose; returns the kicked
+        # (x, y, rot) or None if every kick collides
+        kicks = self.pieces.kicks[self.current]
+        new_rot = (rot + 1) % len(kicks)
+        for ox, oy in kicks[rot]:
+            if self.fits(x + ox, y + oy, new_rot):
+                return (x + ox, y + oy, new_rot)
+        return None
+
+    def try_rotate(self):
+        pose = self.rotate_pose(self.x, self.y, self.rotation)
+        if pose is None:
+            return False
+        self.x, self.y, self.rotation = pose
+        return True
+
+    def piece_cells(self, rot):
+        return self.pieces.cells[self.current][rot]
+
+    def _board_key(self):
+        return tuple(self.rows)
+
+    def generate_placements(self):
+        """
+        Every distinct lock position reachable by the current piece from its
+        current pose, as (x, y, rot, path) tuples. path is a tuple of
+        "left"/"right"/"down"/"rotate" inputs; a hard drop finishes it.
+        Memoized per (board, piece, pose).
+        """
+        key = (self._board_key(), self.current, self.x, self.y, self.rotation)
+        found = self._placement_cache.get(key)
+        if found is None:
+            if len(self._placement_cache) >= PLACEMENT_CACHE_SIZE:
+                self._placement_cache.clear()
+            found = search_placements(self, self.x, self.y, self.rotation)
+            self._placement_cache[key] = found
+        return found
+
+    def lock_piece(self):
+        name = self.current
+        _, _, miny, maxy, _, cells = self.MASKS[name][self.rotation]
+        x, y = self.x, self.y
+        for (dx, dy) in cells:
+            bx = x + dx
+            by = y + dy
+            if 0 <= by < self.height and 0 <= bx < self.width:
+                self.board[by][bx] = name
+                self.rows[by] |= 1 << bx
+        self._touched = (max(0, y + miny), min(self.height - 1, y + maxy))
+        self.board_version = next_board_version()
+        self.spawn_piece()
+
+    def clear_lines(self):
+        full = self.full_row
+        rows = self.rows
+        if self._touched is None:
+            if full not in rows:
+                return 0
+            lo, hi = 0, self.height - 1
+        else:
+            lo, hi = self._touched
+        self._touched = None
+        done = [y for y in range(lo, hi + 1) if rows[y] == full]
+        if not done:
+            return 0
+        # delete bottom-up so the indices below stay valid
+        for y in reversed(done):
+            del rows[y]
+            del self.board[y]
+        cleared = len(done)
+        rows[0:0] = [0] * cleared
+        self.board[0:0] = [[None for _ in range(self.width)] for __ in range(cleared)]
+        self.board_version = next_board_version()
+        return cleared
+
+    def snapshot(self):
+        """
+        Immutable copy of the board, bag, pieces, pose and randomizer state:
+        a tuple of row tuples plus scalars. Cheap to take and to hand to
+        restore(), after which play deals the same pieces as it did the
+        first time. An engine on the global RNG (rng=None) leaves the RNG
+        out; it is shared, not the engine's to rewind.
+        """
+        r = self.randomizer
+        if getattr(r, "rng", None) is random or not hasattr(r, "getstate"):
+            rng_state = None
+        else:
+            rng_state = r.getstate()
+        return (tuple(map(tuple, self.board)), tuple(self.bag), self.current, self.next_piece,
+                self.x, self.y, self.rotation, self.game_over_on_spawn, tuple(self.rows), rng_state)
+
+    def restore(self, snap):
+        # writes into the existing row lists, so nothing is reallocated
+        for row, src in zip(self.board, snap[0]):
+            row[:] = src
+        self.bag[:] = snap[1]
+        self.current = snap[2]
+        self.next_piece = snap[3]
+        self.x = snap[4]
+        self.y = snap[5]
+        self.rotation = snap[6]
+        self.game_over_on_spawn = snap[7]
+        self.rows[:] = snap[8]
+        if snap[9] is not None:
+            self.randomizer.setstate(snap[9])
+        self._touched = None
+        self.board_version = next_board_version()
+
+    def is_game_over(self):
+        return self.game_over_on_spawn
+
+    def get_board(self):
+        return self.board
+
+    def get_current_cells(self):
+        x, y, name = self.x, self.y, self.current
+        return [(x + dx, y + dy, name) for (dx, dy) in self.pieces.cells[name][self.rotation]]
+
+    def get_ghost_cells(self):
+        # cached per (x, rotation, piece, board version); the drop from
+        # start_y passed through every row down to gy, so the entry holds
+        # for any y in between. Callers must not modify the returned list.
+        key = (self.x, self.rotation, self.current, self.board_version)
+        c = self._ghost_cache
+        if c is not None and c[0] == key and c[1] <= self.y <= c[2]:
+            return c[3]
+        gy = self.drop_y(self.x, self.y, self.rotation)
+        x, ch = self.x, self.pieces.ghost[self.current]
+        out = [(x + dx, gy + dy, ch) for (dx, dy) in self.pieces.cells[self.current][self.rotation]]
+        self._ghost_cache = (key, self.y, gy, out)
+        return out
+
+    def get_preview_cells(self):
+        piece = self.next_piece
+        if piece is None:
+            return []
+        px = (self.width // 2) + self.pieces.spawn_dx
+        ch = self.pieces.ghost[piece]
+        return [(px + dx, dy, ch) for (dx, dy) in self.pieces.cells[piece][0]]
+
+    def pop_dirty_cells(self):
+        """
+        {(x, y): value} for the cells whose rendered content changed since
+        the last call (all cells on the first). For more than one consumer,
+        give each its own rules.tracking.DirtyCells.
+        """
+        if self._dirty is None:
+            self._dirty = DirtyCells(self)
+        return self._dirty.pop()
+
+
+if __name__ == "__main__":
+    import random, time
+    from rules.tetris_rules import RulesEngine, PIECE_CELLS
+    from rules.reference_trace import check
+    assert box_rotations(PIECE_CELLS["T"][0], 4) == PIECE_CELLS["T"]
+    check()
+    print("RulesEngine, TritrisRules: reference traces match")
+    # a restored snapshot deals the same pieces, past the current bag too
+    from rules.randomizer import RANDOMIZERS, make_randomizer
+    for mode in RANDOMIZERS:
+        rules = RulesEngine(10, 20, rng=make_randomizer(mode, 5))
+        snap = rules.snapshot()
+        first = [rules.spawn_piece() or rules.current for _ in range(50)]
+        rules.restore(snap)
+        assert [rules.spawn_piece() or rules.current for _ in range(50)] == first, mode
+    print("snapshot/restore: same pieces after restore for every randomizer")
+    # per-call cost against board size
+    for w, h in ((10, 20), (64, 128)):
+        rules = RulesEngine(w, h, rng=random.Random(0))
+        n = 20000
+        t0 = time.perf_counter()
+        for i in range(n):
+            rules.fits(i % w, i % h, i & 3)
+        fits_us = (time.perf_counter() - t0) / n * 1e6
+        locks = 0
+        t_lock = 0.0
+        for i in range(n // 10):
+            if rules.is_game_over():
+                rules.__init__(w, h, rules.rng)
+            while rules.fits(rules.x, rules.y + 1, rules.rotation):
+                rules.y += 1
+            t0 = time.perf_counter()
+            rules.lock_piece()
+            rules.clear_lines()
+            t_lock += time.perf_counter() - t0
+            locks += 1
+        print(f"RulesEngine {w}x{h}: fits {fits_us:.2f}us, lock+clear {t_lock / locks * 1e6:.2f}us")
@@ -0,0 +1,243 @@
+# rules/randomizer.py
+# Piece randomizers for the rules engines. An engine built with rng=R asks R
+# for pieces through deal(names): a list of piece names that it pops from the
+# end, one at a time, and asks again when the list is empty. Whatever deal()
+# returned and has not been popped yet is the engine's `bag` (part of
+# snapshot()); the randomizer's own RNG state is not.
+#
+#   BagRandomizer      bag (each piece once per bag, shuffled); 7-bag for tetris
+#   HistoryRandomizer  TGM-style: reroll a piece that is in the last few
+#   PureRandomizer     every piece independently uniform
+#   PieceStream        any of the above, pre-generated into a byte array
+#
+# Each takes an explicit seed (an int, or a random.Random to draw from). A
+# plain random.Random passed as rng is a BagRandomizer over it, and rng=None
+# shuffles with the global random module, as before; both give the same
+# streams they always did.
+import copy, random
+from array import array
+
+class Randomizer:
+    mode = None
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        # None = the global random module (unseeded, shared)
+        self.rng = random if seed is None else seed if isinstance(seed, random.Random) else random.Random(seed)
+
+    def deal(self, names):
+        raise NotImplementedError
+
+    def __deepcopy__(self, memo):
+        # the global random module is shared, not copied (nor copyable)
+        new = copy.copy(self)
+        memo[id(self)] = new
+        for k, v in vars(self).items():
+            if v is not random:
+                setattr(new, k, copy.deepcopy(v, memo))
+        return new
+
+    # full RNG state, for replay keyframes (sim/replay.py); plain literals
+    def getstate(self):
+        return self.rng.getstate()
+
+    def setstate(self, state):
+        self.rng.setstate(state)
+
+    def generate(self, names, n):
+        """
+        At least n pieces, as an array('B') of indices into names in play
+        order. Whole deals only (so the result can run past n), which keeps
+        a stream built from it in step with the randomizer's own deals.
+        """
+        index = {name: i for i, name in enumerate(names)}
+        out = array("B")
+        while len(out) < n:
+            out.extend(index[p] for p in reversed(self.deal(names)))
+        return out
+
+class BagRandomizer(Randomizer):
+    mode = "bag"
+
+    def deal(self, names):
+        bag = list(names)
+        self.rng.shuffle(bag)
+        return bag
+
+class HistoryRandomizer(Randomizer):
+    """
+    Roll up to `tries` times for a piece that is not among the last
+    `history` pieces dealt, keeping the last roll if every try repeats.
+    Deals len(names) pieces at a time.
+    """
+    mode = "history"
+
+    def __init__(self, seed=None, history=4, tries=6):
+        Randomizer.__init__(self, seed)
+        self.history_len = history
+        self.tries = tries
+        self.history = []
+
+    def deal(self, names):
+        names = list(names)
+        hist = self.history
+        out = []
+        for _ in names:
+            for _ in range(self.tries):
+                p = self.rng.choice(names)
+                if p not in hist:
+                    break
+            hist.append(p)
+            if len(hist) > self.history_len:
+                del hist[0]
+            out.append(p)
+        out.reverse()
+        return out
+
+    def getstate(self):
+        return (self.rng.getstate(), tuple(self.history))
+
+    def setstate(self, state):
+        self.rng.setstate(state[0])
+        self.history[:] = state[1]
+
+class PureRandomizer(Randomizer):
+    mode = "random"
+
+    def deal(self, names):
+        names = list(names)
+        out = [self.rng.choice(names) for _ in names]
+        out.reverse()
+        return out
+
+class PieceStream:
+    """
+    Plays pieces from a pre-generated array of piece indices. `source` is a
+    Randomizer (the stream is filled from it `block` pieces at a time, so
+    it matches that randomizer's own stream exactly) or a finished
+    array/bytes of indices, which raises IndexError once used up. Deals
+    come in len(names) chunks like the randomizers above, so the engine's
+    bag looks the same as it would without the stream.
+    """
+    def __init__(self, source, names=None, block=4096):
+        self.source = source
+        self.names = tuple(names) if names is not None else None
+        self.block = block
+        if isinstance(source, Randomizer):
+            self.mode = source.mode
+            self.data = array("B")
+        else:
+            self.mode = "stream"
+            self.data = array("B", source)
+        self.pos = 0
+
+    def _fill(self, names):
+        if not isinstance(self.source, Randomizer):
+            raise IndexError("piece stream exhausted")
+        # drop what has been played so the array does not grow forever
+        del self.data[:self.pos]
+        self.pos = 0
+        self.data.extend(self.source.generate(names, self.block))
+
+    def deal(self, names):
+        if self.names is None:
+            self.names = tuple(names)
+        names = self.names
+        n = len(names)
+        if self.pos + n > len(self.data):
+            self._fill(names)
+        start = self.pos
+        self.pos = start + n
+        return [names[i] for i in self.data[start:self.pos][::-1]]
+
+    def take(self, n, names=None):
+        """
+        The next n piece indices as an array('B'), for callers that consume
+        pieces in bulk (e.g. BatchTetrisSim) instead of through deal().
+        """
+        if self.names is None:
+            self.names = tuple(names)
+        while self.pos + n > len(self.data):
+            self._fill(self.names)
+        start = self.pos
+        self.pos = start + n
+        return self.data[start:self.pos]
+
+    # position, buffered pieces and (for a Randomizer source) its state
+    def getstate(self):
+        source = self.source.getstate() if isinstance(self.source, Randomizer) else None
+        return (self.pos, bytes(self.data), source)
+
+    def setstate(self, state):
+        self.pos, data, source = state
+        self.data = array("B", data)
+        if source is not None:
+            self.source.setstate(source)
+
+RANDOMIZERS = {"bag": BagRandomizer, "history": HistoryRandomizer, "random": PureRandomizer}
+
+def make_randomizer(mode="bag", seed=None):
+    try:
+        cls = RANDOMIZERS[mode]
+    except KeyError:
+        raise ValueError(f"unknown randomizer {mode!r}; expected one of {', '.join(RANDOMIZERS)}")
+    return cls(seed)
+
+def as_randomizer(rng):
+    # what an engine's rng argument means: None or random.Random -> bag
+    if rng is None or isinstance(rng, random.Random):
+        return BagRandomizer(rng)
+    return rng
+
+def _play(rules, n):
+    # piece order and bag after each spawn, n pieces in
+    seen = []
+    for _ in range(n):
+        seen.append((rules.current, rules.next_piece, tuple(rules.bag)))
+        rules.spawn_piece()
+    return seen
+
+if __name__ == "__main__":
+    import time
+    from rules.tetris_rules import RulesEngine, PIECE_NAMES
+    from rules.tritris_rules import TritrisRules
+
+    # the old engines shuffled list(PIECES.keys()) with rng in place
+    rng, ref = random.Random(7), []
+    for _ in range(100):
+        bag = list(PIECE_NAMES)
+        rng.shuffle(bag)
+        ref.extend(reversed(bag))
+    rules = RulesEngine(10, 20, rng=random.Random(7))
+    assert [c for c, _, _ in _play(rules, 600)] == ref[:600], "legacy rng stream changed"
+    print("random.Random rng: same 7-bag stream as before")
+
+    for cls in (RulesEngine, TritrisRules):
+        for mode in RANDOMIZERS:
+            a = _play(cls(10, 20, rng=make_randomizer(mode, 3)), 5000)
+            b = _play(cls(10, 20, rng=PieceStream(make_randomizer(mode, 3), block=1000)), 5000)
+            assert a == b, (cls.__name__, mode)
+            # a restored snapshot replays the same pieces, refills included
+            stream = PieceStream(make_randomizer(mode, 3), block=50)
+            rules = cls(10, 20, rng=stream)
+            _play(rules, 37)
+            snap = rules.snapshot()
+            c = _play(rules, 500)
+            rules.restore(snap)
+            assert _play(rules, 500) == c, (cls.__name__, mode, "getstate")
+            print(f"{cls.__name__} {mode}: stream matches randomizer, state round-trips")
+
+    n = 200000
+    for mode in RANDOMIZERS:
+        t0 = time.perf_counter()
+        data = make_randomizer(mode, 1).generate(PIECE_NAMES, n)
+        t1 = time.perf_counter()
+        stream = PieceStream(data)
+        while True:
+            try:
+                stream.deal(PIECE_NAMES)
+            except IndexError:
+                break
+        t2 = time.perf_counter()
+        print(f"{mode:8s} generate {(t1 - t0) / n * 1e9:6.0f} ns/piece, "
+              f"deal from stream {(t2 - t1) / n * 1e9:5.0f} ns/piece, {len(data)} bytes")
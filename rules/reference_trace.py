@@ -0,0 +1,82 @@
+# rules/reference_trace.py
+# Fixed behaviour trace for the two game modes. trace() drives an engine with
+# seeded random moves, rotations, drops and locks and folds its whole visible
+# state after every step (board, bag, pieces, pose, current/ghost/preview
+# cells, placements after each lock, every fits() answer on and around the
+# board) into a running crc32, sampled every 100 steps. REFERENCE_TRACE was
+# recorded from the original list-of-lists RulesEngine and TritrisRules
+# (their bitboard twins gave the same); the PieceSet engines must match it.
+# Run: python -m rules.reference_trace
+import random, zlib
+
+def trace(cls, width, height, steps=800, seed=0, every=100):
+    # running crc32 of cls's state, every `every` steps
+    actions = random.Random(seed)
+    e = cls(width, height, rng=random.Random(seed))
+    crc = 0
+    out = []
+    for step in range(1, steps + 1):
+        if e.is_game_over():
+            e.__init__(width, height, e.rng)
+        op = actions.random()
+        extra = None
+        if op < 0.2:
+            dx = actions.choice((-1, 1))
+            if e.fits(e.x + dx, e.y, e.rotation):
+                e.x += dx
+        elif op < 0.35:
+            extra = e.try_rotate()
+        elif op < 0.8:
+            if e.fits(e.x, e.y + 1, e.rotation):
+                e.y += 1
+        else:
+            while e.fits(e.x, e.y + 1, e.rotation):
+                e.y += 1
+            e.lock_piece()
+            extra = (e.clear_lines(), e.generate_placements())
+        state = (e.get_board(), e.bag, e.current, e.next_piece, e.x, e.y, e.rotation, e.is_game_over(),
+                 e.get_current_cells(), e.get_ghost_cells(), e.get_preview_cells(), extra)
+        fits = bytes(e.fits(x, y, rot) for rot in range(4)
+                     for y in range(-4, height + 1) for x in range(-4, width + 1))
+        crc = zlib.crc32(fits, zlib.crc32(repr(state).encode(), crc))
+        if step % every == 0:
+            out.append(crc)
+    return out
+
+# (mode, width, height, seed) -> trace(engine, width, height, seed=seed)
+REFERENCE_TRACE = {
+    ('tetris', 10, 20, 0): [0x3203bcc3, 0x22f4f2b4, 0x5d2b2e7b, 0xf6a37ee4, 0xfc12863a, 0x7371997d, 0xb3d7aa33, 0x2749fa64],
+    ('tetris', 10, 20, 1): [0x1fee617d, 0xaa753a49, 0xf38ba576, 0xfdb1e52b, 0x05ad115e, 0xbd4b0969, 0x4f593af8, 0xe150156f],
+    ('tetris', 10, 20, 2): [0x052f1915, 0x8081f900, 0xc7e7ba07, 0x4bfaa5c0, 0x5ca3acf2, 0x0d8eed00, 0x0a63cf66, 0xf074efaa],
+    ('tetris', 6, 15, 0): [0x7df8be7a, 0xfdb17142, 0xabf10e56, 0x79089a22, 0x739c099b, 0x6fdedc03, 0x6d26019b, 0xb07fddd8],
+    ('tetris', 6, 15, 1): [0x1a2ee097, 0x2ae7158b, 0xe89d7dc7, 0xbab8dd5d, 0x661c541d, 0xae0009ff, 0x03d4f516, 0x77870100],
+    ('tetris', 6, 15, 2): [0x5b85182e, 0x26010992, 0x127d6009, 0x820269b5, 0x648d0bf7, 0x6ce6ec74, 0x6b61e2cd, 0x8447ee4b],
+    ('tetris', 5, 12, 0): [0x0e85cd2f, 0xcfc90d86, 0x78491422, 0x959d2693, 0xc45ba22c, 0x00238cfb, 0x7e9c60bf, 0x837984db],
+    ('tetris', 5, 12, 1): [0xcd9f7e94, 0x7cabf670, 0xca8c8517, 0x783a13c7, 0x51029fbd, 0x98c28340, 0x9b657a50, 0x869dc4f8],
+    ('tetris', 5, 12, 2): [0xd3f71f09, 0x5db5e374, 0x3e4332b3, 0x9b966907, 0x6c55a350, 0xb27d15c0, 0x29b5c2c7, 0x8d55fb16],
+    ('tritris', 4, 5, 0): [0x940fba42, 0x42fd26a4, 0x54660d98, 0x9d56dc82, 0x525ef373, 0x79af12f2, 0xe48d9396, 0xfa840ae3],
+    ('tritris', 4, 5, 1): [0xceba0c76, 0x2545d8dc, 0xe9f34ee1, 0x6bc22d43, 0x538fb242, 0x126e3cd3, 0xd460d884, 0x274374e4],
+    ('tritris', 4, 5, 2): [0x226c3cb3, 0xc479c74a, 0xf567f027, 0x31473b43, 0x18b13241, 0x54309b64, 0xb5eb6083, 0x72dada2c],
+    ('tritris', 8, 10, 0): [0xd65a4333, 0xf3e03062, 0xe8ba9265, 0x72847f4e, 0x6c233cc0, 0x2b53a81f, 0x6b502916, 0x5a8c39f5],
+    ('tritris', 8, 10, 1): [0xa43a2ca7, 0xd192b25c, 0x889355e7, 0xd0d971eb, 0xee3077b5, 0x36283d4d, 0x6b3325ec, 0x5512e4b8],
+    ('tritris', 8, 10, 2): [0x044a9c2d, 0x9ddebab2, 0x78e24b71, 0x5c9ae4e8, 0x6eedd82f, 0x004c8ea2, 0x7068cf1b, 0xa0df5573],
+}
+
+def check(engines=None):
+    """
+    Compare each mode's engine (engines: {mode: cls}, default RulesEngine
+    and TritrisRules) against REFERENCE_TRACE. Raises AssertionError at the
+    first checkpoint that differs.
+    """
+    if engines is None:
+        from rules.tetris_rules import RulesEngine
+        from rules.tritris_rules import TritrisRules
+        engines = {"tetris": RulesEngine, "tritris": TritrisRules}
+    for (mode, width, height, seed), ref in REFERENCE_TRACE.items():
+        got = trace(engines[mode], width, height, seed=seed)
+        for i, (a, b) in enumerate(zip(ref, got)):
+            assert a == b, f"{engines[mode].__name__} {width}x{height} seed={seed}: differs by step {(i + 1) * 100}"
+
+if __name__ == "__main__":
+    check()
+    print(f"RulesEngine, TritrisRules: {len(REFERENCE_TRACE)} reference traces match")
@@ -0,0 +1,78 @@
+# rules/tracking.py
+# Change tracking shared by the rules engines. Every board mutation (lock,
+# line clear, restore, re-init) takes a new board version, so "did the board
+# change" is one int compare. DirtyCells turns that into the exact set of
+# cells whose rendered content changed since its last pop().
+import itertools
+
+_versions = itertools.count(1)
+
+def next_board_version():
+    # process-wide, so a re-initialised engine never repeats an old version
+    return next(_versions)
+
+def overlay_cells(rules):
+    """
+    {(x, y): value} for the ghost, current piece and preview, layered the way
+    renderer.compositor draws them over the board.
+    """
+    board = rules.board
+    w, h = rules.width, rules.height
+    out = {}
+    for (x, y, ch) in rules.get_ghost_cells():
+        if 0 <= x < w and 0 <= y < h and board[y][x] is None:
+            out[(x, y)] = ch
+    for (x, y, ch) in rules.get_current_cells():
+        if 0 <= x < w and 0 <= y < h:
+            out[(x, y)] = ch
+    for (x, y, ch) in rules.get_preview_cells():
+        if 0 <= x < w and 0 <= y < h and board[y][x] is None and (x, y) not in out:
+            out[(x, y)] = ch
+    return out
+
+class DirtyCells:
+    """
+    Per-consumer dirty tracking for one rules engine. pop() returns
+    {(x, y): value} for exactly the cells whose rendered value (board cell or
+    piece overlay, None = empty) changed since the previous pop(); the first
+    call returns every cell. Cost is proportional to the overlay size unless
+    the board version moved.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self._version = None
+        self._rows = None
+        self._overlay = {}
+
+    def pop(self):
+        rules = self.rules
+        board = rules.board
+        overlay = overlay_cells(rules)
+        rows = self._rows
+        if rows is None or len(rows) != rules.height or len(rows[0]) != rules.width:
+            rows = tuple(map(tuple, board))
+            dirty = {(x, y): overlay.get((x, y), cell)
+                     for y, row in enumerate(rows) for x, cell in enumerate(row)}
+        else:
+            old = self._overlay
+            cand = set(overlay)
+            cand.update(old)
+            if self._version != rules.board_version:
+                new_rows = tuple(map(tuple, board))
+                for y, row in enumerate(new_rows):
+                    old_row = rows[y]
+                    if row != old_row:
+                        cand.update((x, y) for x, cell in enumerate(row) if cell != old_row[x])
+            else:
+                new_rows = rows
+            dirty = {}
+            for p in cand:
+                x, y = p
+                now = overlay.get(p, new_rows[y][x])
+                if now != old.get(p, rows[y][x]):
+                    dirty[p] = now
+            rows = new_rows
+        self._version = rules.board_version
+        self._rows = rows
+        self._overlay = overlay
+        return dirty
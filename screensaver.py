@@ -1,49 +1,15 @@
 import pygame, time, math
+import numpy as np
+import profiling
 from sim.tetris_sim import TetrisSim
 from rules.tetris_rules import RulesEngine as TetrisRules
+from ai.planner import AIPlayer, PlacementPlanner, load_weights
+from renderer.compositor import FrameCompositor
+from renderer.pygame_display import CellRenderer, present
 
-# Duplicate utility functions here to avoid circular import.
-def build_frame_from_rules(rules_engine):
-    w = rules_engine.width
-    h = rules_engine.height
-    buf = [[None for _ in range(w)] for __ in range(h)]
-    bd = rules_engine.get_board()
-    for y in range(h):
-        for x in range(w):
-            buf[y][x] = bd[y][x]
-    for (x, y, ch) in rules_engine.get_ghost_cells():
-        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
-            buf[y][x] = ch
-    for (x, y, ch) in rules_engine.get_current_cells():
-        if 0 <= y < h and 0 <= x < w:
-            buf[y][x] = ch
-    for (x, y, ch) in rules_engine.get_preview_cells():
-        if 0 <= y < h and 0 <= x < w and buf[y][x] is None:
-            buf[y][x] = ch
-    return buf
-
-COLORS_TET = {
-    "I": (0,255,255),"O":(255,255,0),"T":(160,0,160),
-    "S":(0,255,0),"Z":(255,0,0),"J":(0,0,255),"L":(255,128,0),"X":(120,120,120)
-}
-def frame_to_rgb(frame, mode):
-    h = len(frame); w = len(frame[0])
-    out = []
-    for y in range(h):
-        row = []
-        for x in range(w):
-            cell = frame[y][x]
-            if cell is None:
-                row.append((0,0,0))
-            else:
-                ch = str(cell).upper()
-                if str(cell).islower():
-                    col = (10,10,10)
-                else:
-                    col = COLORS_TET.get(ch, (120,120,120))
-                row.append(col)
-        out.append(row)
-    return out
+# LED panel size the screensaver frame is composed for
+FRAME_W, FRAME_H = 10, 20
+BOTTLE_PIX = 24
 
 def pastel_fade_color(t):
     r = int(128 + 80 * math.sin(t * 0.2 + 0))
@@ -51,78 +17,30 @@ def pastel_fade_color(t):
     b = int(128 + 80 * math.sin(t * 0.2 + 4))
     return (r, g, b)
 
-def ss_ai_step(sim, dt):
-    import random
-
-    # Reset AI state if game over
+def ss_ai_step(sim, dt, ai):
+    # Reset the game (and the AI's cached plan) on game over
     if sim.is_game_over:
         sim.reset()
+        ai.reset()
         return
 
-    # Only act every N frames for more human-like speed
-    if not hasattr(ss_ai_step, "frame_counter"):
-        ss_ai_step.frame_counter = 0
-        ss_ai_step.action_delay = 6
-        ss_ai_step.move_dir = 0
-        ss_ai_step.move_timer = 0
-        ss_ai_step.target_x = None
-
-    ss_ai_step.frame_counter += 1
-
-    # If no target or piece locked, pick a new target x for the current piece
-    if ss_ai_step.target_x is None or not sim.rules.fits(sim.rules.x, sim.rules.y, sim.rules.rotation):
-        # Find all possible x positions for the current piece
-        piece = sim.rules.current
-        width = sim.rules.width
-        best_x = sim.rules.x
-        best_score = None
-        # Try all x positions and rotations, pick the lowest landing
-        for rot in range(4):
-            for x in range(-2, width+2):
-                y = sim.rules.y
-                # Simulate drop
-                while sim.rules.fits(x, y+1, rot):
-                    y += 1
-                if not sim.rules.fits(x, y, rot):
-                    continue
-                # Simple heuristic: prefer lowest y (deepest drop)
-                score = y
-                if best_score is None or score > best_score:
-                    best_score = score
-                    best_x = x
-                    best_rot = rot
-        ss_ai_step.target_x = best_x
-        ss_ai_step.target_rot = best_rot
-
-    # Move toward target rotation
-    if sim.rules.rotation != ss_ai_step.target_rot:
-        sim.rotate()
-        return
-
-    # Move toward target x
-    if sim.rules.x < ss_ai_step.target_x:
-        sim.input.press_right()
-        sim.input.release_left()
-    elif sim.rules.x > ss_ai_step.target_x:
-        sim.input.press_left()
-        sim.input.release_right()
-    else:
-        sim.input.release_left()
-        sim.input.release_right()
-        # If at target, soft drop or hard drop with some probability
-        if random.random() < 0.2:
-            sim.hard_drop()
-            ss_ai_step.target_x = None  # force new target next frame
-
-    # Always soft drop for a bit more speed
-    sim.update(dt, soft_hold=(random.random() < 0.2))
+    # The AI plans within its per-frame time budget and issues one input
+    ai.step(sim)
+    sim.update(dt)
 
-def run_screensaver(screen, usb, SS_W, SS_H, last_input_time):
+def run_screensaver(screen, usb, SS_W, SS_H, last_input_time,
+                    steps=1, dt=1/60, render=True, panel=True):
+    # same stepping/render/panel split as run_gameplay
     # Static state for screensaver
     if not hasattr(run_screensaver, "ss_rules"):
         run_screensaver.ss_rules = TetrisRules(SS_W, SS_H)
         run_screensaver.ss_sim = TetrisSim(run_screensaver.ss_rules)
+        # tuned weights from ai/tune.py if present, defaults otherwise
+        run_screensaver.ss_ai = AIPlayer(PlacementPlanner(load_weights()), action_delay=3)
+        run_screensaver.ss_comp = FrameCompositor(SS_W, SS_H, "tetris")
+        run_screensaver.ss_frame = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
         run_screensaver.ss_PIX = 24
+        run_screensaver.ss_view = CellRenderer(BOTTLE_PIX, (0, 0), (0,0,0), run_screensaver.ss_comp.palette)
         run_screensaver.ss_pos = [40, 40]
         run_screensaver.ss_vel = [2, 2]
         run_screensaver.ss_box = (SS_W * run_screensaver.ss_PIX, SS_H * run_screensaver.ss_PIX)
@@ -133,6 +51,7 @@ def run_screensaver(screen, usb, SS_W, SS_H, last_input_time):
     ss_pos = run_screensaver.ss_pos
     ss_vel = run_screensaver.ss_vel
     ss_box = run_screensaver.ss_box
+    prof = profiling.PROFILER
 
     # Handle exit events
     for ev in pygame.event.get():
@@ -141,49 +60,48 @@ def run_screensaver(screen, usb, SS_W, SS_H, last_input_time):
             exit(0)
         elif ev.type in (pygame.KEYDOWN, pygame.JOYBUTTONDOWN, pygame.JOYHATMOTION):
             return True  # exit screensaver
+        elif ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            run_screensaver.ss_view.invalidate()
+    prof.lap("input")
+
+    for _ in range(steps):
+        # Move subscreen
+        ss_pos[0] += ss_vel[0]
+        ss_pos[1] += ss_vel[1]
+        if ss_pos[0] <= 0 or ss_pos[0] + ss_box[0] >= screen.get_width():
+            ss_vel[0] *= -1
+            ss_pos[0] = max(0, min(ss_pos[0], screen.get_width() - ss_box[0]))
+        if ss_pos[1] <= 0 or ss_pos[1] + ss_box[1] >= screen.get_height():
+            ss_vel[1] *= -1
+            ss_pos[1] = max(0, min(ss_pos[1], screen.get_height() - ss_box[1]))
+
+        ss_ai_step(ss_sim, dt, run_screensaver.ss_ai)
+    prof.lap("sim")
+
+    if not (render or panel):
+        return False
 
-    # Move subscreen
-    ss_pos[0] += ss_vel[0]
-    ss_pos[1] += ss_vel[1]
-    if ss_pos[0] <= 0 or ss_pos[0] + ss_box[0] >= screen.get_width():
-        ss_vel[0] *= -1
-        ss_pos[0] = max(0, min(ss_pos[0], screen.get_width() - ss_box[0]))
-    if ss_pos[1] <= 0 or ss_pos[1] + ss_box[1] >= screen.get_height():
-        ss_vel[1] *= -1
-        ss_pos[1] = max(0, min(ss_pos[1], screen.get_height() - ss_box[1]))
-
-    ss_ai_step(ss_sim, 1/60)
-
-    FRAME_W, FRAME_H = 10, 20
-    BOTTLE_PIX = 24
     fade_color = pastel_fade_color(time.time())
-    frame_rgb = [[fade_color for _ in range(FRAME_W)] for _ in range(FRAME_H)]
+    frame_rgb = run_screensaver.ss_frame
+    frame_rgb[:] = fade_color
 
     ss_grid_x = int(round(ss_pos[0] / (screen.get_width() / FRAME_W)))
     ss_grid_y = int(round(ss_pos[1] / (screen.get_height() / FRAME_H)))
     ss_grid_x = max(0, min(FRAME_W - SS_W, ss_grid_x))
     ss_grid_y = max(0, min(FRAME_H - SS_H, ss_grid_y))
 
-    ss_frame = build_frame_from_rules(ss_rules)
-    ss_rgb = frame_to_rgb(ss_frame, "tetris")
-    for y in range(SS_H):
-        for x in range(SS_W):
-            gx = ss_grid_x + x
-            gy = ss_grid_y + y
-            if 0 <= gx < FRAME_W and 0 <= gy < FRAME_H:
-                frame_rgb[gy][gx] = ss_rgb[y][x]
+    ss_rgb = run_screensaver.ss_comp.compose(ss_rules)
+    frame_rgb[ss_grid_y:ss_grid_y + SS_H, ss_grid_x:ss_grid_x + SS_W] = ss_rgb[:FRAME_H - ss_grid_y, :FRAME_W - ss_grid_x]
+    prof.lap("compose")
 
-    if usb:
+    if usb and panel:
         from renderer.usb_frame import send_frame
         send_frame(usb, frame_rgb, FRAME_W, FRAME_H)
+        prof.lap("send")
 
-    screen.fill((0,0,0))
-    for y in range(FRAME_H):
-        for x in range(FRAME_W):
-            r,g,b = frame_rgb[y][x]
-            pygame.draw.rect(
-                screen, (r,g,b),
-                (x*BOTTLE_PIX, y*BOTTLE_PIX, BOTTLE_PIX-1, BOTTLE_PIX-1)
-            )
-    pygame.display.flip()
+    if render:
+        rects = run_screensaver.ss_view.draw(screen, frame_rgb)
+        prof.lap("draw")
+        present(rects)
+        prof.lap("present")
     return False  # stay in screensaver
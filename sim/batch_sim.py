@@ -0,0 +1,441 @@
+# sim/batch_sim.py
+# N independent games stepped together with NumPy. Boards are N x height
+# row bitmasks (collision, line clears) plus an N x height x width uint8
+# colour grid (rendering, parity), both padded with off-board rows so the
+# hot paths need no bounds tests. No step loops over games in Python; piece
+# draws come from per-game queues refilled in bulk. Every rule mirrors
+# TetrisSim/RulesEngine step for step, so game i matches a TetrisSim whose
+# rules were built with rng=make_randomizer(randomizer, seeds[i]) (for the
+# default bag that is rng=random.Random(seeds[i])) and which received the
+# same inputs.
+
+import numpy as np
+
+from rules.tetris_rules import TETROMINOES
+from rules.tritris_rules import TRITRIS
+from rules.randomizer import PieceStream, make_randomizer
+
+PIECE_BLOCK = 64                        # deals taken from a game's stream at once
+PAD = 4                                 # off-board rows/columns around every board (>= piece box)
+
+MODES = {"tetris": TETROMINOES, "tritris": TRITRIS}
+
+def level_to_delay(level):
+    # same formula as TetrisSim.level_to_delay
+    base = 1.0
+    return max(0.03, base * (0.8 ** level))
+
+def _piece_tables(pieces):
+    # dense per (piece, rotation) tables for fancy indexing
+    names, masks, kicks = pieces.names, pieces.masks, pieces.kicks
+    n = len(names)
+    rows_k = max(c[3] for name in names for c in masks[name]) + 1
+    cells_k = max(len(c[5]) for name in names for c in masks[name])
+    kicks_k = max(len(kicks[name][r]) for name in names for r in range(4))
+    bounds = np.zeros((n, 4, 4), dtype=np.int64)          # minx, maxx, miny, maxy
+    rowmask = np.zeros((n, 4, rows_k), dtype=np.int64)    # mask per dy at x=0
+    cells = np.zeros((n, 4, cells_k, 2), dtype=np.int64)   # short pieces repeat a cell
+    kick = np.zeros((n, 4, kicks_k, 2), dtype=np.int64)
+    kick_ok = np.zeros((n, 4, kicks_k), dtype=bool)
+    for p, name in enumerate(names):
+        for r in range(4):
+            minx, maxx, miny, maxy, rows, cl = masks[name][r]
+            bounds[p, r] = (minx, maxx, miny, maxy)
+            for dy, m in rows:
+                rowmask[p, r, dy] = m
+            cells[p, r] = [cl[min(i, len(cl) - 1)] for i in range(cells_k)]
+            for i, k in enumerate(kicks[name][r]):
+                kick[p, r, i] = k
+                kick_ok[p, r, i] = True
+    return bounds, rowmask, cells, kick, kick_ok
+
+def _shift_table(bounds, rowmask, width):
+    # row masks already shifted to every x in [-PAD, width + PAD), and
+    # whether that x keeps the piece inside the walls, per (piece * 4 + rot)
+    xs = np.arange(-PAD, width + PAD)
+    b = bounds.reshape(-1, 1, 4)
+    legal = (xs >= -b[:, :, 0]) & (xs <= width - 1 - b[:, :, 1])
+    masks = rowmask.reshape(-1, 1, rowmask.shape[2])
+    shifted = np.where(legal[:, :, None], masks << np.maximum(xs, 0)[:, None] >> np.maximum(-xs, 0)[:, None], 0)
+    return shifted.reshape(-1, rowmask.shape[2]), legal.ravel()
+
+class BatchTetrisSim:
+    def __init__(self, n, width=10, height=20, mode="tetris", seeds=None, level=0, lock_delay=0.5,
+                 das_frames=12, arr_frames=1, randomizer="bag"):
+        if width > 62:
+            raise ValueError("BatchTetrisSim supports boards up to 62 cells wide")
+        self.n = n
+        self.width = width
+        self.height = height
+        self.mode = mode
+        pieces = MODES[mode]
+        self.names = pieces.names
+        self.spawn_y = pieces.spawn_y
+        self.open_top = pieces.open_top
+        self._bounds, self._rowmask, cells, self._kick, self._kick_ok = _piece_tables(pieces)
+        # cell offsets into a game's flattened colour grid per (piece * 4 + rot)
+        self._cell_off = (cells[..., 1] * width + cells[..., 0]).reshape(-1, cells.shape[2])
+        self._dy = np.arange(self._rowmask.shape[2])
+        # the narrowest row type that holds the board, to keep it in cache
+        self._row_type = np.int16 if width < 16 else np.int32 if width < 32 else np.int64
+        self._xmask, self._x_ok = _shift_table(self._bounds, self._rowmask, width)
+        self._xmask = self._xmask.astype(self._row_type)
+        self.spawn_x = (width // 2) + pieces.spawn_dx
+        # each piece's rows at the spawn pose, for the game-over test
+        spawn = (np.arange(len(self.names)) * 4) * (width + 2 * PAD) + self.spawn_x + PAD
+        self._spawn_mask = self._xmask[spawn]
+        self._spawn_ok = self._x_ok[spawn]
+        self._spawn_rows = slice(PAD + self.spawn_y, PAD + self.spawn_y + self._dy.size)
+        self.full_row = (1 << width) - 1
+        self.lock_delay = lock_delay
+        self.das = das_frames
+        self.arr = arr_frames
+        if seeds is None:
+            seeds = range(n)
+        self._deal = len(self.names)
+        block = PIECE_BLOCK * self._deal
+        self._streams = [PieceStream(make_randomizer(randomizer, s), self.names, block) for s in seeds]
+        # the next `block` piece indices of every game, and how many are used
+        self._queue = np.zeros((n, block), dtype=np.uint8)
+        self._qpos = np.full(n, block, dtype=np.int64)
+
+        # boards padded by PAD rows above (empty, or full for a closed top)
+        # and below (full), so _fits needs no y bounds test and _lock no
+        # clipping; rows and colors are the visible parts
+        self._board = np.zeros((n, PAD + height + PAD), dtype=self._row_type)
+        self._board[:, PAD + height:] = -1
+        if not self.open_top:
+            self._board[:, :PAD] = -1
+        self.rows = self._board[:, PAD:PAD + height]
+        self._colors = np.zeros((n, PAD + height + PAD, width), dtype=np.uint8)
+        self.colors = self._colors[:, PAD:PAD + height]     # 0 empty, else piece index + 1
+        self.piece = np.zeros(n, dtype=np.int64)
+        self.next_piece = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.rot = np.zeros(n, dtype=np.int64)
+        self.level = np.full(n, level, dtype=np.int64)
+        self.fall_speed = np.full(n, level_to_delay(level))
+        self.lock_timer = np.zeros(n)
+        self._fall_acc = np.zeros(n)
+        self.last_lines = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.left_held = np.zeros(n, dtype=bool)
+        self.right_held = np.zeros(n, dtype=bool)
+        self.left_counter = np.zeros(n, dtype=np.int64)
+        self.right_counter = np.zeros(n, dtype=np.int64)
+        self._new_game(np.arange(n))
+
+    # --- piece stream (same deals as RulesEngine._refill_bag) ---
+
+    def _draw(self, g):
+        # next piece of each game in g, from its row of the queue; a used-up
+        # row is refilled with PIECE_BLOCK whole deals from the game's stream
+        pos = self._qpos[g]
+        empty = pos == self._queue.shape[1]
+        if empty.any():
+            for i in g[empty]:
+                self._queue[i] = self._streams[i].take(self._queue.shape[1])
+            pos[empty] = 0
+        self._qpos[g] = pos + 1
+        return self._queue[g, pos]
+
+    def _new_game(self, g):
+        # RulesEngine.__init__ starts from an empty bag: skip to the next deal
+        k = self._deal
+        self._qpos[g] = -(-self._qpos[g] // k) * k
+        self.piece[g] = self._draw(g)
+        self.next_piece[g] = self._draw(g)
+        self._spawn_pose(g)
+
+    def _spawn_pose(self, g):
+        self.x[g] = self.spawn_x
+        self.y[g] = self.spawn_y
+        self.rot[g] = 0
+
+    def reset(self, mask=None):
+        # TetrisSim.reset for the selected games (default: all finished games)
+        idx = self._select(self.game_over if mask is None else mask)
+        if not len(idx):
+            return
+        self.rows[idx] = 0
+        self.colors[idx] = 0
+        self.level[idx] = 0
+        self.fall_speed[idx] = level_to_delay(0)
+        self.lock_timer[idx] = 0.0
+        self._fall_acc[idx] = 0.0
+        self.last_lines[idx] = 0
+        self.game_over[idx] = False
+        self.left_held[idx] = False
+        self.right_held[idx] = False
+        self.left_counter[idx] = 0
+        self.right_counter[idx] = 0
+        self._new_game(idx)
+
+    # --- vectorized rules ---
+
+    def _fits(self, g, x, y, rot):
+        # the walls come from the shift table, the floor (and a closed top)
+        # from the padding rows; x and y are clipped into the padded range,
+        # which changes no answer
+        span = self.width + 2 * PAD
+        xi = np.minimum(np.maximum(x + PAD, 0), span - 1)
+        xi += (self.piece[g] * 4 + rot) * span
+        rows = np.minimum(np.maximum(y + PAD, 0), self.height + PAD)
+        rows += g * self._board.shape[1]
+        cell = rows[:, None] + self._dy
+        hit = self._board.reshape(-1).take(cell) & self._xmask.take(xi, axis=0)
+        return self._x_ok.take(xi) & ~hit.any(axis=1)
+
+    def _move(self, g, dx):
+        ok = self._fits(g, self.x[g] + dx, self.y[g], self.rot[g])
+        g = g[ok]
+        self.x[g] += dx
+        self.lock_timer[g] = 0.0
+
+    def _lock(self, g):
+        # whole shifted piece rows into the padded board (every (game, row)
+        # pair is written once, so a plain fancy |= is safe) and the piece's
+        # cells into the padded colour grid. Cells above an open top land in
+        # the padding, and the board's is blanked again (RulesEngine drops
+        # them).
+        p = self.piece[g]
+        pr = p * 4 + self.rot[g]
+        x = self.x[g]
+        top = np.maximum(self.y[g] + PAD, 0)
+        masks = self._xmask.take(pr * (self.width + 2 * PAD) + x + PAD, axis=0)
+        self._board[g[:, None], top[:, None] + self._dy] |= masks
+        base = (g * self._colors.shape[1] + top) * self.width + x
+        self._colors.reshape(-1)[base[:, None] + self._cell_off.take(pr, axis=0)] = (p + 1)[:, None]
+        if self.open_top:
+            self._board[g, :PAD] = 0
+        # spawn_piece
+        self.piece[g] = self.next_piece[g]
+        self.next_piece[g] = self._draw(g)
+        self._spawn_pose(g)
+
+    def _clear_lines(self, g):
+        full = self.rows[g] == self.full_row
+        cleared = full.sum(axis=1)
+        sel = cleared > 0
+        if sel.any():
+            gs = g[sel]
+            full = full[sel]
+            # full rows first (to be blanked), survivors after in original order
+            order = np.argsort(~full, axis=1, kind="stable")
+            blank = np.arange(self.height)[None, :] < cleared[sel][:, None]
+            rows = np.take_along_axis(self.rows[gs], order, axis=1)
+            rows[blank] = 0
+            self.rows[gs] = rows
+            colors = np.take_along_axis(self.colors[gs], order[:, :, None], axis=1)
+            colors[blank] = 0
+            self.colors[gs] = colors
+        return cleared
+
+    def _lock_and_clear(self, g):
+        self._lock(g)
+        self.last_lines[g] = self._clear_lines(g)
+        self.lock_timer[g] = 0.0
+        # _fits() at the spawn pose, every game of g has just spawned
+        p = self.piece[g]
+        hit = self._board[g, self._spawn_rows] & self._spawn_mask[p]
+        self.game_over[g] = hit.any(axis=1) | ~self._spawn_ok[p]
+
+    def _select(self, mask):
+        if mask is None:
+            return np.arange(self.n)
+        mask = np.asarray(mask)
+        if mask.shape != (self.n,):
+            mask = np.broadcast_to(mask, (self.n,))
+        return mask.nonzero()[0]
+
+    # --- TetrisSim API, one mask entry per game ---
+
+    def press_left(self, mask=None):
+        g = self._select(mask)
+        self.left_held[g] = True
+        self.left_counter[g] = 0
+
+    def release_left(self, mask=None):
+        g = self._select(mask)
+        self.left_held[g] = False
+        self.left_counter[g] = 0
+
+    def press_right(self, mask=None):
+        g = self._select(mask)
+        self.right_held[g] = True
+        self.right_counter[g] = 0
+
+    def release_right(self, mask=None):
+        g = self._select(mask)
+        self.right_held[g] = False
+        self.right_counter[g] = 0
+
+    def move(self, dx, mask=None):
+        if dx:
+            self._move(self._select(mask), -1 if dx < 0 else 1)
+
+    def rotate(self, mask=None):
+        # TetrisSim.rotate has no game-over guard either. Most rotations
+        # take the first kick; the games where it does not fit try all their
+        # other kicks in one _fits() and take the first one that fits.
+        g = self._select(mask)
+        if not len(g):
+            return
+        p = self.piece[g]
+        r = self.rot[g]
+        kick = self._kick[p, r]
+        new_rot = (r + 1) % 4
+        x = self.x[g]
+        y = self.y[g]
+        turned = self._kick_ok[p, r, 0] & self._fits(g, x + kick[:, 0, 0], y + kick[:, 0, 1], new_rot)
+        first = np.zeros(len(g), dtype=np.int64)
+        rest = (~turned).nonzero()[0]
+        if len(rest):
+            k = kick.shape[1] - 1
+            more = kick[rest, 1:]
+            ok = self._kick_ok[p[rest], r[rest], 1:] & self._fits(
+                np.repeat(g[rest], k), (x[rest][:, None] + more[:, :, 0]).ravel(),
+                (y[rest][:, None] + more[:, :, 1]).ravel(), np.repeat(new_rot[rest], k)).reshape(-1, k)
+            turned[rest] = ok.any(axis=1)
+            first[rest] = ok.argmax(axis=1) + 1
+        kick = kick[turned, first[turned]]
+        g = g[turned]
+        self.x[g] += kick[:, 0]
+        self.y[g] += kick[:, 1]
+        self.rot[g] = new_rot[turned]
+        self.lock_timer[g] = 0.0
+
+    def soft_drop(self, mask=None):
+        g = self._select(mask)
+        ok = self._fits(g, self.x[g], self.y[g] + 1, self.rot[g])
+        g = g[ok]
+        self.y[g] += 1
+        self.lock_timer[g] = 0.0
+        return ok
+
+    def _drop_distance(self, g):
+        # rows each piece can fall: the piece's shifted rows slid down the
+        # whole padded board at once (one and per piece row) instead of a
+        # python loop of one-row steps
+        span = self.width + 2 * PAD
+        masks = self._xmask.take((self.piece[g] * 4 + self.rot[g]) * span + self.x[g] + PAD, axis=0)
+        board = self._board[g]
+        k = masks.shape[1]
+        top = board.shape[1] - k + 1
+        hit = board[:, :top] & masks[:, :1]
+        for dy in range(1, k):
+            hit |= board[:, dy:dy + top] & masks[:, dy:dy + 1]
+        # first blocked row below the piece; the floor guarantees one exists
+        y = self.y[g] + PAD
+        blocked = (hit != 0) & (np.arange(top) > y[:, None])
+        return blocked.argmax(axis=1) - y - 1
+
+    def hard_drop(self, mask=None):
+        g = self._select(mask)
+        g = g[~self.game_over[g]]
+        if len(g):
+            self.y[g] += self._drop_distance(g)
+            self._lock_and_clear(g)
+
+    def _autorepeat(self, active):
+        # a released key's counter is already 0 (press, release and reset
+        # all zero it), so only held keys need work
+        for held, counter, dx in ((self.left_held, self.left_counter, -1),
+                                  (self.right_held, self.right_counter, 1)):
+            h = active & held
+            if not h.any():
+                continue
+            repeat = counter > self.das
+            if self.arr > 1:
+                repeat &= (counter - self.das) % self.arr == 0
+            due = h & ((counter == 0) | repeat)
+            if due.any():
+                self._move(due.nonzero()[0], dx)
+            counter += h
+
+    def update(self, dt, soft_hold=False):
+        """
+        One TetrisSim.update(dt, soft_hold) for every game. soft_hold may be a
+        bool or a per-game bool array. Finished games are left untouched.
+        """
+        active = ~self.game_over
+        self._autorepeat(active)
+        delay = self.fall_speed * np.where(soft_hold, 0.1, 1.0)
+        self._fall_acc += dt * active
+        tick = active & (self._fall_acc >= delay)
+        if not tick.any():
+            return
+        g = tick.nonzero()[0]
+        self._fall_acc[g] -= delay[g]
+        ok = self._fits(g, self.x[g], self.y[g] + 1, self.rot[g])
+        down = g[ok]
+        self.y[down] += 1
+        self.lock_timer[down] = 0.0
+        stuck = g[~ok]
+        self.lock_timer[stuck] += delay[stuck]
+        lock = stuck[self.lock_timer[stuck] >= self.lock_delay]
+        if len(lock):
+            self._lock_and_clear(lock)
+
+    # --- views ---
+
+    def get_board(self, i):
+        # colour view of game i in RulesEngine.get_board() form
+        names = [None] + self.names
+        return [[names[c] for c in row] for row in self.colors[i].tolist()]
+
+    def state(self, i):
+        return (self.get_board(i), self.names[self.piece[i]], self.names[self.next_piece[i]],
+                int(self.x[i]), int(self.y[i]), int(self.rot[i]), float(self.lock_timer[i]),
+                float(self._fall_acc[i]), int(self.last_lines[i]), bool(self.game_over[i]))
+
+def sim_state(sim):
+    # the BatchTetrisSim.state() tuple for a scalar TetrisSim
+    r = sim.rules
+    return (r.get_board(), r.current, r.next_piece, r.x, r.y, r.rotation, sim.lock_timer,
+            sim._fall_acc, sim.last_lines, sim.game_over)
+
+def check_parity(n=32, steps=3000, width=10, height=20, mode="tetris", seed=0, randomizer="bag"):
+    """
+    Feed a BatchTetrisSim and n scalar TetrisSims identical random inputs and
+    compare every game after every step. Raises AssertionError on mismatch.
+    """
+    from rules.tetris_rules import RulesEngine
+    from rules.tritris_rules import TritrisRules
+    from sim.tetris_sim import TetrisSim
+    cls = RulesEngine if mode == "tetris" else TritrisRules
+    seeds = [seed * 1000 + i for i in range(n)]
+    batch = BatchTetrisSim(n, width, height, mode, seeds, randomizer=randomizer)
+    sims = [TetrisSim(cls(width, height, rng=make_randomizer(randomizer, s))) for s in seeds]
+    rng = np.random.default_rng(seed)
+    dt = 1 / 60
+    for step in range(steps):
+        ev = rng.random((6, n)) < np.array([[0.03], [0.03], [0.05], [0.05], [0.04], [0.01]])
+        soft = rng.random(n) < 0.3
+        batch.press_left(ev[0]); batch.press_right(ev[1])
+        batch.release_left(ev[2]); batch.release_right(ev[3])
+        batch.rotate(ev[4]); batch.hard_drop(ev[5])
+        batch.update(dt, soft)
+        batch.reset(batch.game_over & (rng.random(n) < 0.05))
+        for i, sim in enumerate(sims):
+            if ev[0, i]: sim.input.press_left()
+            if ev[1, i]: sim.input.press_right()
+            if ev[2, i]: sim.input.release_left()
+            if ev[3, i]: sim.input.release_right()
+            if ev[4, i]: sim.rotate()
+            if ev[5, i]: sim.hard_drop()
+            sim.update(dt, soft_hold=bool(soft[i]))
+        # the reset draw above happened on the batch; mirror it per game
+        for i, sim in enumerate(sims):
+            if sim.game_over and not batch.game_over[i]:
+                sim.reset()
+            assert batch.state(i) == sim_state(sim), f"step {step}: game {i} differs"
+    return int(batch.last_lines.sum())
+
+if __name__ == "__main__":
+    for mode, w, h in (("tetris", 10, 20), ("tetris", 6, 12), ("tritris", 4, 5)):
+        check_parity(n=24, steps=2000, width=w, height=h, mode=mode, seed=1)
+        print(f"{mode} {w}x{h}: batch matches TetrisSim")
+    check_parity(n=24, steps=2000, seed=1, randomizer="history")
+    print("tetris 10x20, history randomizer: batch matches TetrisSim")
@@ -0,0 +1,98 @@
+# sim/frame_clock.py
+# Fixed-timestep scheduling for the main loop. Game logic advances in fixed
+# steps of 1/logic_hz from an accumulator of real elapsed time, so a slow
+# frame is caught up with extra sub-steps (capped) instead of slowing the
+# game down. Rendering and LED panel output run on their own rates. Frame
+# times are kept in a ring buffer for stats. Nothing here touches pygame.
+import collections, time
+
+class FixedStepClock:
+    def __init__(self, logic_hz=60, render_hz=60, panel_hz=60, max_substeps=5, history=1200):
+        self.logic_hz = logic_hz
+        self.render_hz = render_hz
+        self.panel_hz = panel_hz
+        self.dt = 1.0 / logic_hz          # what TetrisSim.update gets per step
+        self.step_ns = round(1e9 / logic_hz)
+        self.render_ns = round(1e9 / render_hz)
+        self.panel_ns = round(1e9 / panel_hz)
+        self.max_substeps = max_substeps
+        # the loop should wake at the fastest of the three rates
+        self.loop_hz = max(logic_hz, render_hz, panel_hz)
+        # a render/panel frame is due if it falls within half a loop period,
+        # so wake-up jitter does not halve the effective rate
+        self._slack = round(1e9 / self.loop_hz) // 2
+        self.frame_ns = collections.deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        self._last = None
+        self._acc = 0
+        self._next_render = None
+        self._next_panel = None
+        self._start = None
+        self.frames = 0
+        self.steps = 0
+        self.renders = 0
+        self.panel_frames = 0
+        self.dropped_steps = 0
+        self.frame_ns.clear()
+
+    def _due(self, now, next_at, period):
+        if now + self._slack < next_at:
+            return False, next_at
+        next_at += period
+        if next_at <= now:
+            # fell behind: skip, don't burst
+            next_at = now + period
+        return True, next_at
+
+    def tick(self, now_ns=None):
+        """
+        Call once per loop iteration. Returns (steps, render, panel): how many
+        fixed logic steps to run now, and whether to render / send a panel
+        frame this iteration.
+        """
+        now = time.perf_counter_ns() if now_ns is None else now_ns
+        if self._last is None:
+            self._start = self._last = now
+            self._next_render = self._next_panel = now
+        frame = now - self._last
+        self._last = now
+        self.frames += 1
+        if frame:
+            self.frame_ns.append(frame)
+        self._acc += frame
+        steps = self._acc // self.step_ns
+        if steps > self.max_substeps:
+            # too far behind to catch up: run the cap, drop the rest
+            self.dropped_steps += steps - self.max_substeps
+            steps = self.max_substeps
+            self._acc %= self.step_ns
+        else:
+            self._acc -= steps * self.step_ns
+        self.steps += steps
+        render, self._next_render = self._due(now, self._next_render, self.render_ns)
+        panel, self._next_panel = self._due(now, self._next_panel, self.panel_ns)
+        self.renders += render
+        self.panel_frames += panel
+        return steps, render, panel
+
+    def stats(self):
+        elapsed = (self._last - self._start) / 1e9 if self._start is not None else 0.0
+        times = sorted(self.frame_ns)
+        def pct(p):
+            return times[min(len(times) - 1, len(times) * p // 100)] / 1e6 if times else 0.0
+        rate = (lambda n: n / elapsed) if elapsed else (lambda n: 0.0)
+        return {
+            "elapsed_s": elapsed,
+            "loop_frames": self.frames,
+            "logic_steps_per_s": rate(self.steps),
+            "render_fps": rate(self.renders),
+            "panel_fps": rate(self.panel_frames),
+            "dropped_steps": self.dropped_steps,
+            "frame_ms": {
+                "avg": sum(times) / len(times) / 1e6 if times else 0.0,
+                "p50": pct(50), "p95": pct(95), "p99": pct(99),
+                "max": times[-1] / 1e6 if times else 0.0,
+            },
+        }
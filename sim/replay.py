@@ -0,0 +1,412 @@
+# sim/replay.py
+# Record every input a TetrisSim receives and replay it headless, skipping
+# the frames in which nothing happens (TetrisSim.step_frames). A recording is
+# a JSON header followed by a byte stream:
+#
+#   0x80 | n         n update() calls (1..127) with the current dt/soft-hold
+#   OP_* (< 0x80)    one input call, in call order between updates
+#   OP_DT f64        dt for the following updates
+#   OP_CHECK u32     crc32 of the whole sim state at this point
+#   OP_KEYFRAME u32 frame, u32 len, zlib(repr(sim snapshot))
+#
+# An idle second at 60 Hz is one byte. Keyframes (one at frame 0, then every
+# keyframe_every frames) are full snapshots, randomizer state included, so
+# replaying and seeking from any of them needs nothing but the file. The stream is flushed
+# at every checksum and keyframe, so a file cut short by a crash loses at
+# most check_every frames and reads up to its last complete record.
+#
+# Record:  sim = RecordingSim(TetrisSim(rules), "game.ktr") ... sim.close()
+#          (main.py --record FILE does this)
+# Replay:  python -m sim.replay game.ktr [--seek FRAME] [--no-verify] [--json]
+import argparse, ast, importlib, json, random, struct, sys, time, zlib
+
+from rules.randomizer import PieceStream, Randomizer, make_randomizer
+from sim.tetris_sim import TetrisSim
+
+MAGIC = b"KTR2\n"
+HEADER_LEN = struct.Struct("<Q")
+
+(OP_PRESS_LEFT, OP_RELEASE_LEFT, OP_PRESS_RIGHT, OP_RELEASE_RIGHT, OP_MOVE_LEFT, OP_MOVE_RIGHT,
+ OP_ROTATE, OP_HARD_DROP, OP_SOFT_DROP, OP_SOFT_ON, OP_SOFT_OFF, OP_RESET,
+ OP_DT, OP_CHECK, OP_KEYFRAME, OP_END) = range(16)
+RUN = 0x80
+MAX_RUN = 0x7F
+DT = struct.Struct("<d")
+U32 = struct.Struct("<I")
+
+def state_checksum(sim):
+    return zlib.crc32(repr(sim.snapshot()).encode())
+
+def _pieces_name(rules):
+    # "module.NAME" of the module-level PieceSet the engine plays, None for
+    # its class default
+    pieces = rules.pieces
+    if pieces is type(rules).PIECES:
+        return None
+    first = sys.modules[type(rules).__module__]
+    for module in [first] + [m for m in list(sys.modules.values()) if m is not first]:
+        if module.__name__ == "__main__":
+            continue
+        for name, value in list(vars(module).items()):
+            if value is pieces:
+                return f"{module.__name__}.{name}"
+    raise ValueError("cannot record an engine with a piece set that is not a module global")
+
+def _load_pieces(name, engine_module):
+    module, _, attr = name.rpartition(".")
+    return getattr(importlib.import_module(module or engine_module), attr)
+
+class _RecordingInput:
+    # stands in for sim.input; always forwards to the sim's current InputState
+    def __init__(self, rec):
+        self._rec = rec
+
+    def __getattr__(self, name):
+        return getattr(self._rec._sim.input, name)
+
+    def press_left(self):
+        self._rec._op(OP_PRESS_LEFT)
+        self._rec._sim.input.press_left()
+
+    def release_left(self):
+        self._rec._op(OP_RELEASE_LEFT)
+        self._rec._sim.input.release_left()
+
+    def press_right(self):
+        self._rec._op(OP_PRESS_RIGHT)
+        self._rec._sim.input.press_right()
+
+    def release_right(self):
+        self._rec._op(OP_RELEASE_RIGHT)
+        self._rec._sim.input.release_right()
+
+class RecordingSim:
+    """
+    Wraps a TetrisSim and writes every input call and update() to `out` (a
+    path or binary file). Use it wherever the TetrisSim was used; anything
+    not listed here goes straight to the sim. The rules engine needs a
+    seeded randomizer (not the global RNG), or a PieceStream, for the game
+    to be replayable.
+    """
+    def __init__(self, sim, out, check_every=60, keyframe_every=3600):
+        randomizer = sim.rules.randomizer
+        stream = isinstance(randomizer, PieceStream)
+        source = randomizer.source if stream else randomizer
+        if not (stream or isinstance(source, Randomizer)) or getattr(source, "rng", None) is random:
+            raise ValueError("recording needs a seeded Randomizer or a PieceStream as the rules engine's rng")
+        self._sim = sim
+        self._f = open(out, "wb") if isinstance(out, str) else out
+        self._own = isinstance(out, str)
+        self.check_every = check_every
+        self.keyframe_every = keyframe_every
+        self.input = _RecordingInput(self)
+        self.frame = 0
+        self._run = 0
+        self._dt = None
+        self._soft = False
+        self._buf = bytearray()
+        rules = sim.rules
+        header = {
+            "engine": f"{type(rules).__module__}.{type(rules).__qualname__}",
+            "pieces": _pieces_name(rules),
+            "width": rules.width, "height": rules.height,
+            "level": sim.level, "lock_delay": sim.lock_delay,
+            "randomizer": randomizer.mode, "stream": stream,
+            "seed": source.seed if isinstance(getattr(source, "seed", None), int) else None,
+            "check_every": check_every, "keyframe_every": keyframe_every,
+            "created": time.time(),
+        }
+        text = json.dumps(header).encode("utf-8")
+        self._f.write(MAGIC + HEADER_LEN.pack(len(text)) + text)
+        self._keyframe()
+
+    def __getattr__(self, name):
+        return getattr(self._sim, name)
+
+    def _flush_run(self):
+        if self._run:
+            self._buf.append(RUN | self._run)
+            self._run = 0
+
+    def _op(self, op):
+        self._flush_run()
+        self._buf.append(op)
+
+    def _write(self):
+        self._f.write(self._buf)
+        self._buf.clear()
+        self._f.flush()
+
+    def _keyframe(self):
+        self._flush_run()
+        blob = zlib.compress(repr(self._sim.snapshot()).encode())
+        self._buf += bytes((OP_KEYFRAME,)) + U32.pack(self.frame) + U32.pack(len(blob)) + blob
+        self._write()
+
+    def move(self, dx):
+        self._op(OP_MOVE_LEFT if dx < 0 else OP_MOVE_RIGHT)
+        self._sim.move(dx)
+
+    def rotate(self):
+        self._op(OP_ROTATE)
+        self._sim.rotate()
+
+    def soft_drop(self):
+        self._op(OP_SOFT_DROP)
+        return self._sim.soft_drop()
+
+    def hard_drop(self):
+        self._op(OP_HARD_DROP)
+        self._sim.hard_drop()
+
+    def reset(self):
+        self._op(OP_RESET)
+        self._sim.reset()
+
+    def update(self, dt, soft_hold=False):
+        soft_hold = bool(soft_hold)
+        if dt != self._dt:
+            self._op(OP_DT)
+            self._buf += DT.pack(dt)
+            self._dt = dt
+        if soft_hold != self._soft:
+            self._op(OP_SOFT_ON if soft_hold else OP_SOFT_OFF)
+            self._soft = soft_hold
+        self._sim.update(dt, soft_hold)
+        self.frame += 1
+        self._run += 1
+        if self._run == MAX_RUN:
+            self._flush_run()
+        if self.keyframe_every and self.frame % self.keyframe_every == 0:
+            self._keyframe()
+        elif self.check_every and self.frame % self.check_every == 0:
+            self._op(OP_CHECK)
+            self._buf += U32.pack(state_checksum(self._sim))
+            self._write()
+
+    def close(self):
+        if self._f is None:
+            return
+        self._keyframe()
+        self._f.write(bytes((OP_END,)))
+        if self._own:
+            self._f.close()
+        self._f = None
+
+def _parse(data, pos):
+    # records as (op, arg); RUN arg is the frame count. Stops at OP_END or
+    # at the first incomplete record.
+    records = []
+    n = len(data)
+    while pos < n:
+        op = data[pos]
+        if op & RUN:
+            records.append((RUN, op & MAX_RUN))
+            pos += 1
+        elif op == OP_DT:
+            if pos + 1 + DT.size > n:
+                break
+            records.append((op, DT.unpack_from(data, pos + 1)[0]))
+            pos += 1 + DT.size
+        elif op == OP_CHECK:
+            if pos + 1 + U32.size > n:
+                break
+            records.append((op, U32.unpack_from(data, pos + 1)[0]))
+            pos += 1 + U32.size
+        elif op == OP_KEYFRAME:
+            if pos + 9 > n:
+                break
+            frame, size = U32.unpack_from(data, pos + 1)[0], U32.unpack_from(data, pos + 5)[0]
+            if pos + 9 + size > n:
+                break
+            records.append((op, (frame, data[pos + 9:pos + 9 + size])))
+            pos += 9 + size
+        elif op == OP_END:
+            break
+        elif op < OP_DT:
+            records.append((op, None))
+            pos += 1
+        else:
+            raise ValueError(f"bad record {op:#x} at byte {pos}")
+    return records
+
+class Replay:
+    """
+    A recording loaded for headless replay. new_sim() builds the sim from
+    the header; run() replays from the start (or a keyframe) checking every
+    checksum; seek(frame) restores the nearest keyframe at or before frame
+    and replays only the rest.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a recording")
+        pos = len(MAGIC)
+        (size,) = HEADER_LEN.unpack_from(data, pos)
+        pos += HEADER_LEN.size
+        self.header = json.loads(data[pos:pos + size].decode("utf-8"))
+        self.records = _parse(data, pos + size)
+        # (frame, record index) of every keyframe
+        self.keyframes = []
+        frame = 0
+        for i, (op, arg) in enumerate(self.records):
+            if op == RUN:
+                frame += arg
+            elif op == OP_KEYFRAME:
+                self.keyframes.append((arg[0], i))
+        if not self.keyframes:
+            raise ValueError(f"{path} has no keyframe")
+        self.frames = frame
+
+    def new_sim(self):
+        h = self.header
+        module, _, name = h["engine"].rpartition(".")
+        cls = getattr(importlib.import_module(module), name)
+        # a private RNG; the first keyframe sets its state (and a stream's
+        # buffered pieces)
+        finished = h["randomizer"] == "stream"
+        rng = make_randomizer("bag" if finished else h["randomizer"], random.Random())
+        if h.get("stream") and not finished:
+            rng = PieceStream(rng)
+        if h["pieces"]:
+            rules = cls(h["width"], h["height"], rng, _load_pieces(h["pieces"], module))
+        else:
+            rules = cls(h["width"], h["height"], rng)
+        if finished:
+            # the engine deals while it is built; the keyframe fills this in
+            rules.rng = rules.randomizer = PieceStream(b"")
+        return TetrisSim(rules, h["level"], h["lock_delay"])
+
+    def _restore(self, sim, index):
+        sim.restore(ast.literal_eval(zlib.decompress(self.records[index][1][1]).decode()))
+
+    def play(self, sim, start=0, frame=0, stop=None, verify=True):
+        """
+        Execute records from index `start` (where the sim is at `frame`)
+        until `stop` frames or the end. Returns (frame, sim seconds, checks,
+        mismatches), mismatches being the frames whose checksum differed.
+        """
+        records = self.records
+        dt = None
+        soft = False
+        sim_s = 0.0
+        checks = 0
+        bad = []
+        step_frames = sim.step_frames
+        inp = sim.input
+        i = start
+        n = len(records)
+        # the dt/soft-hold in force at `start`
+        for op, arg in records[:start]:
+            if op == OP_DT:
+                dt = arg
+            elif op == OP_SOFT_ON:
+                soft = True
+            elif op == OP_SOFT_OFF:
+                soft = False
+        while i < n:
+            op, arg = records[i]
+            i += 1
+            if op == RUN:
+                if stop is not None and frame + arg > stop:
+                    arg = stop - frame
+                # quiet frames are skipped (TetrisSim.step_frames)
+                step_frames(arg, dt, soft)
+                frame += arg
+                sim_s += arg * dt
+                if frame == stop:
+                    break
+            elif op == OP_PRESS_LEFT:
+                inp.press_left()
+            elif op == OP_RELEASE_LEFT:
+                inp.release_left()
+            elif op == OP_PRESS_RIGHT:
+                inp.press_right()
+            elif op == OP_RELEASE_RIGHT:
+                inp.release_right()
+            elif op == OP_MOVE_LEFT:
+                sim.move(-1)
+            elif op == OP_MOVE_RIGHT:
+                sim.move(1)
+            elif op == OP_ROTATE:
+                sim.rotate()
+            elif op == OP_HARD_DROP:
+                sim.hard_drop()
+            elif op == OP_SOFT_DROP:
+                sim.soft_drop()
+            elif op == OP_SOFT_ON:
+                soft = True
+            elif op == OP_SOFT_OFF:
+                soft = False
+            elif op == OP_RESET:
+                sim.reset()
+                inp = sim.input
+            elif op == OP_DT:
+                dt = arg
+            elif verify and op == OP_CHECK:
+                checks += 1
+                if state_checksum(sim) != arg:
+                    bad.append(frame)
+            elif verify and op == OP_KEYFRAME:
+                checks += 1
+                # the blob is repr(snapshot); no need to parse it
+                if zlib.decompress(arg[1]).decode() != repr(sim.snapshot()):
+                    bad.append(frame)
+        return frame, sim_s, checks, bad
+
+    def seek(self, frame, sim=None):
+        # sim at `frame` (after that many updates), from the nearest keyframe
+        frame = max(0, min(frame, self.frames))
+        start_frame, index = [k for k in self.keyframes if k[0] <= frame][-1]
+        sim = sim or self.new_sim()
+        self._restore(sim, index)
+        self.play(sim, index + 1, start_frame, frame, verify=False)
+        return sim
+
+    def run(self, verify=True, sim=None):
+        sim = sim or self.new_sim()
+        self._restore(sim, self.keyframes[0][1])
+        t0 = time.perf_counter()
+        frames, sim_s, checks, bad = self.play(sim, self.keyframes[0][1] + 1, 0, verify=verify)
+        elapsed = time.perf_counter() - t0
+        return {
+            "frames": frames,
+            "checks": checks,
+            "mismatches": bad,
+            "elapsed_s": elapsed,
+            "frames_per_s": frames / elapsed if elapsed else 0.0,
+            "realtime_x": sim_s / elapsed if elapsed else 0.0,
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="replay a recorded TetrisSim session headless")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, default=None, help="print the board at this frame")
+    parser.add_argument("--no-verify", action="store_true", help="skip the state checksums")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.path)
+    if args.seek is not None:
+        t0 = time.perf_counter()
+        sim = replay.seek(args.seek)
+        print(f"frame {min(args.seek, replay.frames)} ({(time.perf_counter() - t0) * 1e3:.1f} ms to seek)")
+        for y, row in enumerate(sim.rules.get_board()):
+            print("".join(c or "." for c in row))
+        return 0
+    result = replay.run(verify=not args.no_verify)
+    result.update(header=replay.header, keyframes=len(replay.keyframes))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['frames']} frames in {result['elapsed_s']:.3f}s "
+              f"({result['frames_per_s']:.0f} frames/s, {result['realtime_x']:.0f}x real time), "
+              f"{result['checks']} checks, {len(result['mismatches'])} mismatches")
+    if result["mismatches"]:
+        print(f"state differs from the recording first at frame {result['mismatches'][0]}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
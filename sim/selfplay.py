@@ -0,0 +1,169 @@
+# sim/selfplay.py
+# Headless self-play: TetrisSim driven by the placement AI across a
+# multiprocessing pool, reporting throughput and game statistics as JSON.
+# Run: python -m sim.selfplay --games 64 --pieces 500 [--workers N]
+# Nothing here (or in what it imports) touches pygame.
+import argparse, json, multiprocessing, os, random, sys, time
+
+from rules.tetris_rules import RulesEngine
+from rules.tritris_rules import TritrisRules
+from rules.randomizer import RANDOMIZERS, make_randomizer
+from sim.tetris_sim import TetrisSim
+from ai.planner import AIPlayer, PlacementPlanner, play_piece, load_weights
+
+RULES = {"tetris": RulesEngine, "tritris": TritrisRules}
+DEFAULT_SIZE = {"tetris": (10, 20), "tritris": (4, 5)}
+
+def play_game(seed, mode="tetris", width=None, height=None, max_pieces=500,
+              weights=None, lookahead=True, table=None, randomizer="bag",
+              gravity=False, action_delay=3, fast_forward=True):
+    """
+    Play one game with the placement AI until game over or max_pieces.
+    Piece order depends only on seed and randomizer (a rules/randomizer.py
+    mode). Returns a dict of per-game stats.
+    table: path of an ai/tritris_table.py table to play tritris from, with
+    the placement AI for anything it does not cover.
+    gravity: play in real time at 60 Hz like the screensaver (AIPlayer, one
+    input every action_delay + 1 frames, gravity and lock delay), with the
+    frames in which neither the AI nor the sim does anything skipped unless
+    fast_forward is off. Same game either way.
+    """
+    dw, dh = DEFAULT_SIZE[mode]
+    rules = RULES[mode](width or dw, height or dh, rng=make_randomizer(randomizer, seed))
+    sim = TetrisSim(rules)
+    planner = PlacementPlanner(weights, lookahead=lookahead)
+    if table:
+        from ai.tritris_table import TritrisTable, TablePlanner
+        planner = TablePlanner(TritrisTable(table), planner)
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    pieces = 0
+    lines = 0
+    frames = 0
+    if gravity:
+        ai = AIPlayer(planner, action_delay)
+        dt = 1 / 60
+        version = rules.board_version
+        while not sim.game_over and pieces < max_pieces:
+            idle = ai.idle_frames(rules) if fast_forward else 0
+            if idle:
+                n = sim.advance_until_event(dt, max_frames=idle)
+                ai.skip(n)
+                frames += n
+            else:
+                # no time budget: plans finish in one step, so the game does
+                # not depend on machine speed
+                ai.step(sim, float("inf"))
+                if rules.board_version != version:
+                    # hard drop
+                    version = rules.board_version
+                    pieces += 1
+                    lines += sim.last_lines
+                sim.update(dt)
+                frames += 1
+            if rules.board_version != version:
+                version = rules.board_version
+                pieces += 1
+                lines += sim.last_lines
+    else:
+        while not sim.game_over and pieces < max_pieces:
+            lines += play_piece(sim, planner)
+            pieces += 1
+    return {
+        "seed": seed,
+        "pieces": pieces,
+        "lines": lines,
+        "frames": frames,
+        "topped_out": sim.game_over,
+        "wall_s": time.perf_counter() - t0,
+        "cpu_s": time.process_time() - cpu0,
+        "worker": os.getpid(),
+    }
+
+def _worker_init(base_seed, counter):
+    # distinct global RNG per worker for anything outside the seeded games
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    random.seed(base_seed * 1000003 + index)
+
+def _play(job):
+    seed, kwargs = job
+    return play_game(seed, **kwargs)
+
+def _percentiles(values, ps=(0, 10, 25, 50, 75, 90, 100)):
+    if not values:
+        return {}
+    v = sorted(values)
+    return {f"p{p}": v[min(len(v) - 1, (len(v) - 1) * p // 100)] for p in ps}
+
+def run(games=64, workers=None, seed=0, **kwargs):
+    """Play `games` games across a process pool; returns the JSON report dict."""
+    workers = workers or os.cpu_count() or 1
+    jobs = [(seed + i, kwargs) for i in range(games)]
+    t0 = time.perf_counter()
+    if workers == 1:
+        results = [_play(job) for job in jobs]
+    else:
+        counter = multiprocessing.Value("i", 0)
+        with multiprocessing.Pool(workers, initializer=_worker_init, initargs=(seed, counter)) as pool:
+            results = pool.map(_play, jobs, chunksize=1)
+    wall = time.perf_counter() - t0
+    pieces = sum(r["pieces"] for r in results)
+    per_worker = {}
+    for r in results:
+        w = per_worker.setdefault(str(r["worker"]), {"games": 0, "pieces": 0, "cpu_s": 0.0})
+        w["games"] += 1
+        w["pieces"] += r["pieces"]
+        w["cpu_s"] += r["cpu_s"]
+    return {
+        "config": dict(kwargs, games=games, workers=workers, seed=seed),
+        "wall_s": wall,
+        "pieces": pieces,
+        "pieces_per_s": pieces / wall if wall else 0.0,
+        "lines": sum(r["lines"] for r in results),
+        "frames": sum(r["frames"] for r in results),
+        "topped_out": sum(1 for r in results if r["topped_out"]),
+        "game_length": _percentiles([r["pieces"] for r in results]),
+        "lines_per_game": _percentiles([r["lines"] for r in results]),
+        "cpu_s": sum(r["cpu_s"] for r in results),
+        "workers": per_worker,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="headless AI self-play benchmark")
+    parser.add_argument("--games", type=int, default=64)
+    parser.add_argument("--pieces", type=int, default=500, help="max pieces per game")
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["tetris","tritris"], default="tetris")
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--height", type=int, default=None)
+    parser.add_argument("--randomizer", choices=list(RANDOMIZERS), default="bag")
+    parser.add_argument("--gravity", action="store_true",
+                        help="play in real time with gravity and an input delay, like the screensaver")
+    parser.add_argument("--action-delay", type=int, default=3, help="--gravity: frames between AI inputs")
+    parser.add_argument("--frame-by-frame", action="store_true",
+                        help="--gravity: step every frame instead of skipping idle ones")
+    parser.add_argument("--no-lookahead", action="store_true")
+    parser.add_argument("--weights", default=None, help="JSON weights file for the AI")
+    parser.add_argument("--table", default=None, help="tritris table from ai/tritris_table.py")
+    parser.add_argument("--out", default=None, help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    weights = load_weights(args.weights) if args.weights else None
+    report = run(games=args.games, workers=args.workers, seed=args.seed, mode=args.mode,
+                 width=args.width, height=args.height, max_pieces=args.pieces,
+                 weights=weights, lookahead=not args.no_lookahead,
+                 table=args.table,
+                 randomizer=args.randomizer, gravity=args.gravity, action_delay=args.action_delay,
+                 fast_forward=not args.frame_by_frame)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -10,6 +10,13 @@ class InputState:
         self.das = das_frames
         self.arr = arr_frames
 
+    def snapshot(self):
+        return (self.left_held, self.right_held, self.left_counter, self.right_counter, self.das, self.arr)
+
+    def restore(self, snap):
+        (self.left_held, self.right_held, self.left_counter, self.right_counter,
+         self.das, self.arr) = snap
+
     def press_left(self):
         self.left_held = True
         self.left_counter = 0
@@ -40,7 +47,7 @@ class TetrisSim:
 
     def reset(self):
         # Reset the rules engine and all state
-        self.rules.__init__(self.rules.width, self.rules.height)
+        self.rules.__init__(self.rules.width, self.rules.height, self.rules.rng)
         self.level = 0
         self.fall_speed = self.level_to_delay(self.level)
         self.lock_timer = 0.0
@@ -49,6 +56,20 @@ class TetrisSim:
         self._fall_acc = 0.0
         self.game_over = False
 
+    def snapshot(self):
+        """
+        Compact immutable state: rules snapshot, timers, level and input.
+        restore() rewrites the existing objects in place.
+        """
+        return (self.rules.snapshot(), self.input.snapshot(), self.level, self.fall_speed,
+                self.lock_timer, self._fall_acc, self.last_lines, self.game_over)
+
+    def restore(self, snap):
+        self.rules.restore(snap[0])
+        self.input.restore(snap[1])
+        (_, _, self.level, self.fall_speed, self.lock_timer,
+         self._fall_acc, self.last_lines, self.game_over) = snap
+
     @property
     def is_game_over(self):
         return self.game_over
@@ -150,3 +171,132 @@ class TetrisSim:
                     # Check for game over after locking
                     if not self.rules.fits(self.rules.x, self.rules.y, self.rules.rotation):
                         self.game_over = True
+
+    # fast-forward: the same result as calling update() frame by frame, but
+    # frames where nothing can happen are skipped. A frame is quiet when no
+    # gravity tick falls on it and autorepeat has no move to make (no key
+    # held, between repeats, or pushing against something). Over a run of
+    # quiet frames the piece, board and timers stay put, so only the repeat
+    # counters and the gravity accumulator change; the accumulator is still
+    # summed one dt at a time, so it stays bit-identical to update().
+
+    def _repeat_wait(self, counter, dx):
+        # frames until a held key's autorepeat next moves the piece (None: it
+        # is pushing against something)
+        if not self.rules.fits(self.rules.x + dx, self.rules.y, self.rules.rotation):
+            return None
+        if counter == 0:
+            return 0
+        das, arr = self.input.das, self.input.arr
+        if counter <= das:
+            return das + arr - counter
+        return -(counter - das) % arr
+
+    def _skip_quiet(self, limit, dt, soft_hold):
+        # advance through up to `limit` quiet frames; returns how many
+        inp = self.input
+        if inp.left_held:
+            wait = self._repeat_wait(inp.left_counter, -1)
+            if wait is not None and wait < limit:
+                limit = wait
+        if inp.right_held:
+            wait = self._repeat_wait(inp.right_counter, 1)
+            if wait is not None and wait < limit:
+                limit = wait
+        delay = self.fall_speed * (0.1 if soft_hold else 1.0)
+        acc = self._fall_acc
+        n = 0
+        while n < limit:
+            nxt = acc + dt
+            if nxt >= delay:
+                break
+            acc = nxt
+            n += 1
+        if n:
+            self._fall_acc = acc
+            inp.left_counter = inp.left_counter + n if inp.left_held else 0
+            inp.right_counter = inp.right_counter + n if inp.right_held else 0
+        return n
+
+    def step_frames(self, n, dt, soft_hold=False):
+        # same as n calls of update(dt, soft_hold)
+        while n > 0 and not self.game_over:
+            n -= self._skip_quiet(n, dt, soft_hold)
+            if n:
+                self.update(dt, soft_hold)
+                n -= 1
+
+    def advance_until_event(self, dt, soft_hold=False, max_frames=None):
+        """
+        Skip the quiet frames, then run the first frame in which something
+        happens (a move, a gravity step or a lock timer change). Returns the
+        number of frames advanced, at most max_frames; 0 once the game is over.
+        """
+        if self.game_over:
+            return 0
+        if max_frames is None:
+            # gravity always ticks within ceil(delay / dt) frames
+            max_frames = int(self.fall_speed / dt) + 2
+        k = self._skip_quiet(max_frames, dt, soft_hold)
+        if k < max_frames:
+            self.update(dt, soft_hold)
+            k += 1
+        return k
+
+def check_fast_forward(steps=3000, width=10, height=20, seed=0, level=0):
+    """
+    Drive two sims with the same random inputs, one frame by frame and one
+    through step_frames()/advance_until_event(), and compare their state at
+    every input. Raises AssertionError on mismatch.
+    """
+    import random
+    from rules.bitboard_rules import BitboardRulesEngine
+    rng = random.Random(seed)
+    ref = TetrisSim(BitboardRulesEngine(width, height, rng=random.Random(seed)), level)
+    fast = TetrisSim(BitboardRulesEngine(width, height, rng=random.Random(seed)), level)
+    dt = 1 / 60
+    for step in range(steps):
+        r = rng.random()
+        for sim in (ref, fast):
+            if r < 0.15:
+                sim.input.press_left()
+            elif r < 0.3:
+                sim.input.press_right()
+            elif r < 0.45:
+                sim.input.release_left()
+            elif r < 0.6:
+                sim.input.release_right()
+            elif r < 0.7:
+                sim.rotate()
+            elif r < 0.72:
+                sim.hard_drop()
+            elif r < 0.75:
+                sim.soft_drop()
+        soft = rng.random() < 0.2
+        if rng.random() < 0.5:
+            n = rng.randrange(1, 200)
+            fast.step_frames(n, dt, soft)
+        else:
+            n = fast.advance_until_event(dt, soft, rng.choice((None, 1, 5, 50)))
+        for _ in range(n):
+            ref.update(dt, soft)
+        assert ref.snapshot() == fast.snapshot(), f"step {step}: fast-forward differs"
+        if ref.game_over:
+            ref.reset()
+            fast.reset()
+
+if __name__ == "__main__":
+    import time
+    for level in (0, 5, 15):
+        for w, h in ((10, 20), (6, 12)):
+            check_fast_forward(2000, w, h, seed=level, level=level)
+            print(f"{w}x{h} level {level}: step_frames/advance_until_event match update()")
+    from rules.bitboard_rules import BitboardRulesEngine
+    import random
+    for name, run in (("update x1", lambda sim: [sim.update(1 / 60) for _ in range(6000)]),
+                      ("step_frames", lambda sim: sim.step_frames(6000, 1 / 60))):
+        sim = TetrisSim(BitboardRulesEngine(10, 20, rng=random.Random(0)))
+        sim.input.press_left()
+        t0 = time.perf_counter()
+        run(sim)
+        print(f"{name:12s} {6000 / (time.perf_counter() - t0):10.0f} frames/s")